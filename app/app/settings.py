@@ -40,12 +40,16 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',  # added here because it seperate app
     'drf_spectacular',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestProfilingMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,16 +91,112 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # }
 
 
+# core.db, connections are kept DB_CONN_MAX_AGE seconds (0 closes them
+# after every request) and pinged when a request starts after sitting idle
+# DB_HEALTH_CHECK_INTERVAL seconds (0 never pings). DB_PGBOUNCER=1 when
+# DB_HOST is pgbouncer in transaction pooling mode
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_HEALTH_CHECK_INTERVAL = int(os.environ.get('DB_HEALTH_CHECK_INTERVAL', 30))
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '0') == '1'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
         'HOST': os.environ.get("DB_HOST"),
+        'PORT': os.environ.get("DB_PORT", ''),
         'NAME': os.environ.get("DB_NAME"),
         'USER': os.environ.get("DB_USER"),
         'PASSWORD': os.environ.get("DB_PASS"),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
     }
 }
 
+# core.routers, safe requests read from one of DATABASE_REPLICAS, clients
+# that wrote read from the primary for READ_YOUR_WRITES_SECONDS. The
+# replica alias mirrors default in tests
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'HOST': DB_REPLICA_HOST or DATABASES['default']['HOST'],
+    'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_REPLICAS = ['replica'] if DB_REPLICA_HOST else []
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+REPLICA_PIN_CACHE_ALIAS = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# locmem is per process, deployments with several workers need a shared
+# backend, e.g. CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# or a Redis backend such as django_redis.cache.RedisCache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300))
+# autocomplete responses vary per keystroke, keep them briefly
+AUTOCOMPLETE_CACHE_TIMEOUT = int(
+    os.environ.get('AUTOCOMPLETE_CACHE_TIMEOUT', 30)
+)
+AUTOCOMPLETE_LIMIT = 10
+
+# recipe.views RecipeStatsView, most used tags and ingredients returned
+STATS_LIMIT = 10
+
+# user.authentication.CachedTokenAuthentication
+# tokens live TOKEN_CACHE_LOCAL_TTL seconds in each worker's LRU, and
+# TOKEN_CACHE_TTL seconds in the shared cache when TOKEN_CACHE_ALIAS is set.
+# user.checks requires a shared TOKEN_CACHE_ALIAS when the server runs
+# more than APP_WORKERS=1 processes, see scripts/run.sh
+APP_WORKERS = int(os.environ.get('APP_WORKERS', 1))
+TOKEN_CACHE_ALIAS = os.environ.get('TOKEN_CACHE_ALIAS') or None
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 300))
+TOKEN_CACHE_LOCAL_TTL = int(os.environ.get('TOKEN_CACHE_LOCAL_TTL', 5))
+
+# core.views.metrics, /metrics answers clients of these networks only
+METRICS_ALLOWED_NETWORKS = os.environ.get(
+    'METRICS_ALLOWED_NETWORKS',
+    '127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16',
+).split(',')
+
+# core.middleware.RequestProfilingMiddleware
+# share of requests profiled, 1.0 profiles every request
+REQUEST_PROFILING_SAMPLE_RATE = float(
+    os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 0.01)
+)
+# same query fingerprint repeated this often in one request is an N+1
+REQUEST_PROFILING_DUPLICATE_THRESHOLD = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -140,6 +240,41 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media/'
 STATIC_ROOT = '/vol/web/static/'
 
+# recipe.images, resized renditions are generated by a thread pool in
+# every worker, or inline when IMAGE_PROCESSING_EAGER is set
+
+IMAGE_PROCESSING_WORKERS = int(os.environ.get('IMAGE_PROCESSING_WORKERS', 2))
+IMAGE_PROCESSING_EAGER = False
+
+# recipe.derivatives, /api/recipe/images/ resizes uploads to one of these
+# (width, height) boxes and keeps the results in MEDIA_ROOT/derivatives
+IMAGE_DERIVATIVE_SIZES = [
+    (100, 100), (200, 200), (400, 400), (800, 800), (1600, 1600),
+]
+IMAGE_DERIVATIVE_CACHE_BYTES = int(
+    os.environ.get('IMAGE_DERIVATIVE_CACHE_BYTES', 512 * 1024 * 1024)
+)
+IMAGE_DERIVATIVE_MAX_AGE = 365 * 24 * 60 * 60
+
+# recipe.uploads, image uploads stream to a temporary file and are refused
+# from their header when of another format or larger than these. The byte
+# limit matches client_max_body_size of the proxy
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 50_000_000)
+)
+IMAGE_UPLOAD_FORMATS = ['JPEG', 'PNG', 'WEBP']
+
+# recipe.blobs, gc_image_blobs deletes stored images unreferenced and
+# unused for this many seconds, longer than any upload request
+IMAGE_BLOB_GC_GRACE = int(os.environ.get('IMAGE_BLOB_GC_GRACE', 24 * 60 * 60))
+
+# core.asgi, requests served by app.asgi run in a pool of this many
+# threads per worker process, each may hold a database connection
+ASYNC_BLOCKING_WORKERS = int(os.environ.get('ASYNC_BLOCKING_WORKERS', 8))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -22,6 +22,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
+from core import views as core_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -29,6 +30,7 @@ urlpatterns = [
     path('api/docs', SpectacularSwaggerView.as_view(url_name='api-schema'), name='api-docs'), # noqa
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
+    path('metrics', core_views.metrics, name='metrics'),
 ]
 
 if settings.DEBUG:
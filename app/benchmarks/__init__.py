@@ -0,0 +1,12 @@
+"""
+Benchmarks for the recipe API
+
+Run from the app directory, e.g. python -m benchmarks.bench_filters
+Each benchmark seeds a throwaway test database and drops it afterwards.
+"""
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+django.setup()
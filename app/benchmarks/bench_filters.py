@@ -0,0 +1,78 @@
+"""
+Compare JOIN + DISTINCT recipe filtering with EXISTS semi-joins
+
+    python -m benchmarks.bench_filters --recipes 20000
+"""
+import argparse
+from benchmarks import utils
+from benchmarks.seed import seed
+from core.models import Recipe, Tag, Ingredient
+from recipe.filters import linked_to
+
+PAGE_SIZE = 100
+
+
+def join_distinct(user, tag_ids, ingredient_ids):
+    """the filtering RecipeViewSet used before EXISTS"""
+    queryset = Recipe.objects.all()
+    if tag_ids:
+        queryset = queryset.filter(tags__id__in=tag_ids)
+    if ingredient_ids:
+        queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+    return queryset.filter(user=user).order_by('-id').distinct()
+
+
+def semi_join(user, tag_ids, ingredient_ids):
+    queryset = Recipe.objects.all()
+    if tag_ids:
+        queryset = queryset.filter(linked_to('tags', tag_ids))
+    if ingredient_ids:
+        queryset = queryset.filter(linked_to('ingredients', ingredient_ids))
+    return queryset.filter(user=user).order_by('-id')
+
+
+def run(recipes, repeat):
+    user, = seed(recipes=recipes)
+    tag_ids = list(
+        Tag.objects.filter(user=user).values_list('id', flat=True)[:5])
+    ingredient_ids = list(
+        Ingredient.objects.filter(user=user).values_list('id', flat=True)[:20]) # noqa
+    cases = [
+        ('tags', tag_ids, []),
+        ('ingredients', [], ingredient_ids),
+        ('tags + ingredients', tag_ids, ingredient_ids),
+    ]
+
+    evaluations = [
+        (f'page of {PAGE_SIZE}', lambda qs: list(qs[:PAGE_SIZE])),
+        ('count', lambda qs: qs.count()),
+    ]
+
+    print(f'{recipes} recipes')
+    print(f'{"filter":<20}{"query":<14}{"join+distinct ms":>18}'
+          f'{"exists ms":>12}{"speedup":>10}')
+    for name, tags, ingredients in cases:
+        for label, evaluate in evaluations:
+            before, after = (
+                utils.time_call(
+                    lambda build=build: evaluate(
+                        build(user, tags, ingredients)),
+                    repeat=repeat,
+                )
+                for build in (join_distinct, semi_join)
+            )
+            print(f'{name:<20}{label:<14}{before:>18.2f}{after:>12.2f}'
+                  f'{before / after:>9.1f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    with utils.benchmark_database():
+        run(args.recipes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Time the querysets behind the list endpoints and summarize their plans
+
+Each case builds its queryset through the viewset, as a request would,
+and evaluates one page including prefetches.
+
+    python -m benchmarks.bench_querysets --recipes 20000 --output qs.json
+"""
+import argparse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from benchmarks import utils
+from benchmarks.seed import seed
+from core.models import Tag, Ingredient
+from recipe import views
+
+
+def _ids(model, user, count):
+    return ','.join(
+        str(pk) for pk in
+        model.objects.filter(user=user).values_list('id', flat=True)[:count]
+    )
+
+
+def cases(user):
+    tags = _ids(Tag, user, 3)
+    ingredients = _ids(Ingredient, user, 3)
+    yield 'recipe list', views.RecipeViewSet, {}
+    yield 'recipe list ?tags', views.RecipeViewSet, {'tags': tags}
+    yield 'recipe list ?tags&tags_match=all', views.RecipeViewSet, {
+        'tags': tags, 'tags_match': 'all'}
+    yield 'recipe list ?tags&ingredients', views.RecipeViewSet, {
+        'tags': tags, 'ingredients': ingredients}
+    yield 'recipe list ?search', views.RecipeViewSet, {'search': 'curry'}
+    yield 'tag list', views.TagViewSet, {}
+    yield 'ingredient list ?assigned_only', views.IngredientViewSet, {
+        'assigned_only': 1}
+    yield 'ingredient list ?q', views.IngredientViewSet, {'q': 'tomat'}
+
+
+def _walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _walk(child)
+
+
+def plan_summary(queryset):
+    """root cost and the scan nodes of the EXPLAIN ANALYZE plan"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0][0]
+    root = plan['Plan']
+    return {
+        'total_cost': root['Total Cost'],
+        'execution_ms': plan['Execution Time'],
+        'scans': sorted({
+            f'{node["Node Type"]} {node.get("Index Name", node.get("Relation Name", ""))}'.strip() # noqa
+            for node in _walk(root) if 'Scan' in node['Node Type']
+        }),
+    }
+
+
+def run(recipes, repeat):
+    user, = seed(recipes=recipes)
+    results = {}
+    print(f'{recipes} recipes')
+    print(f'{"case":<38}{"p50 ms":>10}{"p95 ms":>10}{"queries":>9}')
+    for name, viewset, params in cases(user):
+        view, queryset = utils.view_queryset(viewset, user, params)
+        page = queryset[:view.pagination_class.page_size]
+        with CaptureQueriesContext(connection) as queries:
+            list(page.all())
+        summary = utils.summarize(
+            utils.time_calls(lambda: list(page.all()), repeat))
+        summary['queries'] = len(queries)
+        summary['plan'] = plan_summary(page)
+        results[name] = summary
+        print(f'{name:<38}{summary["p50"]:>10.2f}{summary["p95"]:>10.2f}'
+              f'{summary["queries"]:>9}')
+        for scan in summary['plan']['scans']:
+            print(f'    {scan}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+    with utils.benchmark_database():
+        results = run(args.recipes, args.repeat)
+    if args.output:
+        utils.write_report(args.output, 'querysets', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Time serialization and JSON rendering of a page of recipes
+
+The serializer cases load the page and its tags/ingredients once, so
+only serializer and renderer CPU time is measured. The page cases
+include the queries and compare RecipeSerializer with the fast path of
+recipe.fastpath.
+
+    python -m benchmarks.bench_serializers --output serializers.json
+"""
+import argparse
+from rest_framework.renderers import JSONRenderer
+from benchmarks import utils
+from benchmarks.seed import seed
+from recipe import fastpath, serializers, views
+from recipe.renderers import FastJSONRenderer
+
+
+def run(recipes, page_size, repeat):
+    user, = seed(recipes=recipes)
+    view, queryset = utils.view_queryset(views.RecipeViewSet, user)
+    queryset = queryset[:page_size]
+    prefetched = view._prefetch_nested(queryset)
+    page = list(prefetched)
+    context = view.get_serializer_context()
+    renderer = JSONRenderer()
+    fast_renderer = FastJSONRenderer()
+
+    def serialize(cls, instances):
+        return cls(instances, many=True, context=context).data
+
+    cases = [
+        ('RecipeSerializer', lambda: serialize(
+            serializers.RecipeSerializer, page)),
+        ('RecipeSerializer + JSON', lambda: renderer.render(serialize(
+            serializers.RecipeSerializer, page))),
+        ('RecipeDetailSerializer', lambda: serialize(
+            serializers.RecipeDetailSerializer, page)),
+        ('page: RecipeSerializer', lambda: renderer.render(serialize(
+            serializers.RecipeSerializer, prefetched.all()))),
+        ('page: fast path', lambda: fast_renderer.render(
+            fastpath.recipe_rows(fastpath.values(queryset.all())))),
+        ('page: fast path, detail', lambda: fast_renderer.render(
+            fastpath.recipe_rows(
+                fastpath.values(queryset.all(), detail=True), detail=True))),
+    ]
+    results = {}
+    print(f'{len(page)} recipes per page')
+    print(f'{"case":<34}{"p50 ms":>10}{"p95 ms":>10}{"us/recipe":>12}')
+    for name, func in cases:
+        summary = utils.summarize(utils.time_calls(func, repeat))
+        summary['us_per_recipe'] = round(
+            summary['p50'] * 1000 / len(page), 1)
+        results[name] = summary
+        print(f'{name:<34}{summary["p50"]:>10.2f}{summary["p95"]:>10.2f}'
+              f'{summary["us_per_recipe"]:>12.1f}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=1000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+    with utils.benchmark_database():
+        results = run(args.recipes, args.page_size, args.repeat)
+    if args.output:
+        utils.write_report(
+            args.output, 'serializers', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Compare two JSON benchmark reports, e.g. from two commits
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+METRICS = ['p50', 'p95', 'p99', 'rps', 'queries', 'us_per_recipe']
+
+
+def _load(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def compare(before, after):
+    """yield (case, metric, before, after, change %) for shared metrics"""
+    for case, new in after['results'].items():
+        old = before['results'].get(case, {})
+        for metric in METRICS:
+            if metric in old and metric in new:
+                change = (
+                    (new[metric] - old[metric]) / old[metric] * 100
+                    if old[metric] else 0.0
+                )
+                yield case, metric, old[metric], new[metric], change
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+    before, after = _load(args.before), _load(args.after)
+    if before['benchmark'] != after['benchmark']:
+        raise SystemExit('reports are from different benchmarks')
+
+    print(f'{before["commit"]} -> {after["commit"]}')
+    print(f'{"case":<38}{"metric":<15}{"before":>10}{"after":>10}'
+          f'{"change":>9}')
+    for case, metric, old, new, change in compare(before, after):
+        print(f'{case:<38}{metric:<15}{old:>10}{new:>10}{change:>+8.1f}%')
+
+
+if __name__ == '__main__':
+    main()
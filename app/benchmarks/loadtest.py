@@ -0,0 +1,291 @@
+"""
+HTTP load driver for a running API server
+
+Measure the deployment of docker-compose-deploy.yml: scripts/run.sh
+serving uWSGI on a socket behind the nginx proxy container. Seed its
+database and drive the proxy with a weighted mix of read requests from
+several threads:
+
+    docker compose -f docker-compose-deploy.yml up -d
+    docker compose -f docker-compose-deploy.yml exec app \\
+        python -m benchmarks.seed --users 20 --recipes 2000
+    python -m benchmarks.loadtest --url http://localhost \\
+        --concurrency 16 --duration 60 --output load.json
+
+To compare with the ASGI mode, restart the stack with
+
+    APP_SERVER=asgi APP_PROTOCOL=http docker compose \\
+        -f docker-compose-deploy.yml up -d
+
+Without Docker, start the uWSGI command of scripts/run.sh and put the
+uWSGI HTTP router in front of its socket in place of the proxy:
+
+    uwsgi --http :8000 --http-to 127.0.0.1:9000 --master
+    python -m benchmarks.loadtest --url http://localhost:8000
+
+--slow-clients N keeps N connections trickling an upload body during the
+run, the way slow mobile clients do. nginx reads the whole body before
+passing the request on, so behind the proxy they hold nginx connections
+instead of app workers. The HTTP router does not buffer bodies, there
+every slow client holds a uWSGI worker, so measure them through the
+proxy only.
+
+Latencies are reported per scenario and overall. --count-queries replays
+each scenario once in-process against the configured database, which must
+be the one the server uses. Repeated list requests may be served from the
+per-user response cache, as they would be in production.
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from benchmarks import utils
+from benchmarks.seed import PASSWORD, email
+
+RECIPES = '/api/recipe/recipes/'
+TAGS = '/api/recipe/tags/'
+INGREDIENTS = '/api/recipe/ingredients/'
+STATS = '/api/recipe/stats/'
+
+
+def _ids(rng, ids, count):
+    return ','.join(str(pk) for pk in rng.sample(ids, min(count, len(ids))))
+
+
+# (name, weight, path builder)
+SCENARIOS = [
+    ('recipe list', 30, lambda s, rng: RECIPES),
+    ('recipe list ?tags', 10, lambda s, rng: RECIPES + '?' + urlencode(
+        {'tags': _ids(rng, s['tags'], 2)})),
+    ('recipe list ?ingredients', 10, lambda s, rng: RECIPES + '?' + urlencode(
+        {'ingredients': _ids(rng, s['ingredients'], 2)})),
+    ('recipe list ?search', 5, lambda s, rng: RECIPES + '?' + urlencode(
+        {'search': rng.choice(['curry', 'spicy soup', 'pasta'])})),
+    ('recipe detail', 25, lambda s, rng: f'{RECIPES}{rng.choice(s["recipes"])}/'), # noqa
+    ('tag list', 10, lambda s, rng: TAGS),
+    ('ingredient list', 5, lambda s, rng: INGREDIENTS),
+    ('ingredient autocomplete', 5, lambda s, rng: INGREDIENTS + '?' + urlencode( # noqa
+        {'q': rng.choice(['to', 'tomat', 'chick', 'garl'])})),
+    ('recipe stats', 5, lambda s, rng: STATS),
+]
+
+
+class Connection:
+    """keep-alive HTTP connection that reconnects after errors"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.conn = None
+
+    def request(self, method, path, token=None, body=None):
+        """return (status, body) of one request"""
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        # a reused connection may have been closed by the server meanwhile
+        retry = self.conn is not None
+        while True:
+            if self.conn is None:
+                self.conn = self.connection_class(self.netloc, timeout=30)
+            try:
+                self.conn.request(method, self.prefix + path, body, headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (OSError, http.client.HTTPException):
+                self.conn.close()
+                self.conn = None
+                if not retry:
+                    raise
+                retry = False
+
+
+def _get_json(conn, path, token):
+    status, body = conn.request('GET', path, token)
+    if status != 200:
+        raise SystemExit(f'GET {path} returned {status}')
+    return json.loads(body)
+
+
+def login(url, users):
+    """token and ids to request for each seeded user"""
+    conn = Connection(url)
+    sessions = []
+    for index in range(users):
+        status, body = conn.request(
+            'POST', '/api/user/token/',
+            body={'email': email(index), 'password': PASSWORD},
+        )
+        if status != 200:
+            raise SystemExit(
+                f'cannot log in as {email(index)}, seed the database with '
+                f'python -m benchmarks.seed --users {users}'
+            )
+        token = json.loads(body)['token']
+        session = {'token': token}
+        for key, path in [('recipes', RECIPES), ('tags', TAGS),
+                          ('ingredients', INGREDIENTS)]:
+            results = _get_json(conn, path, token)['results']
+            session[key] = [item['id'] for item in results]
+        sessions.append(session)
+    return sessions
+
+
+def slow_client(url, token, deadline, interval=0.5):
+    """POST a recipe body one byte per interval until the deadline"""
+    client = Connection(url)
+    conn = client.connection_class(client.netloc, timeout=30)
+    try:
+        conn.putrequest('POST', client.prefix + RECIPES)
+        conn.putheader('Authorization', f'Token {token}')
+        conn.putheader('Content-Type', 'application/json')
+        conn.putheader('Content-Length', str(1024 * 1024))
+        conn.endheaders()
+        while time.perf_counter() < deadline:
+            conn.send(b' ')
+            time.sleep(interval)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+def worker(url, sessions, seed, warmup_until, deadline, samples):
+    rng = random.Random(seed)
+    conn = Connection(url)
+    names = [name for name, _, _ in SCENARIOS]
+    weights = [weight for _, weight, _ in SCENARIOS]
+    builders = dict((name, build) for name, _, build in SCENARIOS)
+    while True:
+        name, = rng.choices(names, weights)
+        session = rng.choice(sessions)
+        path = builders[name](session, rng)
+        start = time.perf_counter()
+        if start >= deadline:
+            return
+        try:
+            status, _ = conn.request('GET', path, session['token'])
+        except (OSError, http.client.HTTPException):
+            status = None
+        elapsed = (time.perf_counter() - start) * 1000
+        if start >= warmup_until:
+            samples.append((name, status, elapsed))
+
+
+def count_queries(sessions):
+    """queries one request of each scenario runs, replayed in-process"""
+    setup_test_environment()
+    rng = random.Random(0)
+    session = sessions[0]
+    client = Client(HTTP_AUTHORIZATION=f'Token {session["token"]}')
+    counts = {}
+    for name, _, build in SCENARIOS:
+        with CaptureQueriesContext(connection) as queries:
+            client.get(build(session, rng))
+        counts[name] = len(queries)
+    return counts
+
+
+def report(samples, duration, queries):
+    by_name = {}
+    for name, status, elapsed in samples:
+        by_name.setdefault(name, []).append((status, elapsed))
+
+    def stats(rows):
+        summary = utils.summarize([elapsed for _, elapsed in rows])
+        summary['errors'] = sum(
+            1 for status, _ in rows if status is None or status >= 400)
+        summary['rps'] = round(len(rows) / duration, 1)
+        return summary
+
+    results = {}
+    for name, _, _ in SCENARIOS:
+        if name in by_name:
+            results[name] = stats(by_name[name])
+            if queries:
+                results[name]['queries'] = queries[name]
+    results['all'] = stats([row for rows in by_name.values() for row in rows])
+    if queries and samples:
+        results['all']['queries'] = round(sum(
+            queries[name] for name, _, _ in samples) / len(samples), 2)
+    return results
+
+
+def run(args):
+    sessions = login(args.url, args.users)
+    queries = count_queries(sessions) if args.count_queries else None
+
+    samples = []
+    start = time.perf_counter()
+    warmup_until = start + args.warmup
+    deadline = warmup_until + args.duration
+    threads = [
+        threading.Thread(
+            target=slow_client,
+            args=(args.url, sessions[index % len(sessions)]['token'],
+                  deadline),
+        )
+        for index in range(args.slow_clients)
+    ] + [
+        threading.Thread(
+            target=worker,
+            args=(args.url, sessions, index, warmup_until, deadline, samples),
+        )
+        for index in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = report(samples, args.duration, queries)
+    print(f'{"scenario":<28}{"requests":>9}{"rps":>8}{"p50 ms":>9}'
+          f'{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}{"queries":>9}')
+    for name, summary in results.items():
+        if not summary['count']:
+            continue
+        print(f'{name:<28}{summary["count"]:>9}{summary["rps"]:>8}'
+              f'{summary["p50"]:>9.1f}{summary["p95"]:>9.1f}'
+              f'{summary["p99"]:>9.1f}{summary["errors"]:>8}'
+              f'{summary.get("queries", "-"):>9}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--users', type=int, default=10,
+                        help='seeded users to spread requests over')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30,
+                        help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5,
+                        help='seconds of unrecorded requests first')
+    parser.add_argument('--slow-clients', type=int, default=0,
+                        help='connections trickling an upload meanwhile')
+    parser.add_argument('--count-queries', action='store_true')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+    results = run(args)
+    if args.output:
+        utils.write_report(args.output, 'loadtest', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
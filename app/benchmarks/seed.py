@@ -0,0 +1,155 @@
+"""
+Seed users, recipes, tags and ingredients in bulk
+
+Tag and ingredient popularity is skewed (a few staples appear in most
+recipes) and the number of links per recipe varies around the mean, as
+in real recipe collections.
+
+Seed the configured database for the load test, e.g.
+
+    python -m benchmarks.seed --users 20 --recipes 2000
+"""
+import argparse
+import itertools
+import random
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import connection
+from core.models import Recipe, Tag, Ingredient
+from recipe.search import update_search_vectors
+from recipe.stats import recompute
+
+PASSWORD = 'benchpass'
+
+ADJECTIVES = [
+    'Spicy', 'Creamy', 'Roasted', 'Grilled', 'Quick', 'Smoky', 'Crispy',
+    'Slow cooked', 'Herby', 'Lemony', 'Garlicky', 'Sticky', 'Classic',
+]
+DISHES = [
+    'curry', 'stew', 'salad', 'soup', 'pasta', 'risotto', 'tacos',
+    'noodles', 'pie', 'burger', 'traybake', 'stir fry', 'omelette',
+]
+TAGS = [
+    'Vegetarian', 'Vegan', 'Dinner', 'Lunch', 'Breakfast', 'Quick',
+    'Healthy', 'Comfort', 'Spicy', 'Dessert', 'Gluten free', 'Budget',
+]
+INGREDIENTS = [
+    'Salt', 'Olive oil', 'Garlic', 'Onion', 'Black pepper', 'Butter',
+    'Tomato', 'Chicken', 'Lemon', 'Flour', 'Egg', 'Rice', 'Ginger',
+    'Chili', 'Cumin', 'Basil', 'Potato', 'Carrot', 'Cheese', 'Milk',
+]
+
+
+def email(index):
+    return f'bench{index}@example.com'
+
+
+def _names(words, count):
+    """count unique names, plain words first then numbered variants"""
+    numbered = (
+        f'{word} {n}' for n in itertools.count(2) for word in words
+    )
+    return list(itertools.islice(itertools.chain(words, numbered), count))
+
+
+def _sample(pool, cum_weights, mean, rng):
+    """distinct popularity weighted picks, about mean of them"""
+    count = min(rng.randint(0, 2 * mean), len(pool))
+    picked = set()
+    while len(picked) < count:
+        picked.update(rng.choices(
+            range(len(pool)), cum_weights=cum_weights, k=count - len(picked)
+        ))
+    return [pool[i] for i in picked]
+
+
+def _link(recipes, field, pool, per_recipe, rng):
+    through = getattr(Recipe, field).through
+    column = f'{pool[0]._meta.model_name}_id'
+    # zipf-like popularity: the i-th name is picked with weight 1 / (i + 1)
+    cum_weights = list(itertools.accumulate(
+        1 / (i + 1) for i in range(len(pool))
+    ))
+    through.objects.bulk_create(
+        [
+            through(recipe_id=recipe.id, **{column: obj.id})
+            for recipe in recipes
+            for obj in _sample(pool, cum_weights, per_recipe, rng)
+        ],
+        batch_size=5000,
+    )
+
+
+def seed(users=1, recipes=1000, tags=50, ingredients=200,
+         tags_per_recipe=3, ingredients_per_recipe=8, seed=0, start=0):
+    """create users x recipes with random tag/ingredient links"""
+    rng = random.Random(seed)
+    created = []
+    for u in range(start, start + users):
+        user = get_user_model().objects.create_user(email(u), PASSWORD)
+        tag_objs = Tag.objects.bulk_create(
+            Tag(user=user, name=name) for name in _names(TAGS, tags)
+        )
+        ingredient_objs = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=name)
+            for name in _names(INGREDIENTS, ingredients)
+        )
+        recipe_objs = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    user=user,
+                    title=f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)} {i}', # noqa
+                    description='Seeded recipe',
+                    time_minutes=rng.randint(5, 180),
+                    price=Decimal(rng.randint(100, 5000)) / 100,
+                )
+                for i in range(recipes)
+            ),
+            batch_size=5000,
+        )
+        _link(recipe_objs, 'tags', tag_objs, tags_per_recipe, rng)
+        _link(
+            recipe_objs, 'ingredients', ingredient_objs,
+            ingredients_per_recipe, rng,
+        )
+        update_search_vectors(recipe.id for recipe in recipe_objs)
+        recompute([user.id])
+        created.append(user)
+
+    # fresh tables have no planner statistics
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--recipes', type=int, default=1000,
+                        help='recipes per user')
+    parser.add_argument('--tags', type=int, default=50)
+    parser.add_argument('--ingredients', type=int, default=200)
+    parser.add_argument('--tags-per-recipe', type=int, default=3)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # continue after users seeded by an earlier run
+    start = get_user_model().objects.filter(
+        email__startswith='bench', email__endswith='@example.com'
+    ).count()
+    seed(
+        users=args.users, recipes=args.recipes, tags=args.tags,
+        ingredients=args.ingredients,
+        tags_per_recipe=args.tags_per_recipe,
+        ingredients_per_recipe=args.ingredients_per_recipe,
+        seed=args.seed + start, start=start,
+    )
+    print(f'Seeded users {email(start)} .. {email(start + args.users - 1)}'
+          f' with password {PASSWORD!r}')
+
+
+if __name__ == '__main__':
+    main()
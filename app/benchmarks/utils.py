@@ -0,0 +1,97 @@
+"""
+Shared helpers for benchmarks
+"""
+import datetime
+import json
+import math
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+
+@contextmanager
+def benchmark_database():
+    """create a test database for the duration of the block"""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def time_call(func, repeat=20, warmup=2):
+    """median wall time of func() in milliseconds"""
+    return statistics.median(time_calls(func, repeat, warmup))
+
+
+def time_calls(func, repeat=20, warmup=2):
+    """wall times of repeated func() calls in milliseconds"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(values, p):
+    """nearest-rank percentile of a non-empty sequence"""
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(timings):
+    """latency summary in milliseconds, rounded for readable reports"""
+    if not timings:
+        return {'count': 0}
+    return {
+        'count': len(timings),
+        'mean': round(statistics.mean(timings), 3),
+        'p50': round(percentile(timings, 50), 3),
+        'p95': round(percentile(timings, 95), 3),
+        'p99': round(percentile(timings, 99), 3),
+        'max': round(max(timings), 3),
+    }
+
+
+def view_queryset(viewset, user, params=None, action='list'):
+    """build the queryset exactly as the viewset action would"""
+    request = APIRequestFactory().get('/', params or {})
+    force_authenticate(request, user=user)
+    view = viewset(
+        action_map={'get': action}, format_kwarg=None, kwargs={}
+    )
+    view.request = view.initialize_request(request)
+    return view, view.get_queryset()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(path, benchmark, config, results):
+    """save results as JSON tagged with the commit they were measured on"""
+    report = {
+        'benchmark': benchmark,
+        'commit': _git_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'config': config,
+        'results': results,
+    }
+    with open(path, 'w') as fh:
+        json.dump(report, fh, indent=2)
+        fh.write('\n')
+    return report
@@ -35,8 +35,16 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class RecipeAdmin(admin.ModelAdmin):
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        # the explicit through models only declare indexes, so the fields
+        # stay editable like auto created ones
+        return db_field.formfield(**kwargs)
+
+
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.MoreTests)
-admin.site.register(models.Recipe)
+admin.site.register(models.Recipe, RecipeAdmin)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
@@ -0,0 +1,100 @@
+"""
+ASGI handler running the Django stack in a bounded thread pool
+
+Django 3.2 has no async ORM and DRF views are synchronous. The stock
+ASGIHandler runs sync views, and the sync parts of the middleware, in one
+shared thread per process, so one slow query stalls every request of the
+worker. PoolASGIHandler keeps the event loop for what it does well,
+reading request bodies and writing responses, so slow clients and uploads
+hold no thread, and runs the whole sync middleware chain and view in a
+pool of ASYNC_BLOCKING_WORKERS threads.
+
+Every pool thread has its own database connections, jobs close and check
+them the way request_started/request_finished do around a WSGI request.
+"""
+import asyncio
+import contextvars
+import functools
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from core.db import check_connections
+
+SPOOL_READ_SIZE = 64 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """lazily created so every forked worker process gets its own pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_BLOCKING_WORKERS,
+                thread_name_prefix='blocking',
+            )
+        return _executor
+
+
+def _call(func, args, kwargs):
+    close_old_connections()
+    check_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """await func(*args, **kwargs) run in the bounded pool"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _get_executor(), context.run, _call, func, args, kwargs
+    )
+
+
+def spool(response):
+    """
+    Django 3.2 iterates streaming responses on the event loop, where the
+    ORM refuses to run, so produce the body into a temporary file first
+    """
+    body = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    for chunk in response.streaming_content:
+        body.write(chunk)
+    body.seek(0)
+    response.streaming_content = iter(
+        functools.partial(body.read, SPOOL_READ_SIZE), b''
+    )
+    response._resource_closers.append(body.close)
+    return response
+
+
+class PoolASGIHandler(ASGIHandler):
+    """ASGIHandler serving the sync middleware chain from the pool"""
+
+    def __init__(self):
+        self.load_middleware(is_async=False)
+
+    def _get_sync_response(self, request):
+        response = self.get_response(request)
+        if response.streaming:
+            return spool(response)
+        return response
+
+    async def get_response_async(self, request):
+        return await run_blocking(self._get_sync_response, request)
+
+
+def get_asgi_application():
+    """like django.core.asgi.get_asgi_application"""
+    django.setup(set_prefix=False)
+    return PoolASGIHandler()
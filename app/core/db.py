@@ -0,0 +1,96 @@
+"""
+Persistent database connections
+
+With CONN_MAX_AGE every worker thread keeps its connection across
+requests instead of paying the connect and authentication round trips
+each time. Django 3.2 only drops a persistent connection after a query
+failed on it, so a connection the server or a proxy closed while idle
+breaks the next request. check_connections(), run when a request starts,
+pings the open connections that sat idle for DB_HEALTH_CHECK_INTERVAL
+seconds since the last request finished with them and closes the dead
+ones, the request then reconnects. Connections in steady use are not
+pinged, so busy workers pay no extra round trip.
+
+With DB_PGBOUNCER the connections go through pgbouncer in transaction
+pooling mode, where consecutive transactions may run on different server
+connections, so server-side cursors are disabled.
+"""
+import time
+from django.conf import settings
+from django.db import connections
+
+# connections at the server, free is what is left for new clients
+POOL_STATS_SQL = """
+    SELECT
+        current_setting('max_connections')::int,
+        current_setting('superuser_reserved_connections')::int,
+        count(*) FILTER (WHERE backend_type = 'client backend'),
+        count(*) FILTER (WHERE datname = current_database()),
+        count(*) FILTER (
+            WHERE datname = current_database() AND state = 'active'),
+        count(*) FILTER (
+            WHERE datname = current_database() AND state = 'idle'),
+        count(*) FILTER (
+            WHERE datname = current_database()
+            AND state LIKE 'idle in transaction%%'),
+        extract(epoch FROM max(now() - state_change) FILTER (
+            WHERE datname = current_database() AND state = 'idle'))
+    FROM pg_stat_activity
+"""
+POOL_STATS_FIELDS = (
+    'max_connections',
+    'reserved_connections',
+    'client_connections',
+    'database_connections',
+    'active',
+    'idle',
+    'idle_in_transaction',
+    'oldest_idle_seconds',
+)
+
+
+def check_connections(**kwargs):
+    """
+    close idle open connections that fail a ping, connections inside a
+    transaction are left alone, they cannot be replaced mid-transaction
+    """
+    interval = settings.DB_HEALTH_CHECK_INTERVAL
+    if not interval:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        # connections are marked when a request finishes with them
+        idle_since = getattr(connection, 'idle_since', None)
+        if idle_since is not None and now - idle_since < interval:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+def mark_idle(**kwargs):
+    """remember when the open connections were last used by a request"""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+def pool_stats(alias='default'):
+    """connection settings of alias and the server's connection counts"""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(POOL_STATS_SQL)
+        stats = dict(zip(POOL_STATS_FIELDS, cursor.fetchone()))
+    stats['free_connections'] = (
+        stats['max_connections'] - stats['reserved_connections']
+        - stats['client_connections']
+    )
+    settings_dict = connection.settings_dict
+    stats.update({
+        'conn_max_age': settings_dict['CONN_MAX_AGE'],
+        'health_check_interval': settings.DB_HEALTH_CHECK_INTERVAL,
+        'pgbouncer': settings_dict['DISABLE_SERVER_SIDE_CURSORS'],
+    })
+    return stats
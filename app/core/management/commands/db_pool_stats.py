@@ -0,0 +1,41 @@
+""" Django database connection pool statistics """
+from django.core.management.base import BaseCommand
+from core.db import pool_stats
+
+
+class Command(BaseCommand):
+    """ show the persistent connection settings and server usage """
+
+    help = 'Show database connection settings and server connection counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help='database alias')
+
+    def handle(self, *args, **options):
+        """ Entry for command """
+        alias = options['database']
+        stats = pool_stats(alias)
+
+        max_age = stats['conn_max_age']
+        self.stdout.write(
+            f' {alias}: CONN_MAX_AGE '
+            f'{"unlimited" if max_age is None else max_age}, '
+            f'health checks after {stats["health_check_interval"]}s idle, '
+            f'pgbouncer {"on" if stats["pgbouncer"] else "off"}'
+        )
+        self.stdout.write(
+            f' server: {stats["client_connections"]} client connections '
+            f'of max_connections {stats["max_connections"]} '
+            f'({stats["reserved_connections"]} reserved)'
+        )
+        oldest = stats['oldest_idle_seconds']
+        self.stdout.write(
+            f' database: {stats["database_connections"]} connections, '
+            f'{stats["active"]} active, {stats["idle"]} idle, '
+            f'{stats["idle_in_transaction"]} idle in transaction, '
+            f'oldest idle {0 if oldest is None else oldest:.0f}s'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["free_connections"]} connections free'
+        ))
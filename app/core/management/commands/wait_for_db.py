@@ -1,12 +1,21 @@
 """ Django wait for DB """
 from django.core.management.base import BaseCommand
+from django.db import connections
 from django.db.utils import OperationalError
 from psycopg2 import OperationalError as Psycopg2Error
+from core.db import pool_stats
 import time
 
 
 class Command(BaseCommand):
     """ wait for db """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--connections', type=int, default=1,
+            help='free server connections needed by the workers'
+        )
+
     def handle(self, *args, **options):
         """ Entry for comaand """
         self.stdout.write(' Waiting for db... ')
@@ -15,9 +24,24 @@ class Command(BaseCommand):
         while db_up is False:
             try:
                 self.check(databases=['default'])
-                db_up = True
+                db_up = self.pool_ready(options['connections'])
             except (Psycopg2Error, OperationalError):
                 self.stdout.write(' DB unavaliable sleeping 1 second ')
+            if db_up is False:
                 time.sleep(1)
 
         self.stdout.write(self.style.SUCCESS('Database avaliable'))
+
+    def pool_ready(self, needed):
+        """ a query ran and the server accepts the workers' connections """
+        try:
+            free = pool_stats()['free_connections']
+        finally:
+            # the command must not hold a slot itself
+            connections['default'].close()
+        if free < needed:
+            self.stdout.write(
+                f' {free} of {needed} connections free sleeping 1 second '
+            )
+            return False
+        return True
@@ -0,0 +1,60 @@
+"""
+Prometheus metrics, exposed on /metrics
+
+uWSGI workers are separate processes. When PROMETHEUS_MULTIPROC_DIR
+points to an empty directory at startup (scripts/run.sh clears it), every
+worker writes its samples to mmapped files there and /metrics aggregates
+the files of all workers.
+"""
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Request latency by route',
+    ['route', 'method'],
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    'http_requests',
+    'Responses by route and status code',
+    ['route', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries',
+    'SQL queries per request by route',
+    ['route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests',
+    'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result'],
+)
+IMAGE_UPLOAD_BYTES = Histogram(
+    'recipe_image_upload_bytes',
+    'Size of uploaded recipe images',
+    buckets=tuple(2 ** n * 1024 for n in range(4, 15)),
+)
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render(multiprocess_dir=None):
+    """exposition body and content type for the metrics of all workers"""
+    path = multiprocess_dir or os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    registry = REGISTRY
+    if path:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=path)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,271 @@
+"""
+Request instrumentation
+
+MetricsMiddleware records latency, status and query count of every
+request in the Prometheus metrics of core.metrics.
+
+RequestProfilingMiddleware profiles a sample of requests. A sampled
+request runs with an execute_wrapper on every database
+connection. The response gets a Server-Timing header and one JSON log
+line with the query count, DB time and view/serialize/render time.
+Serialization happens inside the view, serializer .data and the recipe
+fast path are timed with serializing() and reported apart from it.
+Queries that repeat with the same fingerprint (N+1 patterns) are also
+logged. Requests that are not sampled only pay for one random() call.
+
+ReplicaRoutingMiddleware routes the reads of safe requests to the read
+replicas of core.routers.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+from core import metrics, routers
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    normalized SQL shape, queries differing only in parameters or in the
+    length of an IN list share a fingerprint
+    """
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('IN (...)', sql)).strip()
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times queries by fingerprint"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold):
+        """(fingerprint, count) of queries run at least threshold times"""
+        return [
+            (sql, count) for sql, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+
+class QueryCounter:
+    """execute_wrapper that only counts, cheap enough for every request"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _wrap_connections(stack, wrapper):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+class MetricsMiddleware:
+    """latency histogram, status counter and query count per route"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            _wrap_connections(stack, queries)
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        # unresolved paths share one label to bound the cardinality
+        route = match.view_name if match else 'unmatched'
+        metrics.REQUEST_LATENCY.labels(route, request.method).observe(
+            duration)
+        metrics.REQUESTS.labels(
+            route, request.method, response.status_code).inc()
+        metrics.REQUEST_QUERIES.labels(route).observe(queries.count)
+        return response
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.queries = QueryRecorder()
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.view_end = None
+        self.end = None
+        self.serialize = 0.0
+        self.serialize_db = 0.0
+        self.serializing = False
+
+    def timings(self):
+        """phase durations in milliseconds"""
+        view_start = self.view_start or self.start
+        view_end = self.view_end or self.end
+        timings = {
+            'db': self.queries.duration * 1000,
+            'view': (view_end - view_start) * 1000,
+            'serialize': (self.serialize - self.serialize_db) * 1000,
+            'render': (self.end - view_end) * 1000,
+            'total': (self.end - self.start) * 1000,
+        }
+        # queries are reported under db only, serialization on its own
+        timings['view'] = max(
+            timings['view'] - timings['db'] - timings['serialize'], 0.0)
+        return timings
+
+
+@contextmanager
+def serializing():
+    """time the enclosed work as serialization of the profiled request"""
+    profile = getattr(_local, 'profile', None)
+    if profile is None or profile.serializing:
+        # not profiled, or nested in timed serialization
+        yield
+        return
+    profile.serializing = True
+    start, db = time.perf_counter(), profile.queries.duration
+    try:
+        yield
+    finally:
+        profile.serialize += time.perf_counter() - start
+        profile.serialize_db += profile.queries.duration - db
+        profile.serializing = False
+
+
+def instrument_serializers():
+    """time BaseSerializer.data, which every serializer's data goes through"""
+    data = BaseSerializer.data
+    if getattr(data.fget, 'instrumented', False):
+        return
+
+    def timed_data(self):
+        with serializing():
+            return data.fget(self)
+
+    timed_data.instrumented = True
+    BaseSerializer.data = property(timed_data)
+
+
+class RequestProfilingMiddleware:
+    """
+    profile REQUEST_PROFILING_SAMPLE_RATE of the requests, keep it first in
+    MIDDLEWARE so the other middleware is included in the total
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        profile = request._profile = _local.profile = RequestProfile()
+        try:
+            with ExitStack() as stack:
+                _wrap_connections(stack, profile.queries)
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        profile.end = time.perf_counter()
+        self._report(request, response, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        """called between the view returning and DRF rendering the body"""
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.view_end = time.perf_counter()
+        return response
+
+    def _report(self, request, response, profile):
+        timings = profile.timings()
+        queries = profile.queries
+        duplicates = queries.duplicates(
+            settings.REQUEST_PROFILING_DUPLICATE_THRESHOLD)
+
+        response['Server-Timing'] = ', '.join(
+            [f'db;dur={timings["db"]:.1f};desc="{queries.count} queries"']
+            + [f'{name};dur={timings[name]:.1f}'
+               for name in ('view', 'serialize', 'render', 'total')]
+        )
+
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': queries.count,
+            'duplicate_queries': sum(count for _, count in duplicates),
+            **{f'{name}_ms': round(value, 2)
+               for name, value in timings.items()},
+        }
+        logger.info(json.dumps(record))
+        for sql, count in duplicates:
+            logger.warning(json.dumps({
+                'event': 'duplicate_queries',
+                'route': record['route'],
+                'count': count,
+                'fingerprint': sql,
+            }))
+
+
+class ReplicaRoutingMiddleware:
+    """
+    serve safe requests from a replica unless the client wrote within
+    READ_YOUR_WRITES_SECONDS, pin clients that write to the primary
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        credentials = routers.client_credentials(request)
+        safe = request.method in self.SAFE_METHODS
+        replica = None
+        if safe and not (credentials and routers.is_pinned(credentials)):
+            replica = routers.choose_replica()
+
+        with routers.route_request(replica) as routing:
+            response = self.get_response(request)
+        if not safe or routing.wrote:
+            issued = routers.issued_credentials(response)
+            for pinned in {credentials, issued} - {None}:
+                routers.pin(pinned)
+        return response
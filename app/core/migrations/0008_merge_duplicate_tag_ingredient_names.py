@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:01
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """keep the oldest row per (user, name), repoint recipes to it"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field in [('Tag', 'tags'), ('Ingredient', 'ingredients')]:
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field).through
+        fk = f'{model_name.lower()}_id'
+        duplicates = (
+            model.objects.values('user_id', 'name')
+            .annotate(keep=Min('id'), total=Count('id'))
+            .filter(total__gt=1)
+        )
+        for dup in duplicates:
+            losers = model.objects.filter(
+                user_id=dup['user_id'], name=dup['name'],
+            ).exclude(id=dup['keep'])
+            linked = through.objects.filter(**{f'{fk}__in': losers})
+            through.objects.bulk_create(
+                [
+                    through(recipe_id=recipe_id, **{fk: dup['keep']})
+                    for recipe_id in linked.values_list(
+                        'recipe_id', flat=True).distinct()
+                ],
+                ignore_conflicts=True,
+            )
+            losers.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
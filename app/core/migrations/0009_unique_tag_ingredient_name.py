@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_merge_duplicate_tag_ingredient_names'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_ingredient_name_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_tag_name_per_user'),
+        ),
+    ]
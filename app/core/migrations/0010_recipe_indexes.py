@@ -0,0 +1,84 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:06
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_model(name, attr):
+    """state of an auto created Recipe m2m table as an explicit model"""
+    return migrations.CreateModel(
+        name=name,
+        fields=[
+            ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.recipe')),
+            (attr, models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=f'core.{attr}')),
+        ],
+        options={
+            'db_table': f'core_recipe_{attr}s',
+            'unique_together': {('recipe', attr)},
+        },
+    )
+
+
+class Migration(migrations.Migration):
+    # concurrent index builds cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_unique_tag_ingredient_name'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'),
+        ),
+        # the tables already exist, only the state learns about them
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                link_model('RecipeTag', 'tag'),
+                link_model('RecipeIngredient', 'ingredient'),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='tags',
+                    field=models.ManyToManyField(through='core.RecipeTag', to='core.Tag'),
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='ingredients',
+                    field=models.ManyToManyField(through='core.RecipeIngredient', to='core.Ingredient'),
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name='recipetag',
+            index=models.Index(fields=['tag', 'recipe'], name='recipe_tag_tag_recipe_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipeingredient',
+            index=models.Index(fields=['ingredient', 'recipe'], name='recipe_ingr_ingr_recipe_idx'),
+        ),
+        # covered by the unique and the new indexes, dropped after the
+        # latter are built
+        migrations.AlterField(
+            model_name='recipetag',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.recipe'),
+        ),
+        migrations.AlterField(
+            model_name='recipetag',
+            name='tag',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.tag'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.recipe'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='ingredient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.ingredient'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_recipe_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(choices=[('none', 'No image'), ('pending', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+    ]
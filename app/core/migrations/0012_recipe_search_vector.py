@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # concurrent index builds cannot run inside a transaction, existing
+    # rows are filled by 0016_fill_search_vectors
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+    ]
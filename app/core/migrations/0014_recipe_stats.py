@@ -0,0 +1,80 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# fill the rollups from the existing recipes, later writes are applied by
+# recipe.signals and drift is repaired by recompute_recipe_stats
+POPULATE = [
+    """
+    INSERT INTO core_recipestats (
+        user_id, recipe_count, time_minutes_sum, time_minutes_min,
+        time_minutes_max, price_sum, price_min, price_max)
+    SELECT user_id, COUNT(*), SUM(time_minutes), MIN(time_minutes),
+           MAX(time_minutes), SUM(price), MIN(price), MAX(price)
+    FROM core_recipe
+    GROUP BY user_id
+    """,
+    """
+    INSERT INTO core_tagusage (tag_id, user_id, recipe_count)
+    SELECT t.id, t.user_id, COUNT(*)
+    FROM core_tag t JOIN core_recipe_tags rt ON rt.tag_id = t.id
+    GROUP BY t.id
+    """,
+    """
+    INSERT INTO core_ingredientusage (ingredient_id, user_id, recipe_count)
+    SELECT i.id, i.user_id, COUNT(*)
+    FROM core_ingredient i
+    JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+    GROUP BY i.id
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_trigram_name_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.user')),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('time_minutes_sum', models.BigIntegerField(default=0)),
+                ('time_minutes_min', models.IntegerField(null=True)),
+                ('time_minutes_max', models.IntegerField(null=True)),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('price_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('price_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagUsage',
+            fields=[
+                ('recipe_count', models.IntegerField(default=0)),
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='core.tag')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IngredientUsage',
+            fields=[
+                ('recipe_count', models.IntegerField(default=0)),
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='core.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tagusage',
+            index=models.Index(fields=['user', '-recipe_count'], name='tag_usage_user_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientusage',
+            index=models.Index(fields=['user', '-recipe_count'], name='ingr_usage_user_count_idx'),
+        ),
+        migrations.RunSQL(POPULATE, migrations.RunSQL.noop),
+    ]
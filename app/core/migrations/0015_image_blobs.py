@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:28
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+# count the images of the existing recipes, later writes are applied by
+# recipe.signals and drift is repaired by gc_image_blobs --recount
+POPULATE = """
+    INSERT INTO core_imageblob (name, ref_count, updated)
+    SELECT image, COUNT(*), now()
+    FROM core_recipe
+    WHERE image IS NOT NULL AND image <> ''
+    GROUP BY image
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_recipe_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.AddIndex(
+            model_name='imageblob',
+            index=models.Index(condition=models.Q(('ref_count__lte', 0)), fields=['updated'], name='imageblob_unreferenced_idx'),
+        ),
+        migrations.RunSQL(POPULATE, migrations.RunSQL.noop),
+    ]
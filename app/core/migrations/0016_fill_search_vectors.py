@@ -0,0 +1,55 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# the vector of recipe.search.search_vector(), title (A), tag and
+# ingredient names (B) and description (C), for a batch of recipes that
+# have none yet
+FILL = """
+    UPDATE core_recipe r SET search_vector =
+        setweight(to_tsvector('english'::regconfig,
+                              COALESCE(r.title, '')), 'A')
+        || setweight(to_tsvector('english'::regconfig, COALESCE((
+            SELECT string_agg(t.name, ' ')
+            FROM core_tag t JOIN core_recipe_tags rt ON rt.tag_id = t.id
+            WHERE rt.recipe_id = r.id), '')), 'B')
+        || setweight(to_tsvector('english'::regconfig, COALESCE((
+            SELECT string_agg(i.name, ' ')
+            FROM core_ingredient i
+            JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+            WHERE ri.recipe_id = r.id), '')), 'B')
+        || setweight(to_tsvector('english'::regconfig,
+                                 COALESCE(r.description, '')), 'C')
+    WHERE r.id IN (
+        SELECT id FROM core_recipe
+        WHERE search_vector IS NULL AND id > %s
+        ORDER BY id LIMIT %s
+    )
+    RETURNING r.id
+"""
+
+
+def fill_search_vectors(apps, schema_editor):
+    # keyset batches, every UPDATE commits on its own
+    last_id = 0
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(FILL, [last_id, BATCH_SIZE])
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            last_id = max(ids)
+
+
+class Migration(migrations.Migration):
+    # batches are committed as they go, so the table is never locked
+    # for the whole fill
+    atomic = False
+
+    dependencies = [
+        ('core', '0015_image_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,17 @@
-import uuid
 import os
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin)
+from core.storage import recipe_image_storage
 
 
 def recipe_image_file_path(instance, filename):
-    ext = os.path.splitext(filename)[1]
-    filename = f'{uuid.uuid4()}{ext}'
+    # the storage replaces the name by the content hash, keeping the ext
     return os.path.join('uploads', 'recipe', filename)
 
 
@@ -62,25 +63,115 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 class Recipe(models.Model):
     """Recipet object"""
+
+    class ImageStatus(models.TextChoices):
+        NONE = 'none', 'No image'
+        PENDING = 'pending', 'Processing'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Failed'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE) # noqa
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     time_minutes = models.IntegerField()
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
-    tags = models.ManyToManyField("Tag")
-    ingredients = models.ManyToManyField("Ingredient")
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    tags = models.ManyToManyField("Tag", through='RecipeTag')
+    ingredients = models.ManyToManyField("Ingredient", through='RecipeIngredient') # noqa
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage,
+    )
+    image_status = models.CharField(
+        max_length=10,
+        choices=ImageStatus.choices,
+        default=ImageStatus.NONE,
+    )
+    # {rendition: {format: storage name}}, filled by recipe.images
+    image_renditions = models.JSONField(default=dict, blank=True)
+    # maintained by recipe.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # list endpoint: WHERE user_id = ? ORDER BY id DESC
+            models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'), # noqa
+            GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'), # noqa
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # {attname: value} as stored, recipe.signals diffs saves against it
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        loaded = getattr(self, '_loaded_values', {})
+        for name in fields or [f.attname for f in self._meta.concrete_fields]:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                loaded[attname] = self.__dict__[attname]
+        self._loaded_values = loaded
+
+
+class RecipeAttrManager(models.Manager):
+
+    def get_or_create_many(self, user, names):
+        """
+        return {name: obj} for every name, one SELECT for the existing rows
+        and one INSERT for the missing ones
+        """
+        names = list(dict.fromkeys(names))
+        found = {
+            obj.name: obj
+            for obj in self.filter(user=user, name__in=names)
+        }
+        missing = [
+            self.model(user=user, name=name)
+            for name in names if name not in found
+        ]
+        if missing:
+            try:
+                with transaction.atomic():
+                    created = self.bulk_create(missing)
+            except IntegrityError:
+                # a concurrent writer inserted some of the names first
+                self.bulk_create(missing, ignore_conflicts=True)
+                created = self.filter(
+                    user=user,
+                    name__in=[obj.name for obj in missing],
+                )
+            found.update((obj.name, obj) for obj in created)
+        return found
+
 
 class Tag(models.Model):
 
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE) # noqa
 
+    objects = RecipeAttrManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='unique_tag_name_per_user'
+            ),
+        ]
+        indexes = [
+            GinIndex(
+                fields=['name'],
+                name='tag_name_trgm_idx',
+                opclasses=['gin_trgm_ops'],
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -89,5 +180,137 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE) # noqa
 
+    objects = RecipeAttrManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_ingredient_name_per_user',
+            ),
+        ]
+        indexes = [
+            GinIndex(
+                fields=['name'],
+                name='ingredient_name_trgm_idx',
+                opclasses=['gin_trgm_ops'],
+            ),
+        ]
+
     def __str__(self):
         return self.name
+
+
+class RecipeAttrLink(models.Model):
+    """
+    row of the Recipe.tags/ingredients tables, declared only for their
+    indexes. The (recipe, attr) unique index covers recipe_id lookups and
+    the (attr, recipe) one lets tags__id__in / ingredients__id__in filters
+    resolve recipe ids with an index-only scan, so neither foreign key
+    gets an index of its own
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False) # noqa
+
+    class Meta:
+        abstract = True
+
+
+class RecipeTag(RecipeAttrLink):
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        db_table = 'core_recipe_tags'
+        unique_together = [['recipe', 'tag']]
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'], name='recipe_tag_tag_recipe_idx',
+            ),
+        ]
+
+
+class RecipeIngredient(RecipeAttrLink):
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, db_index=False,
+    )
+
+    class Meta:
+        db_table = 'core_recipe_ingredients'
+        unique_together = [['recipe', 'ingredient']]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='recipe_ingr_ingr_recipe_idx',
+            ),
+        ]
+
+
+class RecipeStats(models.Model):
+    """per-user recipe aggregates, maintained by recipe.stats"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    recipe_count = models.IntegerField(default=0)
+    time_minutes_sum = models.BigIntegerField(default=0)
+    time_minutes_min = models.IntegerField(null=True)
+    time_minutes_max = models.IntegerField(null=True)
+    price_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0) # noqa
+    price_min = models.DecimalField(max_digits=5, decimal_places=2, null=True) # noqa
+    price_max = models.DecimalField(max_digits=5, decimal_places=2, null=True) # noqa
+
+
+class RecipeAttrUsage(models.Model):
+    """number of recipes linked to a tag/ingredient, see recipe.stats"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE) # noqa
+    recipe_count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class TagUsage(RecipeAttrUsage):
+    tag = models.OneToOneField(
+        Tag, on_delete=models.CASCADE, primary_key=True, related_name='usage',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-recipe_count'],
+                name='tag_usage_user_count_idx',
+            ),
+        ]
+
+
+class IngredientUsage(RecipeAttrUsage):
+    ingredient = models.OneToOneField(
+        Ingredient,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='usage',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-recipe_count'],
+                name='ingr_usage_user_count_idx',
+            ),
+        ]
+
+
+class ImageBlob(models.Model):
+    """stored recipe image and the recipes using it, see recipe.blobs"""
+    name = models.CharField(max_length=100, primary_key=True)
+    ref_count = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['updated'],
+                name='imageblob_unreferenced_idx',
+                condition=models.Q(ref_count__lte=0),
+            ),
+        ]
@@ -0,0 +1,116 @@
+"""
+Read replica routing
+
+ReplicaRoutingMiddleware sends the reads of GET, HEAD and OPTIONS
+requests to one of DATABASE_REPLICAS, everything else, and all work done
+outside a request such as management commands and image processing,
+uses the primary.
+
+Replicas lag behind the primary, so a client that wrote is pinned to the
+primary for READ_YOUR_WRITES_SECONDS and sees its own writes. Clients are
+identified by their credentials, the Authorization header or the session
+cookie, which are known before the view authenticates the request. A
+write that issues a token, such as logging in, also pins the token, so
+the first request made with it finds the token on the primary. The pins
+live in the REPLICA_PIN_CACHE_ALIAS cache shared by all workers.
+
+A request that writes, or opens a transaction, reads from the primary
+from then on. Streaming response bodies are produced after the
+middleware returned and read from the primary.
+"""
+import hashlib
+import random
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_local = threading.local()
+
+
+class RequestRouting:
+    """database choices of the request being served"""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+def _current():
+    return getattr(_local, 'routing', None)
+
+
+@contextmanager
+def route_request(replica):
+    """route the enclosed reads to the replica alias, None for the primary"""
+    routing = _local.routing = RequestRouting(replica)
+    try:
+        yield routing
+    finally:
+        _local.routing = None
+
+
+def choose_replica():
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def _pin_key(credentials):
+    # never put raw credentials into an external cache
+    return 'db:pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def client_credentials(request):
+    return (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+
+
+def issued_credentials(response):
+    """Authorization header of a token returned by the response, if any"""
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and data.get('token'):
+        return f'Token {data["token"]}'
+    return None
+
+
+def is_pinned(credentials):
+    cache = caches[settings.REPLICA_PIN_CACHE_ALIAS]
+    return cache.get(_pin_key(credentials)) is not None
+
+
+def pin(credentials):
+    """read from the primary for the next READ_YOUR_WRITES_SECONDS"""
+    caches[settings.REPLICA_PIN_CACHE_ALIAS].set(
+        _pin_key(credentials), 1, settings.READ_YOUR_WRITES_SECONDS
+    )
+
+
+class ReplicaRouter:
+    """reads of routed requests go to a replica, writes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        routing = _current()
+        if routing is None or routing.replica is None or routing.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _current()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
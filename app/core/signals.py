@@ -0,0 +1,10 @@
+"""
+Check idle persistent database connections before a request uses them
+"""
+from django.core.signals import request_started, request_finished
+from core.db import check_connections, mark_idle
+
+# connected after django.db's close_old_connections, so connections past
+# CONN_MAX_AGE are already closed and neither pinged nor marked
+request_started.connect(check_connections)
+request_finished.connect(mark_idle)
@@ -0,0 +1,100 @@
+"""
+Content-addressed file storage
+
+Files are named by the sha256 of their bytes, so equal uploads share one
+file and saving bytes that are already stored writes nothing. A stored
+name always holds the same bytes. Files may be referenced by many rows,
+delete() keeps them and recipe.blobs removes those no longer referenced.
+"""
+import hashlib
+import os
+import tempfile
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    """sha256 hex digest of a File, computed while uploading when known"""
+    digest = getattr(content, 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    return digest
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage naming files <directory>/<sha256><extension>"""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, content_hash(content) + extension)
+        try:
+            # already stored, the mtime tells the collector it is in use
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            return self._save(name, content)
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload')
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(fd)
+                file_move_safe(content.temporary_file_path(), temp_path,
+                               allow_overwrite=True)
+            else:
+                with os.fdopen(fd, 'wb') as temp:
+                    for chunk in content.chunks():
+                        temp.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            # concurrent writers of a name write the same bytes
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+    def delete(self, name):
+        """shared files are removed by recipe.blobs once unreferenced"""
+
+    def delete_blob(self, name, cutoff=None):
+        """
+        delete the file unless it was saved again after the cutoff datetime,
+        return whether it is gone
+        """
+        if cutoff is None:
+            super().delete(name)
+            return True
+        full_path = self.path(name)
+        fd, trash_path = tempfile.mkstemp(
+            dir=os.path.dirname(full_path), prefix='.delete')
+        os.close(fd)
+        try:
+            # from here on a save of the name writes a new file
+            os.replace(full_path, trash_path)
+        except FileNotFoundError:
+            os.remove(trash_path)
+            return True
+        if os.stat(trash_path).st_mtime > cutoff.timestamp():
+            # saved between the caller's check and the move
+            os.replace(trash_path, full_path)
+            return False
+        os.remove(trash_path)
+        return True
+
+
+recipe_image_storage = ContentAddressedStorage()
@@ -1,6 +1,8 @@
+from decimal import Decimal
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from core import models
 
 
 class AdminSiteTests(TestCase):
@@ -37,3 +39,13 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_edit_recipe_page_links(self):
+        recipe = models.Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=10, price=Decimal('1'),
+        )
+        url = reverse('admin:core_recipe_change', args=[recipe.id])
+        res = self.client.get(url)
+
+        self.assertContains(res, 'name="tags"')
+        self.assertContains(res, 'name="ingredients"')
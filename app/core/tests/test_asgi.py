@@ -0,0 +1,104 @@
+"""
+Test the ASGI handler serving requests from the thread pool
+"""
+import threading
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+from core.asgi import PoolASGIHandler
+from core.models import Recipe, Tag
+from recipe.views import TagViewSet
+
+
+async def call(application, path, token=None, query_string=b''):
+    """(status, headers, body) of a GET through the ASGI application"""
+    headers = [(b'host', b'testserver')]
+    if token:
+        headers.append((b'authorization', f'Token {token}'.encode()))
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query_string,
+        'root_path': '',
+        'headers': headers,
+        'client': ('127.0.0.1', 1234),
+        'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    start, *body = messages
+    return (
+        start['status'],
+        dict(start['headers']),
+        b''.join(message.get('body', b'') for message in body),
+    )
+
+
+class PoolASGIHandlerTests(TransactionTestCase):
+
+    def setUp(self):
+        # pool threads outlive the test, persistent connections would keep
+        # the test database open
+        no_persistent = patch.dict(connection.settings_dict,
+                                   {'CONN_MAX_AGE': 0})
+        no_persistent.start()
+        self.addCleanup(no_persistent.stop)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.token = Token.objects.create(user=self.user).key
+        Tag.objects.create(user=self.user, name='Vegan')
+        Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        self.application = PoolASGIHandler()
+
+    async def test_view_runs_in_pool(self):
+        threads = []
+
+        def list_tags(view, request, *args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return Response([])
+
+        with patch.object(TagViewSet, 'list', list_tags):
+            status, _, _ = await call(
+                self.application, reverse('recipe:tag-list'), self.token)
+
+        self.assertEqual(status, 200)
+        self.assertTrue(threads[0].startswith('blocking'))
+
+    async def test_read_endpoint(self):
+        status, headers, body = await call(
+            self.application, reverse('recipe:tag-list'), self.token)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'Content-Type'], b'application/json')
+        self.assertIn(b'Vegan', body)
+
+    async def test_streaming_response_spooled(self):
+        # the stock handler would iterate the export on the event loop
+        status, _, body = await call(
+            self.application, reverse('recipe:recipe-export'), self.token,
+            query_string=b'format=ndjson',
+        )
+
+        self.assertEqual(status, 200)
+        self.assertIn(b'"Curry"', body)
@@ -1,23 +1,54 @@
+from io import StringIO
 from unittest.mock import patch
 from psycopg2 import OperationalError as Psycopg2Error
 from django.core.management import call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
 
 
+@patch('core.management.commands.wait_for_db.pool_stats')
 @patch('core.management.commands.wait_for_db.Command.check')
 class CommandTests(SimpleTestCase):
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_check, patched_stats):
         patched_check.return_value = True
+        patched_stats.return_value = {'free_connections': 90}
         call_command('wait_for_db')
         patched_check.assert_called_once_with(databases=['default'])
+        patched_stats.assert_called_once_with()
 
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+    def test_wait_for_db_delay(self, patched_sleep, patched_check,
+                               patched_stats):
         """ Test waiting for db when getting OperationalError """
         patched_check.side_effect = [Psycopg2Error] * 2 + \
             [OperationalError] * 3 + [True]
+        patched_stats.return_value = {'free_connections': 90}
         call_command('wait_for_db')
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+    @patch('time.sleep')
+    def test_wait_for_db_pool_ready(self, patched_sleep, patched_check,
+                                    patched_stats):
+        """ Test waiting until the server has connections for the pool """
+        patched_check.return_value = True
+        patched_stats.side_effect = [
+            OperationalError,
+            {'free_connections': 3},
+            {'free_connections': 8},
+        ]
+        call_command('wait_for_db', connections=8)
+
+        self.assertEqual(patched_stats.call_count, 3)
+        self.assertEqual(patched_sleep.call_count, 2)
+
+
+class PoolStatsCommandTests(TestCase):
+    def test_db_pool_stats(self):
+        out = StringIO()
+        call_command('db_pool_stats', stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('default: CONN_MAX_AGE', output)
+        self.assertIn('connections free', output)
@@ -0,0 +1,60 @@
+"""
+Test persistent connection health checks
+"""
+import time
+from unittest.mock import patch
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from core.db import check_connections, mark_idle, pool_stats
+
+
+@override_settings(DB_HEALTH_CHECK_INTERVAL=30)
+class ConnectionHealthCheckTests(TransactionTestCase):
+
+    def setUp(self):
+        connection.ensure_connection()
+        # as left by a request that finished a minute ago
+        connection.idle_since = time.monotonic() - 60
+        self.addCleanup(vars(connections['default']).pop, 'idle_since', None)
+
+    def test_unusable_connection_closed(self):
+        with patch.object(connection, 'is_usable', return_value=False):
+            check_connections()
+
+        self.assertIsNone(connection.connection)
+
+    def test_usable_connection_kept(self):
+        raw = connection.connection
+
+        check_connections()
+
+        self.assertIs(connection.connection, raw)
+
+    def test_recently_used_connection_not_pinged(self):
+        mark_idle()
+
+        with patch.object(connection, 'is_usable') as patched_usable:
+            check_connections()
+
+        patched_usable.assert_not_called()
+
+    @override_settings(DB_HEALTH_CHECK_INTERVAL=0)
+    def test_health_checks_disabled(self):
+        with patch.object(connection, 'is_usable') as patched_usable:
+            check_connections()
+
+        patched_usable.assert_not_called()
+
+
+class PoolStatsTests(TestCase):
+
+    def test_pool_stats_counts_own_connection(self):
+        stats = pool_stats()
+
+        self.assertGreaterEqual(stats['database_connections'], 1)
+        self.assertGreaterEqual(stats['active'], 1)
+        self.assertEqual(
+            stats['free_connections'],
+            stats['max_connections'] - stats['reserved_connections']
+            - stats['client_connections'],
+        )
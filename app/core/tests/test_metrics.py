@@ -0,0 +1,108 @@
+"""
+Test prometheus metrics
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+from core import metrics
+from recipe.cache import get_cache
+
+METRICS_URL = reverse('metrics')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_metrics_by_route(self):
+        route = {'route': 'recipe:tag-list'}
+        before = sample('http_requests_total', method='GET', status='200',
+                        **route)
+        queries = sample('http_request_db_queries_sum', **route)
+
+        self.client.get(TAGS_URL)
+
+        self.assertEqual(
+            sample('http_requests_total', method='GET', status='200',
+                   **route),
+            before + 1,
+        )
+        self.assertGreater(
+            sample('http_request_db_queries_sum', **route), queries)
+
+    def test_list_cache_hits_counted(self):
+        hits = sample('cache_requests_total', cache='api_list', result='hit')
+        misses = sample(
+            'cache_requests_total', cache='api_list', result='miss')
+
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+
+        self.assertEqual(
+            sample('cache_requests_total', cache='api_list', result='hit'),
+            hits + 1,
+        )
+        self.assertEqual(
+            sample('cache_requests_total', cache='api_list', result='miss'),
+            misses + 1,
+        )
+
+    def test_metrics_endpoint(self):
+        self.client.get(TAGS_URL)
+
+        res = APIClient().get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(
+            b'http_request_duration_seconds_bucket{le="0.005",'
+            b'method="GET",route="recipe:tag-list"}',
+            res.content,
+        )
+
+    def test_metrics_endpoint_refuses_public_clients(self):
+        res = APIClient().get(METRICS_URL, REMOTE_ADDR='203.0.113.7')
+
+        self.assertEqual(res.status_code, 404)
+
+    @override_settings(METRICS_ALLOWED_NETWORKS=['10.1.0.0/16'])
+    def test_metrics_allowed_networks(self):
+        allowed = APIClient().get(METRICS_URL, REMOTE_ADDR='10.1.2.3')
+        refused = APIClient().get(METRICS_URL, REMOTE_ADDR='127.0.0.1')
+
+        self.assertEqual(allowed.status_code, 200)
+        self.assertEqual(refused.status_code, 404)
+
+    def test_workers_aggregated(self):
+        with tempfile.TemporaryDirectory() as path:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=path)
+            code = (
+                'from core.metrics import cache_lookup; '
+                'cache_lookup("api_list", True)'
+            )
+            for _ in range(2):
+                subprocess.run(
+                    [sys.executable, '-c', code], env=env, check=True,
+                    cwd=os.path.dirname(os.path.dirname(metrics.__file__)),
+                )
+
+            body, _ = metrics.render(path)
+
+        self.assertIn(
+            b'cache_requests_total{cache="api_list",result="hit"} 2.0', body)
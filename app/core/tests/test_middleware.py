@@ -0,0 +1,84 @@
+"""
+Test request profiling middleware
+"""
+import json
+import time
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.middleware import QueryRecorder, fingerprint
+from core.models import Tag
+from recipe.serializers import TagSerializer
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+@override_settings(REQUEST_PROFILING_SAMPLE_RATE=1.0)
+class RequestProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            res = self.client.get(TAGS_URL)
+
+        timing = res['Server-Timing']
+        for name in ('db', 'view', 'serialize', 'render', 'total'):
+            self.assertIn(f'{name};dur=', timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], 'recipe:tag-list')
+        self.assertEqual(record['status'], 200)
+        self.assertIn(f'desc="{record["queries"]} queries"', timing)
+
+    def test_serialization_timed_apart_from_view(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+        to_representation = TagSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        with patch.object(TagSerializer, 'to_representation', slow), \
+                self.assertLogs('core.middleware', 'INFO') as logs:
+            self.client.get(TAGS_URL)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertGreaterEqual(record['serialize_ms'], 50)
+        self.assertLess(record['view_ms'], 50)
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=0.0)
+    def test_unsampled_request_not_profiled(self):
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    def test_recorder_flags_repeated_queries(self):
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(3)
+        ]
+        recorder = QueryRecorder()
+
+        with connection.execute_wrapper(recorder):
+            for tag in tags:
+                Tag.objects.filter(id=tag.id).first()
+            Tag.objects.filter(id__in=[t.id for t in tags]).count()
+            Tag.objects.filter(id__in=[tags[0].id]).count()
+
+        self.assertEqual(recorder.count, 5)
+        self.assertEqual(len(recorder.duplicates(3)), 1)
+        self.assertEqual(recorder.duplicates(2)[1][1], 2)
+
+    def test_fingerprint_collapses_in_lists(self):
+        self.assertEqual(
+            fingerprint('SELECT 1  FROM t\n WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT 1 FROM t WHERE id IN (%s)'),
+        )
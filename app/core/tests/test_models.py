@@ -1,7 +1,12 @@
 """ test for models """
-from django.test import TestCase
+import hashlib
+import tempfile
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError
 from core import models
+from core.storage import recipe_image_storage
 from decimal import Decimal
 from unittest.mock import patch
 
@@ -73,10 +78,44 @@ class ModelTests(TestCase):
         )
         self.assertEqual(str(ingredient), ingredient.name)
 
-    @patch('core.models.uuid.uuid4')
-    def test_recipe_file_name_uuid(self, mock_uuid):
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
-        file_path = models.recipe_image_file_path(None, 'example.jpg')
+    def test_tag_name_unique_per_user(self):
+        user = create_user()
+        models.Tag.objects.create(user=user, name='Tag1')
+        models.Tag.objects.create(
+            user=create_user(email='other@example.com'), name='Tag1'
+        )
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='Tag1')
+
+    def test_get_or_create_many(self):
+        user = create_user()
+        existing = models.Ingredient.objects.create(user=user, name='Salt')
+
+        # select existing, savepoint, insert missing, release
+        with self.assertNumQueries(4):
+            objs = models.Ingredient.objects.get_or_create_many(
+                user, ['Salt', 'Pepper', 'Salt', 'Oil']
+            )
+
+        self.assertEqual(list(objs), ['Salt', 'Pepper', 'Oil'])
+        self.assertEqual(objs['Salt'], existing)
+        self.assertIsNotNone(objs['Oil'].id)
+        self.assertEqual(models.Ingredient.objects.count(), 3)
+
+    def test_recipe_file_name_content_hash(self):
+        content = b'image bytes'
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            name = recipe_image_storage.save(
+                models.recipe_image_file_path(None, 'example.JPG'),
+                ContentFile(content),
+            )
+            with patch.object(recipe_image_storage, '_save') as save:
+                again = recipe_image_storage.save(
+                    'uploads/recipe/other.jpg', ContentFile(content))
 
-        self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(name, f'uploads/recipe/{digest}.jpg')
+        self.assertEqual(again, name)
+        save.assert_not_called()
@@ -0,0 +1,120 @@
+"""
+Test read replica routing
+"""
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag
+from core.routers import ReplicaRouter, route_request
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # replica mirrors the test database through a second connection
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def get(self, client, url):
+        """response and the queries run on (default, replica)"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            res = client.get(url)
+        return res, len(primary), len(replica)
+
+    def test_safe_request_reads_from_replica(self):
+        res, primary, replica = self.get(self.client, TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['results'][0]['name'], 'Vegan')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_write_pins_client_to_primary(self):
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Curry', 'time_minutes': 30, 'price': Decimal('5.00'),
+        })
+        self.assertEqual(res.status_code, 201)
+
+        res, primary, replica = self.get(self.client, RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'Curry')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_other_clients_not_pinned(self):
+        self.client.post(RECIPES_URL, {
+            'title': 'Curry', 'time_minutes': 30, 'price': Decimal('5.00'),
+        })
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+
+        _, primary, replica = self.get(self.client_for(other), TAGS_URL)
+
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_login_pins_issued_token(self):
+        get_user_model().objects.create_user('new@example.com', 'pass1234')
+
+        res = APIClient().post(TOKEN_URL, {
+            'email': 'new@example.com', 'password': 'pass1234',
+        })
+        self.assertEqual(res.status_code, 200)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {res.data["token"]}')
+
+        res, primary, replica = self.get(client, TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    @override_settings(READ_YOUR_WRITES_SECONDS=0)
+    def test_pin_expires(self):
+        self.client.post(RECIPES_URL, {
+            'title': 'Curry', 'time_minutes': 30, 'price': Decimal('5.00'),
+        })
+
+        _, primary, replica = self.get(self.client, TAGS_URL)
+
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        _, primary, replica = self.get(self.client, TAGS_URL)
+
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_router_reads_primary_after_write(self):
+        router = ReplicaRouter()
+
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+        with route_request('replica') as routing:
+            self.assertEqual(router.db_for_read(Recipe), 'replica')
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+            self.assertTrue(routing.wrote)
+            self.assertEqual(router.db_for_read(Recipe), 'default')
@@ -0,0 +1,27 @@
+import ipaddress
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from core import metrics as app_metrics
+
+
+def _allowed(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    )
+
+
+def metrics(request):
+    """
+    prometheus scrape endpoint, for clients in METRICS_ALLOWED_NETWORKS.
+    Behind the proxy every client has the proxy's address, the proxy
+    templates deny /metrics to other than internal networks
+    """
+    if not _allowed(request.META.get('REMOTE_ADDR', '')):
+        raise Http404
+    body, content_type = app_metrics.render()
+    return HttpResponse(body, content_type=content_type)
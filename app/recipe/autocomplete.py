@@ -0,0 +1,88 @@
+"""
+Prefix and fuzzy name matching for tag and ingredient autocomplete
+
+Names are indexed with pg_trgm GIN indexes. Prefix matches rank first,
+then names containing a word similar to the typed text, by similarity.
+
+pg_trgm declares its operators as cheap, so for a user with thousands of
+names the planner would rather walk the user_id index and test every row
+with word_similarity(). Fuzzy queries run in their own transaction with
+sequential and plain index scans priced out, leaving the bitmap scan on
+the trigram index as the cheapest plan.
+"""
+from django.contrib.postgres.lookups import PostgresOperatorLookup
+from django.db import connections, transaction
+from django.db.models import (
+    CharField,
+    Case,
+    FloatField,
+    Func,
+    IntegerField,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.lookups import IStartsWith
+
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# trigram matching is meaningless below three characters
+MIN_FUZZY_LENGTH = 3
+
+# only last until the end of the autocomplete transaction
+TRIGRAM_PLANNER_SETTINGS = (
+    'SET LOCAL enable_seqscan = off',
+    'SET LOCAL enable_indexscan = off',
+)
+
+
+@CharField.register_lookup
+class TrigramWordSimilar(PostgresOperatorLookup):
+    """`name %> text`, the GIN indexable word_similarity threshold test"""
+    lookup_name = 'trigram_word_similar'
+    postgres_operator = '%%>'
+
+
+@CharField.register_lookup
+class TrigramIStartsWith(IStartsWith):
+    """`name ILIKE 'text%'`, unlike UPPER() LIKE it can use the index"""
+    lookup_name = 'trigram_istartswith'
+
+    def get_rhs_op(self, connection, rhs):
+        return f'ILIKE {rhs}'
+
+
+class TrigramWordSimilarity(Func):
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+    def __init__(self, string, expression, **extra):
+        if not hasattr(string, 'resolve_expression'):
+            string = Value(string)
+        super().__init__(string, expression, **extra)
+
+
+def autocomplete(queryset, text, limit):
+    """best `limit` rows of queryset whose name matches the typed text
+
+    fuzzy matches are evaluated here, inside the planner settings
+    transaction, so a list is returned for them
+    """
+    prefix = Q(name__trigram_istartswith=text)
+    if len(text) < MIN_FUZZY_LENGTH:
+        return queryset.filter(prefix).order_by('name')[:limit]
+    # a prefix of three or more characters always passes the word
+    # similarity threshold, keeping a single indexable condition
+    queryset = queryset.filter(name__trigram_word_similar=text).annotate(
+        prefix_match=Case(
+            When(prefix, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        similarity=TrigramWordSimilarity(text, 'name'),
+    ).order_by('-prefix_match', '-similarity', 'name')[:limit]
+    with transaction.atomic(using=queryset.db):
+        with connections[queryset.db].cursor() as cursor:
+            for sql in TRIGRAM_PLANNER_SETTINGS:
+                cursor.execute(sql)
+        return list(queryset)
@@ -0,0 +1,137 @@
+"""
+Reference counts and garbage collection of stored recipe images
+
+Recipe.image uses core.storage.ContentAddressedStorage, recipes with the
+same image share one file. ImageBlob counts the recipes naming each file,
+recipe.signals applies every change of Recipe.image as a delta. Files are
+never deleted when a recipe lets go of them, the gc_image_blobs command
+removes the files that stayed unreferenced for IMAGE_BLOB_GC_GRACE.
+
+The grace period covers uploads in flight: a new upload of stored bytes
+only refreshes the file's mtime, the count follows when its transaction
+commits. Files are deleted only when the recipes table agrees that
+nothing references them and their mtime is older than the grace period,
+checked again by ContentAddressedStorage.delete_blob as it removes them.
+Temporary files of writers that died are removed after the grace period.
+"""
+import os
+import re
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from core.models import Recipe, ImageBlob
+from core.storage import recipe_image_storage
+from recipe.stats import _upsert
+
+BLOB_DIR = os.path.join('uploads', 'recipe')
+# names written by ContentAddressedStorage, renditions are not blobs
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+# its temporary files, see ContentAddressedStorage
+TEMP_NAME = re.compile(r'^\.(upload|delete)')
+
+
+def add_refs(deltas):
+    """apply {name: change of the number of recipes} to the counts"""
+    now = timezone.now()
+    rows = [
+        {'name': name, 'ref_count': delta, 'updated': now}
+        for name, delta in deltas.items() if name and delta
+    ]
+    if not rows:
+        return
+    sql, params = _upsert(ImageBlob, rows, 'name', {
+        'ref_count': '{current} + {new}',
+        'updated': '{new}',
+    })
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def recount():
+    """rebuild the counts from the recipes, return the blobs counted"""
+    with transaction.atomic():
+        names = (
+            Recipe.objects.exclude(image__isnull=True).exclude(image='')
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        ImageBlob.objects.bulk_create(
+            [ImageBlob(name=name) for name in names],
+            ignore_conflicts=True,
+        )
+        refs = Subquery(
+            Recipe.objects.filter(image=OuterRef('pk')).order_by()
+            .values('image').annotate(refs=Count('*')).values('refs')
+        )
+        return ImageBlob.objects.update(ref_count=Coalesce(refs, 0))
+
+
+def _stale(name, cutoff):
+    """size of the file when unused since cutoff, None otherwise"""
+    try:
+        stat = os.stat(recipe_image_storage.path(name))
+    except FileNotFoundError:
+        return 0
+    if stat.st_mtime > cutoff.timestamp():
+        return None
+    return stat.st_size
+
+
+def collect_garbage(grace=None, dry_run=False):
+    """
+    delete the unreferenced blobs and the blob files without a row, both
+    unused for grace seconds. Return {'blobs', 'files', 'bytes'}
+    """
+    if grace is None:
+        grace = settings.IMAGE_BLOB_GC_GRACE
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    collected = {'blobs': 0, 'files': 0, 'bytes': 0}
+
+    unreferenced = (
+        ImageBlob.objects.filter(ref_count__lte=0, updated__lt=cutoff)
+        .filter(~Exists(Recipe.objects.filter(image=OuterRef('pk'))))
+        .values_list('name', flat=True)
+    )
+    for name in list(unreferenced):
+        size = _stale(name, cutoff)
+        if size is None:
+            continue
+        if not dry_run:
+            # a recipe referencing it since the query keeps the row
+            deleted, _ = ImageBlob.objects.filter(
+                name=name, ref_count__lte=0).delete()
+            if not deleted:
+                continue
+            # a new upload of the bytes since _stale recreates the row
+            if not recipe_image_storage.delete_blob(name, cutoff):
+                continue
+        collected['blobs'] += 1
+        collected['bytes'] += size
+
+    # files of rolled back uploads never got a row, files of killed
+    # writers never got a name
+    try:
+        _, files = recipe_image_storage.listdir(BLOB_DIR)
+    except FileNotFoundError:
+        files = []
+    names = [
+        os.path.join(BLOB_DIR, filename) for filename in files
+        if BLOB_NAME.match(filename) or TEMP_NAME.match(filename)
+    ]
+    known = set(
+        ImageBlob.objects.filter(name__in=names)
+        .values_list('name', flat=True)
+    )
+    for name in names:
+        if name in known:
+            continue
+        size = _stale(name, cutoff)
+        if size is None:
+            continue
+        if not dry_run and not recipe_image_storage.delete_blob(name, cutoff):
+            continue
+        collected['files'] += 1
+        collected['bytes'] += size
+    return collected
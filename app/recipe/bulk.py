@@ -0,0 +1,113 @@
+"""
+Set-based batch writes of tags and ingredients
+
+Every action runs a fixed number of statements whatever the number of
+rows, inside one transaction. Deleting through the ORM would load each
+row to send its delete signals, so the signal work, search vectors,
+usage rollups and the list cache, is done here once per batch instead.
+"""
+import uuid
+from django.db import connection, transaction
+from django.db.models import Case, CharField, Value, When
+from django.db.models.functions import Cast, Concat
+from core.models import Recipe
+from recipe import stats
+from recipe.cache import bump_user_cache
+from recipe.search import update_search_vectors
+
+BULK_MAX_ITEMS = 1000
+
+# attribute model: (usage model, link table, link column)
+ATTRS = {
+    model: (usage, getattr(Recipe, field).through, column)
+    for usage, (field, model, column) in stats.LINKS.items()
+}
+
+
+def _linked_recipes(model, ids):
+    _, through, column = ATTRS[model]
+    return list(
+        through.objects.filter(**{f'{column}__in': ids})
+        .values_list('recipe_id', flat=True).distinct()
+    )
+
+
+def _delete_attrs(model, ids):
+    """delete the rows with their links and usage, return the links deleted"""
+    usage, through, column = ATTRS[model]
+    links, _ = through.objects.filter(**{f'{column}__in': ids}).delete()
+    usage.objects.filter(pk__in=ids).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {model._meta.db_table} WHERE id = ANY(%s)',
+            [list(ids)],
+        )
+        return cursor.rowcount, links
+
+
+def bulk_rename(model, user, names):
+    """
+    apply {id: name} in two UPDATEs. The rows first move to temporary
+    names, so swaps and chains within the batch never collide with each
+    other on the unique (user, name) constraint
+    """
+    rows = model.objects.filter(user=user, id__in=names)
+    with transaction.atomic():
+        rows.update(name=Concat(Value(f'rename-{uuid.uuid4().hex}-'),
+                                Cast('id', CharField())))
+        renamed = rows.update(
+            name=Case(
+                *[When(id=pk, then=Value(name)) for pk, name in names.items()]
+            )
+        )
+        recipe_ids = _linked_recipes(model, list(names))
+        update_search_vectors(recipe_ids)
+    bump_user_cache(user.id)
+    return {'renamed': renamed, 'recipes_reindexed': len(recipe_ids)}
+
+
+def bulk_delete(model, user, ids):
+    """delete the user's rows among ids, unknown ids are skipped"""
+    with transaction.atomic():
+        ids = list(
+            model.objects.filter(user=user, id__in=ids)
+            .values_list('id', flat=True)
+        )
+        recipe_ids = _linked_recipes(model, ids)
+        deleted, links = _delete_attrs(model, ids)
+        update_search_vectors(recipe_ids)
+    bump_user_cache(user.id)
+    return {
+        'deleted': deleted,
+        'links_removed': links,
+        'recipes_reindexed': len(recipe_ids),
+    }
+
+
+def merge(model, user, target, sources):
+    """
+    link the recipes of sources to target and delete sources, recipes
+    linked to both keep a single link
+    """
+    usage, through, column = ATTRS[model]
+    with transaction.atomic():
+        recipe_ids = _linked_recipes(model, sources)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {through._meta.db_table} (recipe_id, {column}) '
+                f'SELECT DISTINCT recipe_id, %s '
+                f'FROM {through._meta.db_table} WHERE {column} = ANY(%s) '
+                f'ON CONFLICT (recipe_id, {column}) DO NOTHING',
+                [target, list(sources)],
+            )
+            moved = cursor.rowcount
+        merged, links = _delete_attrs(model, sources)
+        stats.add_links(usage, user.id, {target: moved})
+        update_search_vectors(recipe_ids)
+    bump_user_cache(user.id)
+    return {
+        'merged': merged,
+        'links_moved': moved,
+        'links_removed': links,
+        'recipes_reindexed': len(recipe_ids),
+    }
@@ -0,0 +1,88 @@
+"""
+Per-user response cache for list endpoints
+
+Each user has a version token stored in the cache. Cached responses and
+ETags embed the token, so any write by the user (see recipe.signals)
+invalidates all of them at once by replacing the token.
+"""
+import hashlib
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from core.metrics import cache_lookup
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'api:version:{user_id}'
+
+
+def user_cache_version(user_id):
+    cache = get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        # keep a concurrent writer's token if it got there first
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def bump_user_cache(user_id):
+    """invalidate every cached response of the user"""
+    get_cache().set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+class CachedListMixin:
+    """serve list responses from the per-user cache with ETag support"""
+
+    def list_cache_enabled(self):
+        return True
+
+    def list_cache_timeout(self):
+        return settings.API_CACHE_TIMEOUT
+
+    def _list_cache_key(self, request):
+        version = user_cache_version(request.user.id)
+        # pagination links are absolute, so the scheme and host the page
+        # was requested through are part of it, and the ETag covers the
+        # negotiated representation
+        variant = hashlib.md5('|'.join([
+            request.build_absolute_uri(),
+            request.accepted_media_type,
+        ]).encode('utf-8')).hexdigest()
+        return f'api:list:{request.user.id}:{version}:{variant}'
+
+    def _finalize(self, response, etag):
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if not self.list_cache_enabled():
+            return super().list(request, *args, **kwargs)
+
+        key = self._list_cache_key(request)
+        etag = quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            cache_lookup('api_list', True)
+            return self._finalize(
+                Response(status=status.HTTP_304_NOT_MODIFIED), etag
+            )
+
+        cache = get_cache()
+        data = cache.get(key)
+        cache_lookup('api_list', data is not None)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            cache.set(key, response.data, self.list_cache_timeout())
+            return self._finalize(response, etag)
+        return self._finalize(Response(data), etag)
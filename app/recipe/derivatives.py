@@ -0,0 +1,169 @@
+"""
+On-demand resized recipe images
+
+/api/recipe/images/<name>?w=&h=&format= serves the original image <name>
+scaled to fit w x h. Only the IMAGE_DERIVATIVE_SIZES boxes and the
+rendition formats are accepted, so the number of derivatives per image
+is bounded. A derivative is generated on first request and kept in
+MEDIA_ROOT/derivatives. That directory is an LRU bounded to
+IMAGE_DERIVATIVE_CACHE_BYTES: hits refresh the file's mtime, and when a
+worker's running total exceeds the bound the directory is rescanned and
+the least recently used files are removed.
+
+Upload names are the hash of their content, or random for older uploads,
+and a name is never rewritten, so a derivative URL always returns the
+same bytes and is cached as immutable.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from io import BytesIO
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from recipe.images import _encode, _formats
+from recipe.uploads import check_image
+
+# content hash names of core.storage, random names of older uploads
+ORIGINAL_NAME = re.compile(
+    r'^uploads/recipe/([0-9a-f]{64}|[0-9a-f-]{36})\.[A-Za-z0-9]+$')
+DERIVATIVES_DIR = 'derivatives'
+# trimmed to this share of the bound so eviction does not run every write
+EVICTION_TARGET = 0.9
+
+CONTENT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+
+class DerivativeError(ValueError):
+    """invalid derivative parameters"""
+
+
+def allowed_sizes():
+    return [f'{width}x{height}' for width, height in
+            settings.IMAGE_DERIVATIVE_SIZES]
+
+
+def parse(width, height, image_format):
+    """(width, height, format) of validated query parameters"""
+    try:
+        size = (int(width), int(height))
+    except (TypeError, ValueError):
+        size = None
+    if size not in settings.IMAGE_DERIVATIVE_SIZES:
+        raise DerivativeError(
+            'w and h must be one of ' + ', '.join(allowed_sizes()))
+    image_format = (image_format or 'jpeg').lower()
+    if image_format not in _formats():
+        raise DerivativeError(
+            'format must be one of ' + ', '.join(_formats()))
+    return size[0], size[1], image_format
+
+
+def _cache_dir():
+    return os.path.join(settings.MEDIA_ROOT, DERIVATIVES_DIR)
+
+
+def derivative_key(name, width, height, image_format):
+    return hashlib.sha256(
+        f'{name}:{width}x{height}:{image_format}'.encode()
+    ).hexdigest()
+
+
+def _path(key, image_format):
+    return os.path.join(_cache_dir(), key[:2], f'{key}.{image_format}')
+
+
+class DiskLRU:
+    """size accounting of the derivatives directory, shared by threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._total = None
+
+    def _scan(self):
+        """[(mtime, size, path)] of every cached file"""
+        entries = []
+        for root, _, files in os.walk(_cache_dir()):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def added(self, size):
+        """account a new file, evict when the bound is exceeded"""
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._scan())
+            else:
+                self._total += size
+            if self._total > settings.IMAGE_DERIVATIVE_CACHE_BYTES:
+                self._evict()
+
+    def _evict(self):
+        # other workers write to the same directory, start from the disk
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = settings.IMAGE_DERIVATIVE_CACHE_BYTES * EVICTION_TARGET
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total = total
+
+    def reset(self):
+        with self._lock:
+            self._total = None
+
+
+lru = DiskLRU()
+
+
+def _render(name, width, height, image_format):
+    with default_storage.open(name, 'rb') as source:
+        with Image.open(source) as original:
+            check_image(original)
+            original.draft('RGB', (width, height))
+            image = ImageOps.exif_transpose(original)
+            image.thumbnail((width, height), Image.LANCZOS)
+            return _encode(image, _formats()[image_format]).read()
+
+
+def get_derivative(name, width, height, image_format):
+    """
+    (key, open file, hit) of the derivative, generated and cached on a
+    miss. Raise FileNotFoundError for unknown images
+    """
+    if not ORIGINAL_NAME.match(name):
+        raise FileNotFoundError(name)
+    key = derivative_key(name, width, height, image_format)
+    path = _path(key, image_format)
+    try:
+        # an open file survives eviction, the mtime orders the LRU
+        cached = open(path, 'rb')
+        os.utime(cached.fileno())
+        return key, cached, True
+    except FileNotFoundError:
+        pass
+
+    if not default_storage.exists(name):
+        raise FileNotFoundError(name)
+    content = _render(name, width, height, image_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # concurrent misses each write a complete file, the last rename wins
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as temp:
+        temp.write(content)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+    lru.added(len(content))
+    return key, BytesIO(content), False
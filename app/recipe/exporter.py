@@ -0,0 +1,46 @@
+"""
+Memory-bounded recipe export
+"""
+from django.db import connections
+from django.db.models import prefetch_related_objects
+
+
+def _iter_by_ids(queryset, chunk_size):
+    """
+    without server-side cursors iterator() fetches the whole result at
+    once, read the ordered ids first and the recipes one chunk at a time
+    """
+    ids = list(queryset.values_list('pk', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        recipes = queryset.order_by().filter(pk__in=chunk).in_bulk()
+        yield from (recipes[pk] for pk in chunk if pk in recipes)
+
+
+def iter_recipes(queryset, chunk_size):
+    settings_dict = connections[queryset.db].settings_dict
+    if settings_dict['DISABLE_SERVER_SIDE_CURSORS']:
+        return _iter_by_ids(queryset, chunk_size)
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def iter_recipe_batches(queryset, lookups, chunk_size=500):
+    """
+    walk queryset through a server-side cursor and prefetch lookups one
+    batch at a time, iterator() alone would drop the prefetches
+    """
+    batch = []
+    for recipe in iter_recipes(queryset, chunk_size):
+        batch.append(recipe)
+        if len(batch) == chunk_size:
+            prefetch_related_objects(batch, *lookups)
+            yield batch
+            batch = []
+    if batch:
+        prefetch_related_objects(batch, *lookups)
+        yield batch
+
+
+def iter_export_rows(queryset, lookups, serializer_class, chunk_size=500):
+    for batch in iter_recipe_batches(queryset, lookups, chunk_size):
+        yield from serializer_class(batch, many=True).data
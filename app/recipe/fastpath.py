@@ -0,0 +1,118 @@
+"""
+Read-only fast path for recipe list and retrieve
+
+Rows are fetched with .values() and their tags and ingredients with one
+query per relation over the through table, then assembled into the same
+dicts RecipeSerializer/RecipeDetailSerializer produce, without creating
+model or serializer instances. The tests check that both render to the
+same bytes.
+"""
+from decimal import Decimal
+from operator import itemgetter
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from core.middleware import serializing
+from core.models import Recipe
+from recipe import serializers
+from recipe.filters import _through
+from recipe.sparse import RELATIONS, columns
+
+LIST_FIELDS = serializers.RecipeSerializer.Meta.fields
+DETAIL_FIELDS = serializers.RecipeDetailSerializer.Meta.fields
+
+_price = Recipe._meta.get_field('price')
+_PRICE_EXPONENT = Decimal(1).scaleb(-_price.decimal_places)
+
+
+def _format_price(value):
+    """same string as DRF's DecimalField with COERCE_DECIMAL_TO_STRING"""
+    return '{:f}'.format(value.quantize(_PRICE_EXPONENT))
+
+
+def related_names(field, recipe_ids):
+    """{recipe id: [{'id', 'name'}]} in one query, ordered by id"""
+    through, column = _through(field)
+    related = column[:-len('_id')]
+    pairs = through.objects.filter(recipe_id__in=recipe_ids).order_by(
+        column).values_list('recipe_id', column, f'{related}__name')
+    names = {}
+    for recipe_id, pk, name in pairs:
+        names.setdefault(recipe_id, []).append({'id': pk, 'name': name})
+    return names
+
+
+def values(queryset, detail=False, fields=None):
+    """
+    .values() of the serialized fields, annotations such as the search
+    rank are kept for the cursor paginator
+    """
+    fields = fields or (DETAIL_FIELDS if detail else LIST_FIELDS)
+    return queryset.values(*columns(fields), *queryset.query.annotations)
+
+
+def _getters(fields, related, request):
+    """(name, function of a row) producing each serialized field"""
+    getters = []
+    for name in fields:
+        if name in related:
+            names = related[name]
+            getters.append((name, lambda row, names=names: names.get(
+                row['id'], [])))
+        elif name == 'price':
+            getters.append((name, lambda row: _format_price(row['price'])))
+        elif name == 'image_renditions':
+            getters.append((name, lambda row: serializers.rendition_urls(
+                row['image_renditions'], request)))
+        else:
+            getters.append((name, itemgetter(name)))
+    return getters
+
+
+def recipe_rows(rows, request=None, detail=False, fields=None):
+    """serializer output for rows from values() of the same fields"""
+    with serializing():
+        rows = list(rows)
+        fields = fields or (DETAIL_FIELDS if detail else LIST_FIELDS)
+        ids = [row['id'] for row in rows]
+        related = {
+            field: related_names(field, ids)
+            for field in RELATIONS if field in fields
+        }
+        getters = _getters(fields, related, request)
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+
+class FastReadMixin:
+    """serve fast_read_actions from recipe_rows instead of serializers"""
+
+    fast_read_actions = ['list', 'retrieve']
+
+    def selected_fields(self):
+        """fields to render, None for all of them"""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        if self.action not in self.fast_read_actions:
+            return super().list(request, *args, **kwargs)
+        fields = self.selected_fields()
+        queryset = values(
+            self.filter_queryset(self.get_queryset()), fields=fields)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(recipe_rows(queryset, request, fields=fields))
+        return self.get_paginated_response(
+            recipe_rows(page, request, fields=fields))
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.action not in self.fast_read_actions:
+            return super().retrieve(request, *args, **kwargs)
+        fields = self.selected_fields()
+        queryset = values(
+            self.filter_queryset(self.get_queryset()),
+            detail=True, fields=fields)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, row)
+        return Response(
+            recipe_rows([row], request, detail=True, fields=fields)[0])
@@ -0,0 +1,37 @@
+"""
+Semi-join filters over the recipe M2M through tables
+"""
+from django.db.models import Count, Exists, OuterRef
+from core.models import Recipe
+
+
+def _through(field):
+    """through model and its column pointing at the related object"""
+    through = getattr(Recipe, field).through
+    related = Recipe._meta.get_field(field).related_model
+    return through, f'{related._meta.model_name}_id'
+
+
+def linked_to(field, ids, match_all=False):
+    """
+    filter expression for recipes linked through field to any of ids, or
+    to every one of them when match_all is set. Unlike a join it never
+    multiplies recipe rows, so no DISTINCT is needed afterwards
+    """
+    through, column = _through(field)
+    links = through.objects.filter(**{f'{column}__in': ids})
+    if match_all:
+        complete = (
+            links.values('recipe_id')
+            .annotate(matched=Count(column))
+            .filter(matched=len(set(ids)))
+            .values('recipe_id')
+        )
+        return Exists(complete.filter(recipe_id=OuterRef('pk')))
+    return Exists(links.filter(recipe_id=OuterRef('pk')))
+
+
+def assigned_to_recipe(field):
+    """filter expression for tags/ingredients used by at least one recipe"""
+    through, column = _through(field)
+    return Exists(through.objects.filter(**{column: OuterRef('pk')}))
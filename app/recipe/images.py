@@ -0,0 +1,142 @@
+"""
+Background generation of resized recipe image renditions
+
+Uploads are stored as-is by the request and handed to a small thread pool
+once the transaction commits. Workers write WebP/JPEG renditions without
+EXIF next to the original and record them on the recipe, the renditions
+of the previous image are deleted only after that.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+from core.models import Recipe
+from recipe.uploads import check_image
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'thumbnail': (200, 200),
+    'medium': (800, 800),
+    'large': (1600, 1600),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _formats():
+    formats = {'jpeg': 'JPEG'}
+    if features.check('webp'):
+        formats['webp'] = 'WEBP'
+    return formats
+
+
+def _get_executor():
+    """lazily created so every forked uWSGI worker gets its own pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                thread_name_prefix='recipe-image',
+            )
+        return _executor
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    # no exif argument, so none of the original metadata is written
+    image.save(buffer, format=image_format, quality=85, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def render(source):
+    """yield (rendition, extension, file) for an open image file"""
+    with Image.open(source) as original:
+        check_image(original)
+        # JPEGs decode at a reduced scale that still covers the largest box
+        original.draft('RGB', max(RENDITIONS.values()))
+        image = ImageOps.exif_transpose(original)
+        for rendition, size in RENDITIONS.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            for extension, image_format in _formats().items():
+                yield rendition, extension, _encode(resized, image_format)
+
+
+def delete_renditions(renditions):
+    for names in renditions.values():
+        for name in names.values():
+            default_storage.delete(name)
+
+
+def process_recipe_image(recipe_id, previous_renditions=None):
+    """
+    create renditions for the recipe's current image. The ones they
+    replace, on the recipe or taken off it by the upload, are deleted once
+    the new set is recorded
+    """
+    previous_renditions = previous_renditions or {}
+    recipe = Recipe.objects.filter(id=recipe_id).first()
+    if recipe is None or not recipe.image:
+        delete_renditions(previous_renditions)
+        return
+    source_name = recipe.image.name
+    previous = recipe.image_renditions
+    base = os.path.splitext(source_name)[0]
+    renditions = {}
+    status = Recipe.ImageStatus.READY
+    try:
+        with recipe.image.open('rb') as source:
+            for rendition, extension, content in render(source):
+                renditions.setdefault(rendition, {})[extension] = (
+                    default_storage.save(
+                        f'{base}_{rendition}.{extension}', content
+                    )
+                )
+    except Exception:
+        logger.exception('processing image of recipe %s failed', recipe_id)
+        status = Recipe.ImageStatus.FAILED
+        # never record a partial set
+        delete_renditions(renditions)
+        renditions = {}
+
+    # the image may have been replaced while we were working, the upload
+    # replacing it took over the renditions on the recipe
+    updated = Recipe.objects.filter(id=recipe_id, image=source_name).update(
+        image_status=status, image_renditions=renditions,
+    )
+    # workers run outside transactions, the update is committed
+    delete_renditions(previous if updated else renditions)
+    delete_renditions(previous_renditions)
+
+
+def _run(recipe_id, previous_renditions):
+    try:
+        process_recipe_image(recipe_id, previous_renditions)
+    finally:
+        connection.close()
+
+
+def schedule_processing(recipe, previous_renditions=None):
+    """
+    process the recipe image after the current transaction commits, in the
+    pool or inline when IMAGE_PROCESSING_EAGER is set
+    """
+    def submit():
+        # previous_renditions are deleted once their replacements exist
+        if settings.IMAGE_PROCESSING_EAGER:
+            process_recipe_image(recipe.id, previous_renditions)
+        else:
+            _get_executor().submit(_run, recipe.id, previous_renditions)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,174 @@
+"""
+Bulk recipe import from NDJSON or JSON array bodies
+"""
+import codecs
+import json
+import re
+from collections import Counter
+from itertools import islice
+from django.db import transaction
+from django.utils.translation import gettext as _
+from core.models import Recipe, Tag, Ingredient, TagUsage, IngredientUsage
+from recipe.serializers import RecipeDetailSerializer
+from recipe.search import update_search_vectors
+from recipe import stats
+
+READ_SIZE = 64 * 1024
+MAX_ROW_SIZE = 1024 * 1024
+MAX_REPORTED_ERRORS = 1000
+
+_ARRAY_SEPARATOR = re.compile(r'[\s,]*')
+
+
+def _read_chunks(stream):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        data = stream.read(READ_SIZE) if stream is not None else b''
+        if not data:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+            return
+        yield decoder.decode(data)
+
+
+def _iter_lines(chunks, buf):
+    """yield the lines, None for each line longer than MAX_ROW_SIZE"""
+    oversize = False
+    while buf is not None:
+        *lines, rest = buf.split('\n')
+        if lines and oversize:
+            # the first line is the end of the oversize one
+            lines[0], oversize = None, False
+        yield from lines
+        if oversize or len(rest) > MAX_ROW_SIZE:
+            # drop it up to the next newline
+            oversize, rest = True, ''
+        chunk = next(chunks, None)
+        buf = rest + chunk if chunk is not None else None
+    yield None if oversize else rest
+
+
+def _iter_array(chunks, buf):
+    decoder = json.JSONDecoder()
+    pos = buf.index('[') + 1
+    while True:
+        pos = _ARRAY_SEPARATOR.match(buf, pos).end()
+        if buf[pos:pos + 1] == ']':
+            return
+        try:
+            row, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            chunk = next(chunks, None)
+            if chunk is None or len(buf) - pos > MAX_ROW_SIZE:
+                # an array cannot be resynchronised after a bad element
+                yield None, _('invalid JSON')
+                return
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield row, None
+
+
+def iter_rows(stream):
+    """
+    yield (row, error) pairs from an NDJSON or JSON array stream while
+    holding at most one read chunk plus one row in memory
+    """
+    chunks = _read_chunks(stream)
+    for first in chunks:
+        if first.strip():
+            break
+    else:
+        return
+
+    if first.lstrip().startswith('['):
+        yield from _iter_array(chunks, first)
+        return
+
+    for line in _iter_lines(chunks, first):
+        if line is None:
+            yield None, _('row too large')
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError:
+            yield None, _('invalid JSON')
+
+
+def _link(recipes, rows, field, model):
+    """link the recipes, return a Counter of linked recipes per attribute"""
+    user = recipes[0].user
+    objs = model.objects.get_or_create_many(
+        user, [item['name'] for row in rows for item in row.get(field, [])]
+    )
+    links = [
+        (recipe.id, pk)
+        for recipe, row in zip(recipes, rows)
+        for pk in {objs[item['name']].id for item in row.get(field, [])}
+    ]
+    through = getattr(Recipe, field).through
+    fk = f'{model._meta.model_name}_id'
+    through.objects.bulk_create(
+        [through(recipe_id=recipe_id, **{fk: pk}) for recipe_id, pk in links],
+        ignore_conflicts=True,
+    )
+    return Counter(pk for _, pk in links)
+
+
+@transaction.atomic
+def _create_chunk(user, rows):
+    recipes = Recipe.objects.bulk_create([
+        Recipe(user=user, **{
+            key: value for key, value in row.items()
+            if key not in ('tags', 'ingredients')
+        })
+        for row in rows
+    ])
+    tag_links = _link(recipes, rows, 'tags', Tag)
+    ingredient_links = _link(recipes, rows, 'ingredients', Ingredient)
+    # bulk inserts bypass the signals that maintain the search vectors and
+    # the statistics
+    update_search_vectors(recipe.id for recipe in recipes)
+    stats.add_recipes(user.id, map(stats.recipe_values, recipes))
+    stats.add_links(TagUsage, user.id, tag_links)
+    stats.add_links(IngredientUsage, user.id, ingredient_links)
+    return len(recipes)
+
+
+def import_recipes(rows, context, chunk_size=500):
+    """
+    validate and insert (row, error) pairs chunk by chunk, return a summary
+    with the number of created recipes and the per-row errors
+    """
+    user = context['request'].user
+    summary = {'created': 0, 'failed': 0, 'errors': []}
+    numbered = enumerate(rows)
+
+    def fail(index, errors):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'row': index, 'errors': errors})
+
+    # the statistics of all chunks are applied in one statement at the end
+    with stats.deferred():
+        while True:
+            chunk = list(islice(numbered, chunk_size))
+            if not chunk:
+                return summary
+
+            valid = []
+            for index, (row, error) in chunk:
+                if error:
+                    fail(index, {'non_field_errors': [error]})
+                    continue
+                serializer = RecipeDetailSerializer(data=row, context=context) # noqa
+                if serializer.is_valid():
+                    valid.append(serializer.validated_data)
+                else:
+                    fail(index, serializer.errors)
+
+            if valid:
+                summary['created'] += _create_chunk(user, valid)
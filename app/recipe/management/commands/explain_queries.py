@@ -0,0 +1,87 @@
+""" Django EXPLAIN ANALYZE the canonical recipe API queries """
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from benchmarks.utils import view_queryset
+from core.models import Tag, Ingredient
+from recipe import views
+
+
+class Command(BaseCommand):
+    """ print query plans for the list endpoints of one user """
+
+    help = 'EXPLAIN ANALYZE the querysets behind the recipe list endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            help='user to run the queries as, defaults to the user '
+                 'with the most recipes',
+        )
+        parser.add_argument(
+            '--no-analyze',
+            action='store_true',
+            help='plan only, do not execute the queries',
+        )
+
+    def _get_user(self, email):
+        users = get_user_model().objects
+        if email:
+            try:
+                return users.get(email=email)
+            except users.model.DoesNotExist:
+                raise CommandError(f'no user with email {email}')
+        user = users.annotate(total=Count('recipe')).order_by('-total').first() # noqa
+        if user is None:
+            raise CommandError('no users in database')
+        return user
+
+    def _view_queryset(self, viewset, user, params):
+        """the first page of the list action's queryset"""
+        view, queryset = view_queryset(viewset, user, params)
+        return queryset[:view.pagination_class.page_size]
+
+    def _queries(self, user):
+        tag_ids = ','.join(
+            str(pk) for pk in
+            Tag.objects.filter(user=user).values_list('id', flat=True)[:3]
+        )
+        ingredient_ids = ','.join(
+            str(pk) for pk in
+            Ingredient.objects.filter(user=user).values_list('id', flat=True)[:3] # noqa
+        )
+        recipes = self._view_queryset(views.RecipeViewSet, user, {})
+        yield 'recipe list', recipes
+        if tag_ids:
+            yield 'recipe list ?tags', self._view_queryset(
+                views.RecipeViewSet, user, {'tags': tag_ids})
+        if ingredient_ids:
+            yield 'recipe list ?ingredients', self._view_queryset(
+                views.RecipeViewSet, user, {'ingredients': ingredient_ids})
+        if tag_ids and ingredient_ids:
+            yield 'recipe list ?tags&ingredients', self._view_queryset(
+                views.RecipeViewSet, user,
+                {'tags': tag_ids, 'ingredients': ingredient_ids})
+
+        page_ids = list(recipes.values_list('id', flat=True))
+        yield 'recipe list tags prefetch', Tag.objects.filter(
+            recipe__id__in=page_ids).only('id', 'name')
+        yield 'recipe list ingredients prefetch', Ingredient.objects.filter(
+            recipe__id__in=page_ids).only('id', 'name')
+
+        for name, viewset in [('tag', views.TagViewSet),
+                              ('ingredient', views.IngredientViewSet)]:
+            yield f'{name} list', self._view_queryset(viewset, user, {})
+            yield f'{name} list ?assigned_only', self._view_queryset(
+                viewset, user, {'assigned_only': 1})
+
+    def handle(self, *args, **options):
+        """ Entry for command """
+        user = self._get_user(options['email'])
+        analyze = not options['no_analyze']
+        self.stdout.write(f'Explaining queries for {user.email}')
+
+        for title, queryset in self._queries(user):
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{title}'))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(analyze=analyze))
@@ -0,0 +1,40 @@
+""" Django delete unreferenced recipe image blobs """
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipe.blobs import collect_garbage, recount
+
+
+class Command(BaseCommand):
+    """ remove stored recipe images no recipe references any more """
+
+    help = 'Delete recipe image files that no recipe references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.IMAGE_BLOB_GC_GRACE,
+            help='seconds a file must be unused before it is deleted',
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='rebuild the reference counts from the recipes first',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='report what would be deleted without deleting it',
+        )
+
+    def handle(self, *args, **options):
+        """ Entry for command """
+        if options['recount']:
+            self.stdout.write(f' {recount()} blobs recounted')
+
+        collected = collect_garbage(options['grace'], options['dry_run'])
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {collected["blobs"]} unreferenced blobs and '
+            f'{collected["files"]} untracked files, '
+            f'{collected["bytes"]} bytes'
+        ))
@@ -0,0 +1,34 @@
+""" Django generate missing recipe image renditions """
+from django.core.management.base import BaseCommand
+from core.models import Recipe
+from recipe.images import process_recipe_image
+
+
+class Command(BaseCommand):
+    """ process images that have no renditions yet """
+
+    help = 'Generate renditions for recipe images that are not ready'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='regenerate renditions of every recipe image',
+        )
+
+    def handle(self, *args, **options):
+        """ Entry for command """
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.exclude(image_status=Recipe.ImageStatus.READY)
+
+        ids = list(recipes.values_list('id', flat=True))
+        self.stdout.write(f'Processing {len(ids)} recipe images')
+        for recipe_id in ids:
+            process_recipe_image(recipe_id)
+        failed = Recipe.objects.filter(
+            id__in=ids, image_status=Recipe.ImageStatus.FAILED
+        ).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Done, {len(ids) - failed} ready, {failed} failed'
+        ))
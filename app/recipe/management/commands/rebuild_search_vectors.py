@@ -0,0 +1,40 @@
+""" Django rebuild recipe full-text search vectors """
+from django.core.management.base import BaseCommand
+from core.models import Recipe
+from recipe.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    """ recompute Recipe.search_vector in id batches """
+
+    help = 'Recompute the full-text search vector of every recipe'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='only recipes that have no search vector yet',
+        )
+
+    def handle(self, *args, **options):
+        """ Entry for command """
+        recipes = Recipe.objects.order_by('id')
+        if options['missing']:
+            recipes = recipes.filter(search_vector=None)
+
+        # keyset batches, every UPDATE is its own short transaction
+        last_id, total = 0, 0
+        while True:
+            ids = list(
+                recipes.filter(id__gt=last_id)
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            update_search_vectors(ids)
+            last_id = ids[-1]
+            total += len(ids)
+            self.stdout.write(f' {total} recipes indexed')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} search vectors')) # noqa
@@ -0,0 +1,37 @@
+""" Django recompute the recipe statistics rollups """
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from recipe.stats import recompute
+
+
+class Command(BaseCommand):
+    """ rebuild RecipeStats and tag/ingredient usage in user batches """
+
+    help = 'Recompute the per-user recipe statistics from the recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='users per transaction')
+
+    def handle(self, *args, **options):
+        """ Entry for command """
+        users = get_user_model().objects.order_by('id')
+
+        # keyset batches, every batch is its own short transaction
+        last_id, total_users, total_recipes = 0, 0, 0
+        while True:
+            ids = list(
+                users.filter(id__gt=last_id)
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            total_recipes += recompute(ids)
+            last_id = ids[-1]
+            total_users += len(ids)
+            self.stdout.write(f' {total_users} users recomputed')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed statistics of {total_users} users, '
+            f'{total_recipes} recipes'
+        ))
@@ -0,0 +1,22 @@
+"""
+Keyset pagination for recipe APIs
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """page recipes by id, newest first, without OFFSET scans"""
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """page tags/ingredients by name, id breaks ties between equal names"""
+    ordering = ('-name', '-id')
+
+
+class RecipeSearchCursorPagination(RecipeCursorPagination):
+    """page search results by rank, best first"""
+    ordering = ('-rank', '-id')
@@ -0,0 +1,85 @@
+"""
+Renderers for recipe export formats and the JSON API
+"""
+import csv
+import json
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_json_encoder = JSONEncoder()
+
+CSV_HEADER = [
+    'id', 'title', 'description', 'time_minutes', 'price', 'link',
+    'tags', 'ingredients',
+]
+
+
+class _Echo:
+    """file-like object handing back whatever csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def iter_render(self, rows):
+        for row in rows:
+            yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            data = [data]
+        return ''.join(self.iter_render(data)).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def iter_render(self, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(CSV_HEADER)
+        for row in rows:
+            yield writer.writerow(
+                '|'.join(item['name'] for item in row[key])
+                if key in ('tags', 'ingredients') else row[key]
+                for key in CSV_HEADER
+            )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            data = [data]
+        return ''.join(self.iter_render(data)).encode(self.charset)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer output encoded by orjson, for the default compact unicode
+    JSON settings
+    """
+
+    def _use_orjson(self, accepted_media_type, renderer_context):
+        return (
+            self.compact and not self.ensure_ascii
+            and not self.get_indent(accepted_media_type, renderer_context)
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self._use_orjson(
+                accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        # let DRF's encoder format datetimes, as JSONRenderer would
+        ret = orjson.dumps(
+            data,
+            default=_json_encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+        # JSONRenderer escapes these, they are invalid in JavaScript strings
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,55 @@
+"""
+Full-text search over recipes
+
+Recipe.search_vector holds title (A), tag and ingredient names (B) and
+description (C). It is refreshed by recipe.signals when a write commits
+and can be rebuilt with the rebuild_search_vectors command.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast
+from core.models import Recipe, Tag, Ingredient
+
+SEARCH_CONFIG = 'english'
+
+
+def _names(model):
+    """space separated names of model rows linked to the outer recipe"""
+    return Subquery(
+        model.objects.filter(recipe=OuterRef('pk'))
+        .values('recipe')
+        .annotate(names=StringAgg('name', ' '))
+        .values('names')
+    )
+
+
+def search_vector():
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(_names(Tag), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_names(Ingredient), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipe_ids):
+    """recompute the vectors of the given recipes in one UPDATE"""
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            search_vector=search_vector()
+        )
+
+
+def search(queryset, text):
+    """filter queryset to matches of text, annotated with their rank"""
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        # ts_rank is a float4, widen it so cursor positions round-trip
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+    )
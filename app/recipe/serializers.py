@@ -1,22 +1,53 @@
 from rest_framework import serializers
+from django.core.files.storage import default_storage
+from django.utils.translation import gettext as _
+from drf_spectacular.utils import extend_schema_field
+from drf_spectacular.types import OpenApiTypes
 from core.models import Recipe, Tag, Ingredient
+from recipe.stats import deferred as deferred_stats
+from recipe.bulk import BULK_MAX_ITEMS
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class RecipeAttrSerializer(serializers.ModelSerializer):
+
+    def validate_name(self, value):
+        # nested under a recipe an existing name is reused, renaming onto
+        # one would break the (user, name) constraint
+        if self.instance is not None:
+            taken = type(self.instance).objects.filter(
+                user=self.instance.user, name=value,
+            ).exclude(id=self.instance.id)
+            if taken.exists():
+                raise serializers.ValidationError(_('name already exists'))
+        return value
+
+
+class IngredientSerializer(RecipeAttrSerializer):
     class Meta:
         model = Ingredient
         fields = ['id', 'name']
         read_only_fields = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(RecipeAttrSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
         read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """drop the fields not named in context['fields'], see recipe.sparse"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
 
@@ -27,24 +58,30 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def _get_or_create_tags(self, tags, recipe):
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
-            recipe.tags.add(tag_obj)
+        tag_objs = Tag.objects.get_or_create_many(
+            auth_user, [tag['name'] for tag in tags]
+        )
+        if tag_objs:
+            recipe.tags.add(*tag_objs.values())
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(user=auth_user, **ingredient) # noqa
-            recipe.ingredients.add(ingredient_obj)
+        ingredient_objs = Ingredient.objects.get_or_create_many(
+            auth_user, [ingredient['name'] for ingredient in ingredients]
+        )
+        if ingredient_objs:
+            recipe.ingredients.add(*ingredient_objs.values())
 
     def create(self, validated_data):
         """create recipe"""
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
 
-        recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        # the statistics of the recipe and its links in one statement
+        with deferred_stats():
+            recipe = Recipe.objects.create(**validated_data)
+            self._get_or_create_tags(tags, recipe)
+            self._get_or_create_ingredients(ingredients, recipe)
 
         return recipe
 
@@ -65,14 +102,150 @@ class RecipeSerializer(serializers.ModelSerializer):
         return instance
 
 
+def rendition_urls(renditions, request=None):
+    """{rendition: {format: url}} from stored rendition names"""
+    urls = {}
+    for rendition, names in renditions.items():
+        urls[rendition] = {}
+        for image_format, name in names.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[rendition][image_format] = url
+    return urls
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class ImageRenditionsField(serializers.Field):
+    """read-only rendition URLs, see rendition_urls"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return rendition_urls(value, self.context.get('request'))
+
+
 class RecipeDetailSerializer(RecipeSerializer):
+    image_renditions = ImageRenditionsField()
+
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image_status', 'image_renditions',
+        ]
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + [
+            'image_status',
+        ]
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
-        read_only_fields = ['id']
+        fields = ['id', 'image', 'image_status', 'image_renditions']
+        read_only_fields = ['id', 'image_status']
         extra_kwargs = {'image': {'required': 'True'}}
+
+
+class UsageSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class TimeMinutesStatsSerializer(serializers.Serializer):
+    avg = serializers.DecimalField(max_digits=10, decimal_places=1, allow_null=True) # noqa
+    min = serializers.IntegerField(allow_null=True)
+    max = serializers.IntegerField(allow_null=True)
+
+
+class PriceStatsSerializer(serializers.Serializer):
+    avg = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True) # noqa
+    min = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True) # noqa
+    max = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True) # noqa
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """read-only statistics of the user's recipes, see recipe.stats"""
+    recipe_count = serializers.IntegerField()
+    time_minutes = TimeMinutesStatsSerializer()
+    price = PriceStatsSerializer()
+    tags = UsageSerializer(many=True)
+    ingredients = UsageSerializer(many=True)
+
+
+class BulkAttrSerializer(serializers.Serializer):
+    """input of the batch actions on the tags or ingredients of the view"""
+
+    @property
+    def model(self):
+        return self.context['view'].queryset.model
+
+    def _check_owned(self, ids):
+        owned = set(
+            self.model.objects.filter(
+                user=self.context['request'].user, id__in=ids,
+            ).values_list('id', flat=True)
+        )
+        unknown = sorted(set(ids) - owned)
+        if unknown:
+            raise serializers.ValidationError(
+                _('unknown ids: %s') % ', '.join(map(str, unknown))
+            )
+
+
+class BulkRenameItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField(max_length=255)
+
+
+class BulkRenameSerializer(BulkAttrSerializer):
+    items = serializers.ListField(
+        child=BulkRenameItemSerializer(),
+        allow_empty=False, max_length=BULK_MAX_ITEMS,
+    )
+
+    def validate_items(self, items):
+        names = {item['id']: item['name'] for item in items}
+        if len(names) < len(items):
+            raise serializers.ValidationError(_('duplicate ids'))
+        if len(set(names.values())) < len(names):
+            raise serializers.ValidationError(_('duplicate names'))
+        self._check_owned(names)
+        taken = self.model.objects.filter(
+            user=self.context['request'].user, name__in=names.values(),
+        ).exclude(id__in=names)
+        if taken.exists():
+            # renaming onto an existing row is a merge
+            raise serializers.ValidationError(_('name already exists'))
+        return names
+
+
+class BulkDeleteSerializer(BulkAttrSerializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False, max_length=BULK_MAX_ITEMS,
+    )
+
+
+class MergeSerializer(BulkAttrSerializer):
+    target = serializers.IntegerField()
+    sources = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False, max_length=BULK_MAX_ITEMS,
+    )
+
+    def validate(self, attrs):
+        sources = set(attrs['sources'])
+        if attrs['target'] in sources:
+            raise serializers.ValidationError(
+                {'sources': _('target cannot be merged into itself')}
+            )
+        try:
+            self._check_owned(sources | {attrs['target']})
+        except serializers.ValidationError as error:
+            raise serializers.ValidationError({'sources': error.detail})
+        attrs['sources'] = sorted(sources)
+        return attrs
@@ -0,0 +1,273 @@
+"""
+Keep data derived from recipes in sync with writes: cached list responses,
+full-text search vectors, the statistics rollups and the image references
+
+Search vectors and cached responses are refreshed once per transaction
+when it commits, however many writes touched a recipe.
+"""
+import threading
+from django.db import transaction
+from django.db.models.signals import (
+    post_init,
+    pre_save,
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
+from django.dispatch import receiver
+from core.models import Recipe, Tag, Ingredient
+from recipe.cache import bump_user_cache
+from recipe.search import update_search_vectors
+from recipe import blobs, images, stats
+
+SEARCHED_RECIPE_FIELDS = {'title', 'description'}
+
+_local = threading.local()
+
+
+class _OnCommit:
+    """recipes to reindex and users to invalidate when the writes commit"""
+
+    def __init__(self):
+        self.recipe_ids = set()
+        self.user_ids = set()
+
+    def __call__(self):
+        if getattr(_local, 'on_commit', None) is self:
+            _local.on_commit = None
+        update_search_vectors(self.recipe_ids)
+        for user_id in self.user_ids:
+            bump_user_cache(user_id)
+
+
+def _queued(callback):
+    # dropped by a rollback of the transaction or savepoint queueing it
+    connection = transaction.get_connection()
+    return any(func is callback for _, func in connection.run_on_commit)
+
+
+def after_commit(recipe_ids=(), user_ids=()):
+    """reindex recipe_ids and invalidate user_ids once, on commit"""
+    on_commit = getattr(_local, 'on_commit', None)
+    queue = on_commit is None or not _queued(on_commit)
+    if queue:
+        on_commit = _local.on_commit = _OnCommit()
+    on_commit.recipe_ids.update(recipe_ids)
+    on_commit.user_ids.update(user_ids)
+    if queue:
+        # outside a transaction this runs right away
+        transaction.on_commit(on_commit)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_on_write(sender, instance, **kwargs):
+    after_commit(user_ids=[instance.user_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_link(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        after_commit(user_ids=[instance.user_id])
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCHED_RECIPE_FIELDS & set(update_fields):
+        return
+    after_commit(recipe_ids=[instance.id])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def index_renamed_attr(sender, instance, created, **kwargs):
+    if not created:
+        after_commit(
+            recipe_ids=instance.recipe_set.values_list('id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_attr_recipes(sender, instance, **kwargs):
+    # the links are gone by post_delete
+    instance._search_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def index_deleted_attr(sender, instance, **kwargs):
+    after_commit(recipe_ids=getattr(instance, '_search_recipe_ids', []))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def index_on_link(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            after_commit(recipe_ids=[instance.id])
+    elif action == 'pre_clear':
+        instance._search_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        after_commit(recipe_ids=instance._search_recipe_ids)
+    elif action in ('post_add', 'post_remove'):
+        after_commit(recipe_ids=pk_set)
+
+
+@receiver(pre_save, sender=Recipe)
+def collect_recipe_stats(sender, instance, update_fields=None, **kwargs):
+    instance._stats_previous = None
+    if instance._state.adding:
+        return
+    if update_fields and not set(stats.STATS_RECIPE_FIELDS) & set(update_fields): # noqa
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(name in loaded for name in stats.STATS_RECIPE_FIELDS):
+        instance._stats_previous = tuple(
+            loaded[name] for name in stats.STATS_RECIPE_FIELDS
+        )
+        return
+    # deferred when the recipe was loaded
+    instance._stats_previous = (
+        Recipe.objects.filter(pk=instance.pk)
+        .values_list(*stats.STATS_RECIPE_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def count_saved_recipe(sender, instance, created, update_fields=None,
+                       **kwargs):
+    current = stats.recipe_values(instance)
+    previous = getattr(instance, '_stats_previous', None)
+    if created:
+        stats.update_recipe_stats(instance.user_id, added=[current])
+    elif previous is None:
+        return
+    else:
+        if update_fields:
+            # fields left out keep their stored values
+            current = tuple(
+                value if name in update_fields else old
+                for name, value, old
+                in zip(stats.STATS_RECIPE_FIELDS, current, previous)
+            )
+        if previous != current:
+            stats.update_recipe_stats(
+                instance.user_id, added=[current], removed=[previous]
+            )
+    instance._loaded_values = {
+        **getattr(instance, '_loaded_values', {}),
+        **dict(zip(stats.STATS_RECIPE_FIELDS, current)),
+    }
+
+
+@receiver(pre_delete, sender=Recipe)
+def collect_recipe_links(sender, instance, **kwargs):
+    # the links are gone by post_delete
+    instance._stats_links = {
+        usage: list(
+            getattr(Recipe, field).through.objects
+            .filter(recipe_id=instance.id).values_list(column, flat=True)
+        )
+        for usage, (field, _, column) in stats.LINKS.items()
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    stats.update_recipe_stats(
+        instance.user_id, removed=[stats.recipe_values(instance)]
+    )
+    for usage, ids in getattr(instance, '_stats_links', {}).items():
+        stats.recount_links(usage, ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_links(sender, instance, action, reverse, pk_set, **kwargs):
+    usage = stats.USAGE_BY_THROUGH[sender]
+    # pk_set of post_add only holds new links, removals are recounted
+    if not reverse:
+        if action == 'post_add':
+            stats.add_links(usage, instance.user_id, dict.fromkeys(pk_set, 1))
+        elif action == 'post_remove':
+            stats.recount_links(usage, pk_set)
+        elif action == 'pre_clear':
+            _, _, column = stats.LINKS[usage]
+            instance._stats_cleared = list(
+                sender.objects.filter(recipe_id=instance.id)
+                .values_list(column, flat=True)
+            )
+        elif action == 'post_clear':
+            stats.recount_links(usage, instance._stats_cleared)
+    elif action == 'post_add':
+        stats.add_links(usage, instance.user_id, {instance.id: len(pk_set)})
+    elif action in ('post_remove', 'post_clear'):
+        stats.recount_links(usage, [instance.id])
+
+
+def _image_name(instance):
+    """stored name of the image, None when there is none or it is deferred"""
+    value = instance.__dict__.get('image')
+    return getattr(value, 'name', value) or None
+
+
+@receiver(post_init, sender=Recipe)
+def remember_recipe_image(sender, instance, **kwargs):
+    # a deferred image cannot be saved, its previous name is loaded when set
+    instance._blob_loaded = 'image' in instance.__dict__
+    instance._blob_name = _image_name(instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def collect_recipe_image(sender, instance, **kwargs):
+    if instance._state.adding or instance._blob_loaded:
+        return
+    if 'image' in instance.__dict__:
+        instance._blob_name = (
+            Recipe.objects.filter(pk=instance.pk)
+            .values_list('image', flat=True).first()
+        ) or None
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_refs(sender, instance, created, update_fields=None,
+                     **kwargs):
+    if 'image' not in instance.__dict__:
+        return
+    if update_fields and 'image' not in update_fields:
+        return
+    previous = None if created else instance._blob_name
+    current = _image_name(instance)
+    instance._blob_loaded, instance._blob_name = True, current
+    if previous != current:
+        blobs.add_refs({previous: -1, current: 1})
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image_ref(sender, instance, **kwargs):
+    blobs.add_refs({_image_name(instance): -1})
+
+
+@receiver(pre_delete, sender=Recipe)
+def collect_renditions(sender, instance, **kwargs):
+    # deferred fields cannot be loaded by post_delete
+    instance._renditions = instance.image_renditions
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_renditions(sender, instance, **kwargs):
+    # renditions belong to one recipe, unlike the blobs they are made of
+    renditions = getattr(instance, '_renditions', {})
+    if renditions:
+        transaction.on_commit(lambda: images.delete_renditions(renditions))
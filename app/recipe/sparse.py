@@ -0,0 +1,59 @@
+"""
+Sparse fieldsets for recipe reads
+
+fields= lists the fields to return, expand= the nested relations, tags and
+ingredients, to return with them. expand= alone returns every plain field
+and only the listed relations. Without either parameter every field is
+returned. Relations that are not returned are not queried and only the
+columns of the returned fields are loaded.
+"""
+from django.utils.translation import gettext as _
+from rest_framework.exceptions import ValidationError
+
+RELATIONS = ('tags', 'ingredients')
+
+
+def _names(request, param):
+    value = request.query_params.get(param, '')
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def _unknown(names, allowed):
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        return _('unknown fields: %s') % ', '.join(unknown)
+    return None
+
+
+def selected_fields(request, available):
+    """
+    requested names among available, in the order of available, None when
+    the request does not select fields
+    """
+    fields = _names(request, 'fields')
+    expand = _names(request, 'expand')
+    if not fields and not expand:
+        return None
+
+    errors = {
+        'fields': _unknown(fields, available),
+        'expand': _unknown(
+            expand, [name for name in RELATIONS if name in available]),
+    }
+    errors = {param: error for param, error in errors.items() if error}
+    if errors:
+        raise ValidationError(errors)
+
+    if fields:
+        wanted = set(fields) | set(expand)
+    else:
+        wanted = {name for name in available if name not in RELATIONS}
+        wanted.update(expand)
+    return [name for name in available if name in wanted]
+
+
+def columns(fields):
+    """model fields loaded for the selected fields, the id always is"""
+    return ['id'] + [
+        name for name in fields if name not in RELATIONS and name != 'id'
+    ]
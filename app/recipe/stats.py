@@ -0,0 +1,341 @@
+"""
+Per-user recipe statistics from materialized rollups
+
+RecipeStats holds the count, sums and bounds of time_minutes and price of
+a user's recipes, TagUsage and IngredientUsage the number of recipes
+linked to each tag and ingredient. recipe.signals applies every write as
+a delta, so reading the statistics is a primary key lookup plus one index
+scan per attribute. The recompute_recipe_stats command rebuilds the
+rollups from the recipes to repair drift.
+
+Additions, new recipes and links, are upserts that commute, so writes
+made inside deferred() are collected and applied in a single statement.
+Removals and changed values may move a bound and are applied at once.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Greatest, Least
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+    RecipeStats,
+    TagUsage,
+    IngredientUsage,
+)
+
+STATS_RECIPE_FIELDS = ('time_minutes', 'price')
+STATS_MAX_LIMIT = 50
+
+# usage model: (recipe m2m field, attribute model, through column)
+LINKS = {
+    TagUsage: ('tags', Tag, 'tag_id'),
+    IngredientUsage: ('ingredients', Ingredient, 'ingredient_id'),
+}
+USAGE_BY_THROUGH = {
+    getattr(Recipe, field).through: usage
+    for usage, (field, _, _) in LINKS.items()
+}
+
+
+def recipe_values(recipe):
+    """(time_minutes, price) of an instance as the database stores them"""
+    return tuple(
+        Recipe._meta.get_field(name).to_python(getattr(recipe, name))
+        for name in STATS_RECIPE_FIELDS
+    )
+
+
+def _bound(aggregate, field, user_id):
+    return Subquery(
+        Recipe.objects.filter(user_id=user_id).order_by()
+        .values('user_id').annotate(bound=aggregate(field))
+        .values('bound')
+    )
+
+
+def update_recipe_stats(user_id, added=(), removed=()):
+    """
+    apply removed and changed (time_minutes, price) values to the user's
+    totals in one UPDATE, called after the recipes were written
+    """
+    added, removed = list(added), list(removed)
+    if not removed:
+        add_recipes(user_id, added)
+        return
+
+    changes = {'recipe_count': F('recipe_count') + len(added) - len(removed)}
+    for index, field in enumerate(STATS_RECIPE_FIELDS):
+        new = [values[index] for values in added]
+        old = [values[index] for values in removed]
+        changes[f'{field}_sum'] = F(f'{field}_sum') + sum(new) - sum(old)
+        for suffix, aggregate, combine, pick in [
+            ('min', Min, Least, min),
+            ('max', Max, Greatest, max),
+        ]:
+            name = f'{field}_{suffix}'
+            output_field = RecipeStats._meta.get_field(name)
+            # removing a value at the bound needs a rescan of the recipes
+            bound = Case(
+                When(**{f'{name}__in': old},
+                     then=_bound(aggregate, field, user_id)),
+                default=F(name),
+                output_field=output_field,
+            )
+            if new:
+                # LEAST and GREATEST ignore NULL, the bounds of no recipes
+                bound = combine(
+                    bound, Value(pick(new)), output_field=output_field
+                )
+            changes[name] = bound
+    RecipeStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def _upsert(model, rows, conflict, updates):
+    """
+    INSERT .. ON CONFLICT DO UPDATE of rows {column: value}, updates map
+    columns to SQL combining {current} and {new}
+    """
+    columns = list(rows[0])
+    values = ', '.join(
+        '(' + ', '.join(['%s'] * len(columns)) + ')' for _ in rows
+    )
+    assignments = ', '.join(
+        f'{column} = ' + update.format(
+            current=f'rollup.{column}', new=f'EXCLUDED.{column}')
+        for column, update in updates.items()
+    )
+    sql = (
+        f'INSERT INTO {model._meta.db_table} AS rollup '
+        f'({", ".join(columns)}) VALUES {values} '
+        f'ON CONFLICT ({conflict}) DO UPDATE SET {assignments}'
+    )
+    return sql, [row[column] for row in rows for column in columns]
+
+
+class Rollups:
+    """additions to the rollups, applied together by flush()"""
+
+    def __init__(self):
+        self.recipes = defaultdict(list)
+        self.links = {usage: {} for usage in LINKS}
+
+    def add_recipes(self, user_id, values):
+        self.recipes[user_id].extend(values)
+
+    def add_links(self, usage, user_id, counts):
+        links = self.links[usage]
+        for pk, count in counts.items():
+            if count:
+                _, total = links.get(pk, (user_id, 0))
+                links[pk] = (user_id, total + count)
+
+    def _statements(self):
+        rows = []
+        for user_id, values in self.recipes.items():
+            if not values:
+                continue
+            times, prices = zip(*values)
+            rows.append({
+                'user_id': user_id,
+                'recipe_count': len(values),
+                'time_minutes_sum': sum(times),
+                'time_minutes_min': min(times),
+                'time_minutes_max': max(times),
+                'price_sum': sum(prices),
+                'price_min': min(prices),
+                'price_max': max(prices),
+            })
+        if rows:
+            yield _upsert(RecipeStats, rows, 'user_id', {
+                'recipe_count': '{current} + {new}',
+                'time_minutes_sum': '{current} + {new}',
+                'time_minutes_min': 'LEAST({current}, {new})',
+                'time_minutes_max': 'GREATEST({current}, {new})',
+                'price_sum': '{current} + {new}',
+                'price_min': 'LEAST({current}, {new})',
+                'price_max': 'GREATEST({current}, {new})',
+            })
+
+        for usage, links in self.links.items():
+            if links:
+                column = usage._meta.pk.column
+                yield _upsert(usage, [
+                    {column: pk, 'user_id': user_id, 'recipe_count': count}
+                    for pk, (user_id, count) in links.items()
+                ], column, {'recipe_count': '{current} + {new}'})
+
+    def flush(self):
+        """apply the additions in one statement"""
+        statements = list(self._statements())
+        if not statements:
+            return
+        # the other upserts run as data-modifying CTEs of the last one
+        *ctes, (sql, params) = statements
+        if ctes:
+            sql = 'WITH ' + ', '.join(
+                f'rollup_{index} AS ({cte_sql})'
+                for index, (cte_sql, _) in enumerate(ctes)
+            ) + ' ' + sql
+            params = [
+                param for _, cte_params in ctes for param in cte_params
+            ] + params
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+_local = threading.local()
+
+
+@contextmanager
+def deferred():
+    """
+    collect the additions of the enclosed writes and flush them once on
+    exit. Outside a transaction the writes commit one by one, so their
+    additions are flushed even when the block fails
+    """
+    if getattr(_local, 'rollups', None) is not None:
+        yield _local.rollups
+        return
+    rollups = _local.rollups = Rollups()
+    failed = False
+    try:
+        yield rollups
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _local.rollups = None
+        if not failed or not connection.in_atomic_block:
+            rollups.flush()
+
+
+def _apply(method, *args):
+    rollups = getattr(_local, 'rollups', None)
+    if rollups is not None:
+        getattr(rollups, method)(*args)
+        return
+    rollups = Rollups()
+    getattr(rollups, method)(*args)
+    rollups.flush()
+
+
+def add_recipes(user_id, values):
+    """count new recipes with the given (time_minutes, price) values"""
+    _apply('add_recipes', user_id, list(values))
+
+
+def add_links(usage, user_id, counts):
+    """add {attribute id: new links} to the usage counts"""
+    _apply('add_links', usage, user_id, counts)
+
+
+def recount_links(usage, ids):
+    """
+    recount the usage of the given attributes from the link table, used
+    after removals where the signal may name links that did not exist
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    field, _, column = LINKS[usage]
+    through = getattr(Recipe, field).through
+    links = Subquery(
+        through.objects.filter(**{column: OuterRef('pk')}).order_by()
+        .values(column).annotate(links=Count('*')).values('links')
+    )
+    usage.objects.filter(pk__in=ids).update(
+        recipe_count=Coalesce(links, 0)
+    )
+
+
+def recompute(user_ids):
+    """rebuild the rollups of the given users, return the recipes counted"""
+    user_ids = list(user_ids)
+    with transaction.atomic():
+        totals = (
+            Recipe.objects.filter(user_id__in=user_ids).order_by()
+            .values('user_id').annotate(
+                recipe_count=Count('id'),
+                time_minutes_sum=Sum('time_minutes'),
+                time_minutes_min=Min('time_minutes'),
+                time_minutes_max=Max('time_minutes'),
+                price_sum=Sum('price'),
+                price_min=Min('price'),
+                price_max=Max('price'),
+            )
+        )
+        RecipeStats.objects.filter(user_id__in=user_ids).delete()
+        stats = RecipeStats.objects.bulk_create(
+            [RecipeStats(**row) for row in totals]
+        )
+
+        for usage, (field, model, _) in LINKS.items():
+            usage.objects.filter(user_id__in=user_ids).delete()
+            linked = (
+                model.objects.filter(user_id__in=user_ids)
+                .annotate(links=Count('recipe')).filter(links__gt=0)
+                .values_list('id', 'user_id', 'links')
+            )
+            usage.objects.bulk_create([
+                usage(pk=pk, user_id=user_id, recipe_count=links)
+                for pk, user_id, links in linked
+            ])
+    return sum(row.recipe_count for row in stats)
+
+
+def _average(total, count, places):
+    if not count:
+        return None
+    return round(Decimal(total) / count, places)
+
+
+def _top(usage, user, limit):
+    field, model, _ = LINKS[usage]
+    related = model._meta.model_name
+    return [
+        {'id': pk, 'name': name, 'recipe_count': count}
+        for pk, name, count in
+        usage.objects.filter(user=user, recipe_count__gt=0)
+        .order_by('-recipe_count', related)
+        .values_list(related, f'{related}__name', 'recipe_count')[:limit]
+    ]
+
+
+def user_stats(user, limit):
+    """statistics of the user's recipes and their top tags and ingredients"""
+    stats = (
+        RecipeStats.objects.filter(user=user).first()
+        or RecipeStats(user=user)
+    )
+    count = stats.recipe_count
+    return {
+        'recipe_count': count,
+        'time_minutes': {
+            'avg': _average(stats.time_minutes_sum, count, 1),
+            'min': stats.time_minutes_min,
+            'max': stats.time_minutes_max,
+        },
+        'price': {
+            'avg': _average(stats.price_sum, count, 2),
+            'min': stats.price_min,
+            'max': stats.price_max,
+        },
+        'tags': _top(TagUsage, user, limit),
+        'ingredients': _top(IngredientUsage, user, limit),
+    }
@@ -0,0 +1,214 @@
+"""Test the batch rename, delete and merge actions of tags and ingredients"""
+from decimal import Decimal
+from unittest.mock import patch
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Value
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient, TagUsage, IngredientUsage
+from recipe.search import search
+
+TAG_RENAME_URL = reverse('recipe:tag-bulk-rename')
+TAG_DELETE_URL = reverse('recipe:tag-bulk-delete')
+TAG_MERGE_URL = reverse('recipe:tag-merge')
+INGREDIENT_MERGE_URL = reverse('recipe:ingredient-merge')
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample Title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicBulkApiTests(TestCase):
+
+    def test_auth_required(self):
+        res = APIClient().post(TAG_MERGE_URL, {}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBulkApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, payload):
+        return self.client.post(url, payload, format='json')
+
+    def test_bulk_rename(self):
+        t1 = Tag.objects.create(user=self.user, name='Veggie')
+        t2 = Tag.objects.create(user=self.user, name='Desert')
+        recipe = create_recipe(self.user, title='Cake')
+        recipe.tags.add(t2)
+
+        res = self.post(TAG_RENAME_URL, {'items': [
+            {'id': t1.id, 'name': 'Vegetarian'},
+            {'id': t2.id, 'name': 'Dessert'},
+        ]})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'renamed': 2, 'recipes_reindexed': 1})
+        t1.refresh_from_db()
+        self.assertEqual(t1.name, 'Vegetarian')
+        found = search(Recipe.objects.all(), 'dessert')
+        self.assertEqual(list(found), [recipe])
+
+    def test_bulk_rename_swap_and_chain(self):
+        t1 = Tag.objects.create(user=self.user, name='A')
+        t2 = Tag.objects.create(user=self.user, name='B')
+        t3 = Tag.objects.create(user=self.user, name='C')
+
+        res = self.post(TAG_RENAME_URL, {'items': [
+            {'id': t1.id, 'name': 'B'},
+            {'id': t2.id, 'name': 'A'},
+        ]})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.post(TAG_RENAME_URL, {'items': [
+            {'id': t2.id, 'name': 'D'},
+            {'id': t3.id, 'name': 'A'},
+        ]})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(Tag.objects.values_list('id', 'name')),
+            {t1.id: 'B', t2.id: 'D', t3.id: 'A'},
+        )
+
+    def test_bulk_rename_conflict_is_bad_request(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        with patch('recipe.bulk.Case', return_value=Value('Taken')):
+            Tag.objects.create(user=self.user, name='Taken')
+            res = self.post(TAG_RENAME_URL, {'items': [
+                {'id': tag.id, 'name': 'Free'},
+            ]})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Vegan')
+
+    def test_bulk_rename_onto_existing_name(self):
+        t1 = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.post(TAG_RENAME_URL, {'items': [
+            {'id': t1.id, 'name': 'Dinner'},
+        ]})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        t1.refresh_from_db()
+        self.assertEqual(t1.name, 'Vegan')
+
+    def test_bulk_rename_other_users_item(self):
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+        tag = Tag.objects.create(user=other, name='Vegan')
+
+        res = self.post(TAG_RENAME_URL, {'items': [
+            {'id': tag.id, 'name': 'Mine'},
+        ]})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_delete(self):
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(3)
+        ]
+        recipe = create_recipe(self.user)
+        recipe.tags.add(tags[0], tags[1])
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+        foreign = Tag.objects.create(user=other, name='Foreign')
+
+        res = self.post(TAG_DELETE_URL, {
+            'ids': [tags[0].id, tags[1].id, foreign.id],
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'deleted': 2, 'links_removed': 2, 'recipes_reindexed': 1,
+        })
+        self.assertEqual(list(Tag.objects.filter(user=self.user)), [tags[2]])
+        self.assertTrue(Tag.objects.filter(id=foreign.id).exists())
+        self.assertFalse(TagUsage.objects.filter(user=self.user).exists())
+        self.assertEqual(recipe.tags.count(), 0)
+
+    def test_bulk_delete_queries_do_not_grow(self):
+        def delete(count):
+            recipe = create_recipe(self.user)
+            tags = [
+                Tag.objects.create(user=self.user, name=f'{count} {i}')
+                for i in range(count)
+            ]
+            recipe.tags.add(*tags)
+            with CaptureQueriesContext(connection) as ctx:
+                self.post(TAG_DELETE_URL, {'ids': [t.id for t in tags]})
+            return len(ctx)
+
+        self.assertEqual(delete(2), delete(20))
+
+    def test_merge(self):
+        target = Tag.objects.create(user=self.user, name='Vegan')
+        dup1 = Tag.objects.create(user=self.user, name='vegan')
+        dup2 = Tag.objects.create(user=self.user, name='Vegan ')
+        r1 = create_recipe(self.user, title='Salad')
+        r1.tags.add(target, dup1)
+        r2 = create_recipe(self.user, title='Soup')
+        r2.tags.add(dup1, dup2)
+        r3 = create_recipe(self.user, title='Stew')
+        r3.tags.add(dup2)
+
+        res = self.post(TAG_MERGE_URL, {
+            'target': target.id, 'sources': [dup1.id, dup2.id],
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'merged': 2,
+            'links_moved': 2,
+            'links_removed': 4,
+            'recipes_reindexed': 3,
+        })
+        self.assertEqual(list(Tag.objects.filter(user=self.user)), [target])
+        for recipe in (r1, r2, r3):
+            self.assertEqual(list(recipe.tags.all()), [target])
+        self.assertEqual(TagUsage.objects.get(tag=target).recipe_count, 3)
+
+    def test_merge_into_unused_ingredient(self):
+        target = Ingredient.objects.create(user=self.user, name='Salt')
+        source = Ingredient.objects.create(user=self.user, name='salt')
+        create_recipe(self.user).ingredients.add(source)
+
+        res = self.post(INGREDIENT_MERGE_URL, {
+            'target': target.id, 'sources': [source.id],
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['links_moved'], 1)
+        self.assertEqual(
+            IngredientUsage.objects.get(ingredient=target).recipe_count, 1)
+        self.assertFalse(Ingredient.objects.filter(id=source.id).exists())
+
+    def test_merge_invalid(self):
+        target = Tag.objects.create(user=self.user, name='Vegan')
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+        foreign = Tag.objects.create(user=other, name='Vegan')
+
+        for sources in ([target.id], [foreign.id], [target.id + 1000]):
+            res = self.post(TAG_MERGE_URL, {
+                'target': target.id, 'sources': sources,
+            })
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Tag.objects.filter(id=foreign.id).exists())
@@ -0,0 +1,119 @@
+"""Test for per-user list response caching"""
+from decimal import Decimal
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from core.models import Recipe, Tag
+from recipe.cache import get_cache
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample Title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ListCacheTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_tag_list_served_from_cache(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+        first = self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(TAGS_URL)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_write_invalidates_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(user=self.user, name='Vegan')
+        first = self.client.get(TAGS_URL)
+
+        tag.name = 'Vegetarian'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data['results'][0]['name'], 'Vegetarian')
+        self.assertNotEqual(res['ETag'], first['ETag'])
+
+    def test_other_users_cache_kept(self):
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+        self.client.get(TAGS_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(user=other, name='Comfort')
+
+        with self.assertNumQueries(0):
+            self.client.get(TAGS_URL)
+
+    def test_if_none_match_returns_304(self):
+        create_recipe(self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_m2m_change_invalidates_recipe_list(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(Tag.objects.create(user=self.user, name='Lunch'))
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Lunch')
+
+    def test_filtered_recipe_list_not_cached(self):
+        tag = Tag.objects.create(user=self.user, name='Lunch')
+        create_recipe(self.user).tags.add(tag)
+        self.client.get(RECIPES_URL, {'tags': tag.id})
+
+        res = self.client.get(RECIPES_URL, {'tags': tag.id})
+
+        self.assertNotIn('ETag', res)
+
+    def test_pagination_links_follow_requested_host(self):
+        for name in ['Vegan', 'Lunch']:
+            Tag.objects.create(user=self.user, name=name)
+        with self.settings(ALLOWED_HOSTS=['a.example.com', 'b.example.com']):
+            self.client.get(
+                TAGS_URL, {'page_size': 1}, HTTP_HOST='a.example.com'
+            )
+            res = self.client.get(
+                TAGS_URL, {'page_size': 1}, HTTP_HOST='b.example.com'
+            )
+
+        self.assertTrue(res.data['next'].startswith('http://b.example.com/'))
+
+    def test_etag_depends_on_renderer(self):
+        json_etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(TAGS_URL, HTTP_ACCEPT='text/html')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], json_etag)
@@ -0,0 +1,39 @@
+from io import StringIO
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from core.models import Recipe, Tag, Ingredient
+
+
+class ExplainQueriesCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Salt')
+        )
+
+    def test_explain_queries(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('user@example.com', output)
+        self.assertIn('recipe list ?tags&ingredients', output)
+        self.assertIn('ingredient list ?assigned_only', output)
+        self.assertIn('actual time', output)
+
+    def test_explain_queries_unknown_user(self):
+        with self.assertRaises(CommandError):
+            call_command('explain_queries', email='nobody@example.com')
@@ -0,0 +1,148 @@
+"""Test for the read-only recipe fast path"""
+import datetime
+from decimal import Decimal
+from unittest.mock import patch
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient
+from recipe import renderers
+from recipe.cache import get_cache
+from recipe.renderers import FastJSONRenderer
+from recipe.views import RecipeViewSet
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample Title',
+        'time_minutes': 22,
+        'price': Decimal('5.5'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class FastPathTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            tags = [
+                Tag.objects.create(user=self.user, name=name)
+                for name in ['Dînner', 'Quick\u2028', 'Spicy "hot"']
+            ]
+            ingredient = Ingredient.objects.create(user=self.user, name='Rice')
+            for i in range(3):
+                recipe = create_recipe(
+                    self.user,
+                    title=f'Curry {i} \U0001f336\x01',
+                    link='https://example.com/curry',
+                    description='A \\ curry',
+                )
+                recipe.tags.add(*tags[i:])
+                recipe.ingredients.add(ingredient)
+            create_recipe(self.user, title='Plain curry')
+        self.recipe = recipe
+
+    def assert_same_bytes(self, url, params=None):
+        fast = self.client.get(url, params)
+        get_cache().clear()
+        # the serializer path rendered by DRF's own renderer
+        with patch.object(RecipeViewSet, 'fast_read_actions', []), \
+                patch.object(RecipeViewSet, 'renderer_classes',
+                             [JSONRenderer]):
+            slow = self.client.get(url, params)
+
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+
+    def test_list_matches_serializer(self):
+        self.assert_same_bytes(RECIPES_URL)
+
+    def test_paginated_search_matches_serializer(self):
+        self.assert_same_bytes(RECIPES_URL, {'search': 'curry', 'page_size': 2}) # noqa
+        cursor = self.client.get(
+            RECIPES_URL, {'search': 'curry', 'page_size': 2}).data['next']
+
+        self.assert_same_bytes(cursor)
+
+    def test_retrieve_matches_serializer(self):
+        Recipe.objects.filter(id=self.recipe.id).update(
+            image_status=Recipe.ImageStatus.READY,
+            image_renditions={'thumbnail': {'jpeg': 'uploads/r_t.jpeg'}},
+        )
+
+        self.assert_same_bytes(detail_url(self.recipe.id))
+
+    def test_list_queries(self):
+        # page, tags and ingredients
+        with self.assertNumQueries(3):
+            self.client.get(RECIPES_URL)
+
+    def test_sparse_list_matches_serializer(self):
+        self.assert_same_bytes(RECIPES_URL, {'fields': 'id,title'})
+        self.assert_same_bytes(RECIPES_URL, {'expand': 'tags'})
+        self.assert_same_bytes(
+            RECIPES_URL, {'fields': 'title,price', 'expand': 'ingredients'})
+
+    def test_sparse_retrieve_matches_serializer(self):
+        self.assert_same_bytes(
+            detail_url(self.recipe.id), {'fields': 'title,image_renditions'})
+
+    def test_sparse_list_skips_relations(self):
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(list(res.data['results'][0]), ['id', 'title'])
+
+    def test_unknown_sparse_field(self):
+        res = self.client.get(
+            RECIPES_URL, {'fields': 'title,secret', 'expand': 'user'})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('fields', res.data)
+        self.assertIn('expand', res.data)
+
+    def test_retrieve_other_users_recipe_not_found(self):
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+        recipe = create_recipe(other)
+
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_orjson_renderer_matches(self):
+        data = {
+            'name': 'Quick\u2028\u2029 \U0001f336',
+            'price': Decimal('1.50'),
+            'created': datetime.datetime(2021, 1, 1, 12, 30, 1, 123456),
+            'items': [1, None, True],
+        }
+        expected = JSONRenderer().render(data)
+
+        with patch.object(renderers.orjson, 'dumps',
+                          wraps=renderers.orjson.dumps) as dumps:
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+        dumps.assert_called_once()
+
+    def test_indented_renderer_matches(self):
+        context = {'indent': 2}
+        data = {'name': 'Quick \U0001f336', 'items': [1, None]}
+
+        self.assertEqual(
+            FastJSONRenderer().render(data, renderer_context=context),
+            JSONRenderer().render(data, renderer_context=context),
+        )
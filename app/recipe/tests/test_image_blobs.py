@@ -0,0 +1,188 @@
+"""Test deduplicated recipe image storage and its garbage collection"""
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+from core.models import Recipe, ImageBlob
+from core.storage import ContentAddressedStorage, recipe_image_storage
+from recipe import blobs
+
+
+def image_upload_url(recipe_id):
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def jpeg(color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (20, 20), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def refs(name):
+    return ImageBlob.objects.get(name=name).ref_count
+
+
+@patch('recipe.images._get_executor')
+class ImageBlobTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            user=self.user, title='Cake', time_minutes=5, price='1.00',
+        )
+
+    def upload(self, recipe, content, name='photo.JPG'):
+        image_file = BytesIO(content)
+        image_file.name = name
+        res = self.client.post(
+            image_upload_url(recipe.id), {'image': image_file},
+            format='multipart',
+        )
+        self.assertEqual(res.status_code, 200)
+        recipe.refresh_from_db()
+        return recipe.image.name
+
+    def blob_files(self):
+        return sorted(os.listdir(recipe_image_storage.path('uploads/recipe')))
+
+    def test_same_image_stored_once(self, patched_executor):
+        content = jpeg()
+
+        first = self.upload(self.create_recipe(), content)
+        with patch.object(ContentAddressedStorage, '_save') as save:
+            second = self.upload(
+                self.create_recipe(), content, name='copy.jpeg')
+
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^uploads/recipe/[0-9a-f]{64}\.jpeg$')
+        save.assert_not_called()
+        self.assertEqual(self.blob_files(), [os.path.basename(first)])
+        self.assertEqual(refs(first), 2)
+
+    def test_replace_and_delete_release_references(self, patched_executor):
+        recipe = self.create_recipe()
+        other = self.create_recipe()
+        old = self.upload(recipe, jpeg('red'))
+        self.upload(other, jpeg('red'))
+
+        new = self.upload(recipe, jpeg('blue'))
+
+        self.assertEqual(refs(old), 1)
+        self.assertEqual(refs(new), 1)
+
+        other.delete()
+        Recipe.objects.get(id=recipe.id).delete()
+
+        self.assertEqual(refs(old), 0)
+        self.assertEqual(refs(new), 0)
+        # files are only removed by the collector
+        self.assertEqual(len(self.blob_files()), 2)
+
+    def test_saving_other_fields_keeps_references(self, patched_executor):
+        recipe = self.create_recipe()
+        name = self.upload(recipe, jpeg())
+
+        Recipe.objects.only('id', 'title').get(id=recipe.id).save()
+        recipe = Recipe.objects.get(id=recipe.id)
+        recipe.title = 'Pie'
+        recipe.save()
+
+        self.assertEqual(refs(name), 1)
+
+    def test_collect_garbage(self, patched_executor):
+        kept = self.upload(self.create_recipe(), jpeg('red'))
+        recipe = self.create_recipe()
+        unused = self.upload(recipe, jpeg('blue'))
+        recipe.delete()
+        recent = self.upload(self.create_recipe(), jpeg('green'))
+        Recipe.objects.filter(image=recent).delete()
+        untracked = recipe_image_storage.save(
+            'uploads/recipe/x.png', ContentFile(b'rolled back upload'))
+        # only the file of recent was used within the grace period
+        ImageBlob.objects.update(updated='2000-01-01T00:00:00Z')
+        for name in (kept, unused, untracked):
+            os.utime(recipe_image_storage.path(name), (0, 0))
+
+        out = StringIO()
+        call_command('gc_image_blobs', '--dry-run', stdout=out)
+        self.assertIn('Would delete 1 unreferenced blobs and 1 untracked', # noqa
+                      out.getvalue())
+        self.assertEqual(len(self.blob_files()), 4)
+
+        call_command('gc_image_blobs', stdout=StringIO())
+
+        self.assertEqual(
+            self.blob_files(),
+            sorted(os.path.basename(name) for name in (kept, recent)),
+        )
+        self.assertFalse(ImageBlob.objects.filter(name=unused).exists())
+        self.assertTrue(ImageBlob.objects.filter(name=recent).exists())
+
+    def test_collect_garbage_keeps_blob_saved_meanwhile(self,
+                                                        patched_executor):
+        recipe = self.create_recipe()
+        name = self.upload(recipe, jpeg())
+        recipe.delete()
+        ImageBlob.objects.update(updated='2000-01-01T00:00:00Z')
+        os.utime(recipe_image_storage.path(name), (0, 0))
+        stale = blobs._stale
+
+        def saved_after_check(*args):
+            size = stale(*args)
+            # a concurrent upload of the same bytes
+            recipe_image_storage.save(name, ContentFile(jpeg()))
+            return size
+
+        with patch('recipe.blobs._stale', side_effect=saved_after_check):
+            collected = blobs.collect_garbage()
+
+        self.assertEqual(collected['blobs'], 0)
+        self.assertEqual(self.blob_files(), [os.path.basename(name)])
+
+    def test_collect_garbage_removes_abandoned_temp_files(self,
+                                                          patched_executor):
+        self.upload(self.create_recipe(), jpeg())
+        abandoned = recipe_image_storage.path('uploads/recipe/.upload1234')
+        writing = recipe_image_storage.path('uploads/recipe/.upload5678')
+        for path in (abandoned, writing):
+            with open(path, 'wb') as temp:
+                temp.write(b'partial')
+        os.utime(abandoned, (0, 0))
+
+        collected = blobs.collect_garbage()
+
+        self.assertEqual(collected['files'], 1)
+        self.assertFalse(os.path.exists(abandoned))
+        self.assertTrue(os.path.exists(writing))
+
+    def test_recount(self, patched_executor):
+        recipe = self.create_recipe()
+        name = self.upload(recipe, jpeg())
+        ImageBlob.objects.all().delete()
+        ImageBlob.objects.create(name='uploads/recipe/stale.jpg', ref_count=3)
+
+        out = StringIO()
+        call_command('gc_image_blobs', '--recount', stdout=out)
+
+        self.assertIn('2 blobs recounted', out.getvalue())
+        self.assertEqual(refs(name), 1)
+        self.assertEqual(refs('uploads/recipe/stale.jpg'), 0)
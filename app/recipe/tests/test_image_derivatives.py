@@ -0,0 +1,119 @@
+"""Test the resized image derivatives endpoint"""
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest.mock import patch
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from recipe import derivatives
+
+
+def derivative_url(name):
+    return reverse('recipe:image-derivative', args=[name])
+
+
+def upload(size=(1000, 500), name='uploads/recipe/'
+           '0b6d7a9e-8f3e-4f5e-9a51-1c2d3e4f5a6b.jpg'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format='JPEG')
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def cached_files(media_root):
+    return [
+        name
+        for _, _, files in os.walk(os.path.join(media_root, 'derivatives'))
+        for name in files
+    ]
+
+
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        derivatives.lru.reset()
+        self.name = upload()
+
+    def test_resize_and_cache(self):
+        url = derivative_url(self.name)
+
+        res = self.client.get(url, {'w': 400, 'h': 400, 'format': 'jpeg'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('max-age=31536000', res['Cache-Control'])
+        image = Image.open(BytesIO(b''.join(res.streaming_content)))
+        self.assertEqual(image.size, (400, 200))
+        self.assertEqual(len(cached_files(self.media_root)), 1)
+
+        with patch.object(derivatives, '_render') as render:
+            again = self.client.get(url, {'w': 400, 'h': 400})
+            content = b''.join(again.streaming_content)
+
+        render.assert_not_called()
+        self.assertEqual(Image.open(BytesIO(content)).size, (400, 200))
+        self.assertEqual(again['ETag'], res['ETag'])
+
+    def test_not_modified(self):
+        url = derivative_url(self.name)
+        etag = self.client.get(url, {'w': 200, 'h': 200})['ETag']
+
+        res = self.client.get(
+            url, {'w': 200, 'h': 200}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+
+    def test_size_not_whitelisted(self):
+        res = self.client.get(
+            derivative_url(self.name), {'w': 401, 'h': 400})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('400x400', res.json()['detail'])
+        self.assertEqual(cached_files(self.media_root), [])
+
+    def test_unknown_format(self):
+        res = self.client.get(
+            derivative_url(self.name), {'w': 400, 'h': 400, 'format': 'gif'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_only_original_uploads(self):
+        for name in [
+            'uploads/recipe/0b6d7a9e-8f3e-4f5e-9a51-000000000000.jpg',
+            'uploads/recipe/../../etc/passwd',
+            'derivatives/ab/file.jpeg',
+        ]:
+            res = self.client.get(derivative_url(name), {'w': 100, 'h': 100})
+            self.assertEqual(res.status_code, 404)
+
+    @patch.object(derivatives, 'EVICTION_TARGET', 1.0)
+    def test_cache_evicts_least_recently_used(self):
+        url = derivative_url(self.name)
+        paths = []
+        for size in (100, 200, 400):
+            self.client.get(url, {'w': size, 'h': size})
+            paths.append(derivatives._path(
+                derivatives.derivative_key(self.name, size, size, 'jpeg'),
+                'jpeg',
+            ))
+        bound = sum(os.path.getsize(path) for path in paths) - 1
+        os.remove(paths[2])
+        derivatives.lru.reset()
+        # the smallest box was used least recently
+        os.utime(paths[0], (0, 0))
+
+        with override_settings(IMAGE_DERIVATIVE_CACHE_BYTES=bound):
+            self.client.get(url, {'w': 400, 'h': 400})
+
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
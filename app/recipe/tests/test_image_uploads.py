@@ -0,0 +1,210 @@
+"""Test streaming image uploads and the decompression-bomb guard"""
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+from io import BytesIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.uploadhandler import SkipFile
+from django.core.handlers.wsgi import WSGIRequest
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient, force_authenticate
+from core.models import Recipe
+from recipe import images
+from recipe.uploads import ImageRejected, ImageUploadHandler
+from recipe.views import RecipeViewSet
+
+
+def image_upload_url(recipe_id):
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def encode(image, image_format):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def _chunk(kind, data):
+    return (struct.pack('>I', len(data)) + kind + data +
+            struct.pack('>I', zlib.crc32(kind + data)))
+
+
+def png_bomb(width=12000, height=12000):
+    """grayscale PNG of zeros, a few hundred KB that decode to width*height"""
+    compressor = zlib.compressobj(9)
+    row = b'\0' * (width + 1)
+    data = b''.join(compressor.compress(row) for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' +
+            _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0,
+                                        0, 0)) +
+            _chunk(b'IDAT', data + compressor.flush()) +
+            _chunk(b'IEND', b''))
+
+
+def memory_kb(field):
+    with open('/proc/self/status') as status_file:
+        for line in status_file:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+class ImageUploadHandlerTests(TestCase):
+
+    def _receive(self, content, chunk_size=64 * 1024):
+        handler = ImageUploadHandler()
+        handler.new_file('image', 'image.jpg', 'image/jpeg', len(content))
+        for start in range(0, len(content), chunk_size):
+            handler.receive_data_chunk(
+                content[start:start + chunk_size], start)
+        return handler, handler.file_complete(len(content))
+
+    def test_streams_to_temporary_file(self):
+        content = encode(Image.new('RGB', (50, 50)), 'JPEG')
+
+        handler, upload = self._receive(content, chunk_size=100)
+
+        self.assertIsNone(handler.error)
+        self.assertEqual(handler.identified, ('JPEG', (50, 50)))
+        self.assertTrue(os.path.exists(upload.temporary_file_path()))
+        # hashed on the way for the content addressed storage
+        self.assertEqual(upload.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(upload.name, 'image.jpeg')
+        upload.close()
+
+    def test_rejects_from_header(self):
+        bomb = png_bomb()
+        handler = ImageUploadHandler()
+        handler.new_file('image', 'image.png', 'image/png', len(bomb))
+
+        with self.assertRaises(SkipFile):
+            handler.receive_data_chunk(bomb[:64 * 1024], 0)
+
+        self.assertIn('too large', handler.error)
+
+    def test_rejects_truncated_image(self):
+        content = encode(Image.new('RGB', (50, 50)), 'PNG')[:20]
+
+        handler, upload = self._receive(content)
+
+        self.assertIsNone(upload)
+        self.assertIsNotNone(handler.error)
+
+    def test_render_refuses_bomb(self):
+        with self.assertRaises(ImageRejected):
+            list(images.render(BytesIO(png_bomb())))
+
+
+class ImageUploadApiTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Cake', time_minutes=5, price='1.00',
+        )
+
+    def _upload(self, content, name='image.jpg'):
+        image_file = BytesIO(content)
+        image_file.name = name
+        res = self.client.post(
+            image_upload_url(self.recipe.id), {'image': image_file},
+            format='multipart',
+        )
+        self.recipe.refresh_from_db()
+        return res
+
+    @patch('recipe.images._get_executor')
+    def test_upload_image(self, patched_executor):
+        res = self._upload(encode(Image.new('RGB', (20, 20)), 'PNG'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+
+    def test_rejects_other_format(self):
+        res = self._upload(
+            encode(Image.new('RGB', (20, 20)), 'GIF'), name='image.gif')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('GIF', res.data['image'][0])
+        self.assertFalse(self.recipe.image)
+
+    def test_rejects_decompression_bomb(self):
+        with patch.object(Image.Image, 'load') as load:
+            res = self._upload(png_bomb(), name='image.png')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('too large', res.data['image'][0])
+        load.assert_not_called()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=10 * 1024)
+    def test_rejects_body_over_limit(self):
+        content = encode(Image.new('RGB', (20, 20)), 'PNG')
+
+        res = self._upload(content + b'\0' * 20 * 1024, name='image.png')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('larger than', res.data['image'][0])
+        self.assertFalse(self.recipe.image)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/clear_refs'),
+                         'needs Linux peak RSS accounting')
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=64 * 1024 * 1024)
+    @patch('recipe.images._get_executor')
+    def test_upload_memory_is_bounded(self, patched_executor):
+        size = 32 * 1024 * 1024
+        boundary = 'BoUnDaRy'
+        body = tempfile.TemporaryFile()
+        self.addCleanup(body.close)
+        body.write((
+            f'--{boundary}\r\nContent-Disposition: form-data; '
+            f'name="image"; filename="image.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'
+        ).encode())
+        body.write(encode(Image.new('RGB', (20, 20)), 'JPEG'))
+        # bytes after the end of the JPEG are kept but never decoded
+        padding = b'\0' * 1024 * 1024
+        for _ in range(size // len(padding)):
+            body.write(padding)
+        body.write(f'\r\n--{boundary}--\r\n'.encode())
+        length = body.tell()
+        body.seek(0)
+        environ = RequestFactory()._base_environ(
+            PATH_INFO=image_upload_url(self.recipe.id),
+            REQUEST_METHOD='POST',
+            CONTENT_TYPE=f'multipart/form-data; boundary={boundary}',
+            CONTENT_LENGTH=str(length),
+        )
+        environ['wsgi.input'] = body
+        request = WSGIRequest(environ)
+        force_authenticate(request, self.user)
+        view = RecipeViewSet.as_view({'post': 'upload_image'})
+
+        # reset the peak to the current resident size
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        before = memory_kb('VmRSS')
+        res = view(request, pk=self.recipe.id)
+        peak = memory_kb('VmHWM') - before
+        request.close()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertGreater(self.recipe.image.size, size)
+        self.assertLess(peak * 1024, size // 4, f'peak grew {peak}KB')
@@ -7,6 +7,8 @@ from rest_framework import status # noqa
 from core.models import Ingredient, Recipe# noqa
 from decimal import Decimal # noqa
 from recipe.serializers import IngredientSerializer # noqa
+from django.db import connection # noqa
+from django.test.utils import CaptureQueriesContext # noqa
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
 
@@ -46,7 +48,7 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serialzier = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serialzier.data)
+        self.assertEqual(res.data['results'], serialzier.data)
 
     def test_ingredients_limited_to_user(self):
         user2 = create_user(email="ramyadel@mail.com")
@@ -56,9 +58,9 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
     def test_updade_ingredient(self):
         ingredient = Ingredient.objects.create(user=self.user, name='Cilantro')
@@ -98,8 +100,8 @@ class PrivateIngredientsApiTests(TestCase):
         s1 = IngredientSerializer(in1)
         s2 = IngredientSerializer(in2)
 
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_ingredients_unique(self):
         ing = Ingredient.objects.create(user=self.user, name='Eggs')
@@ -123,4 +125,49 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_autocomplete_ranks_prefix_then_similarity(self):
+        for name in ['Tomato', 'Cherry tomatoes', 'Potato', 'Basil']:
+            Ingredient.objects.create(user=self.user, name=name)
+        other = create_user('other@example.com')
+        Ingredient.objects.create(user=other, name='Tomato paste')
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'tomat'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [i['name'] for i in res.data], ['Tomato', 'Cherry tomatoes']
+        )
+
+    def test_fuzzy_autocomplete_prices_out_non_trigram_scans(self):
+        Ingredient.objects.create(user=self.user, name='Tomato')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(INGREDIENTS_URL, {'q': 'tomat'})
+
+        self.assertEqual([i['name'] for i in res.data], ['Tomato'])
+        sql = [q['sql'] for q in queries.captured_queries]
+        fuzzy = next(i for i, q in enumerate(sql) if '%>' in q)
+        self.assertIn('SET LOCAL enable_seqscan = off', sql[:fuzzy])
+
+    def test_autocomplete_short_prefix_and_limit(self):
+        for name in ['Salt', 'Sage', 'Saffron', 'Pepper']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'sa', 'limit': 2})
+
+        self.assertEqual([i['name'] for i in res.data], ['Saffron', 'Sage'])
+
+    def test_autocomplete_cache_invalidated_on_write(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(user=self.user, name='Garlic')
+        self.client.get(INGREDIENTS_URL, {'q': 'gar'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(user=self.user, name='Garam masala')
+        res = self.client.get(INGREDIENTS_URL, {'q': 'gar'})
+
+        self.assertEqual(
+            [i['name'] for i in res.data], ['Garam masala', 'Garlic']
+        )
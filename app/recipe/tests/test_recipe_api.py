@@ -2,6 +2,9 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.files.storage import default_storage
 from core.models import Recipe, Tag, Ingredient # noqa
 from rest_framework.test import APIClient
 from rest_framework import status # noqa
@@ -9,7 +12,12 @@ from core import models # noqa
 from decimal import Decimal
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer # noqa
 from PIL import Image
+from django.test import override_settings
+from unittest.mock import patch
+from recipe import images
+from recipe.images import process_recipe_image
 import os
+import shutil
 import tempfile
 RECIPES_URL = reverse('recipe:recipe-list')
 
@@ -41,6 +49,34 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)
 
 
+def create_recipe_with_relations(user, count=1):
+    """create recipes that each carry a tag and an ingredient"""
+    for _ in range(count):
+        recipe = create_recipe(user=user)
+        recipe.tags.add(
+            Tag.objects.create(user=user, name=f'Tag {recipe.id}')
+        )
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=user, name=f'Ingredient {recipe.id}') # noqa
+        )
+
+
+def assert_constant_queries(testcase, url, seed):
+    """
+    assert that GET url runs the same number of queries whether seed
+    created one object or many, so N+1 patterns cannot creep back in
+    """
+    with testcase.captureOnCommitCallbacks(execute=True):
+        seed(1)
+    with CaptureQueriesContext(connection) as baseline:
+        testcase.client.get(url)
+    with testcase.captureOnCommitCallbacks(execute=True):
+        seed(10)
+    with testcase.assertNumQueries(len(baseline)):
+        res = testcase.client.get(url)
+    return res
+
+
 class PublicRecipeAPITests(TestCase):
 
     def setUp(self):
@@ -67,7 +103,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_for_user(self):
         another_user = create_user(email='user2@example.com', password='6465452')  # noqa
@@ -80,7 +116,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         recipe = create_recipe(user=self.user)
@@ -191,6 +227,30 @@ class PrivateRecipeAPITests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_attrs_batched(self):
+        Ingredient.objects.create(user=self.user, name='Ingredient 0')
+        payload = {
+            'title': 'Big Stew',
+            'time_minutes': 90,
+            'price': Decimal('12.00'),
+            'tags': [{'name': 'Dinner'}, {'name': 'Dinner'}],
+            'ingredients': [
+                {'name': f'Ingredient {i}'} for i in range(20)
+            ],
+        }
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertLess(len(ctx), 20)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 1)
+        self.assertEqual(recipe.ingredients.count(), 20)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 20
+        )
+
     def test_create_tag_on_update(self):
         recipe = create_recipe(user=self.user)
         payload = {
@@ -339,9 +399,9 @@ class PrivateRecipeAPITests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         r1 = create_recipe(user=self.user, title='Posh Beans')
@@ -363,21 +423,113 @@ class PrivateRecipeAPITests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_filter_by_tags_match_all(self):
+        r1 = create_recipe(user=self.user, title='Vegan Curry')
+        r2 = create_recipe(user=self.user, title='Vegan Toast')
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dinner')
+        r1.tags.add(tag1, tag2)
+        r2.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id},{tag1.id}', 'tags_match': 'all'} # noqa
+        res = self.client.get(RECIPES_URL, params)
+
+        ids = [recipe['id'] for recipe in res.data['results']]
+        self.assertEqual(ids, [r1.id])
+
+    def test_filter_by_tags_and_ingredients_no_duplicates(self):
+        recipe = create_recipe(user=self.user)
+        tags = [Tag.objects.create(user=self.user, name=n) for n in 'ab']
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=n) for n in 'xy'
+        ]
+        recipe.tags.add(*tags)
+        recipe.ingredients.add(*ingredients)
+
+        params = {
+            'tags': ','.join(str(tag.id) for tag in tags),
+            'ingredients': ','.join(str(ing.id) for ing in ingredients),
+        }
+        res = self.client.get(RECIPES_URL, params)
+
+        ids = [r['id'] for r in res.data['results']]
+        self.assertEqual(ids, [recipe.id])
+
+    def test_list_query_count_constant(self):
+        res = assert_constant_queries(
+            self,
+            RECIPES_URL,
+            lambda count: create_recipe_with_relations(self.user, count),
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = res.data['results']
+        self.assertEqual(len(results), 11)
+        self.assertEqual(len(results[0]['tags']), 1)
+        self.assertEqual(len(results[0]['ingredients']), 1)
+
+    def test_list_cursor_pagination(self):
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        ids = [r['id'] for r in res.data['results']]
+        self.assertEqual(ids, [recipes[4].id, recipes[3].id])
+
+        seen = list(ids)
+        next_url = res.data['next']
+        while next_url:
+            res = self.client.get(next_url)
+            seen.extend(r['id'] for r in res.data['results'])
+            next_url = res.data['next']
+
+        self.assertEqual(seen, [r.id for r in reversed(recipes)])
+
+    def test_detail_prefetches_relations(self):
+        create_recipe_with_relations(self.user)
+        recipe = Recipe.objects.get(user=self.user)
+
+        # recipe, tags, ingredients
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data['tags'][0]['name'], f'Tag {recipe.id}')
+        self.assertEqual(
+            res.data['ingredients'][0]['name'], f'Ingredient {recipe.id}'
+        )
 
 
 class ImageUploadTests(TestCase):
 
     def setUp(self):
+        # stored images are shared by content, never left in MEDIA_ROOT
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
         self.client = APIClient()
         self.user = create_user(email='user@example.com', password='6465452')
         self.client.force_authenticate(self.user)
         self.recipe = create_recipe(user=self.user)
 
-    def tearDown(self):
-        self.recipe.image.delete()
+    def _upload(self, image, **save_kwargs):
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            image.save(image_file, format='JPEG', **save_kwargs)
+            image_file.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    url, {'image': image_file}, format='multipart'
+                )
+        self.recipe.refresh_from_db()
+        return res
 
     def test_upload_image(self):
         url = image_upload_url(self.recipe.id)
@@ -393,6 +545,100 @@ class ImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    @patch('recipe.images._get_executor')
+    def test_upload_returns_before_processing(self, patched_executor):
+        res = self._upload(Image.new('RGB', (10, 10)))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_status'], 'pending')
+        self.assertEqual(res.data['image_renditions'], {})
+        patched_executor.return_value.submit.assert_called_once()
+
+    @override_settings(IMAGE_PROCESSING_EAGER=True)
+    def test_upload_generates_renditions(self):
+        exif = Image.Exif()
+        exif[0x010f] = 'PhoneMaker'
+        res = self._upload(Image.new('RGB', (2400, 1200)), exif=exif)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.recipe.image_status, 'ready')
+        renditions = self.recipe.image_renditions
+        self.assertEqual(
+            set(renditions), {'thumbnail', 'medium', 'large'}
+        )
+        with default_storage.open(renditions['large']['jpeg']) as f:
+            large = Image.open(f)
+            self.assertEqual(large.size, (1600, 800))
+            self.assertEqual(dict(large.getexif()), {})
+        with default_storage.open(renditions['thumbnail']['jpeg']) as f:
+            self.assertEqual(Image.open(f).size, (200, 100))
+
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['image_status'], 'ready')
+        self.assertTrue(
+            res.data['image_renditions']['medium']['jpeg'].startswith('http') # noqa
+        )
+
+    @override_settings(IMAGE_PROCESSING_EAGER=True)
+    def test_replacing_image_removes_old_renditions(self):
+        self._upload(Image.new('RGB', (10, 10)))
+        old = self.recipe.image_renditions['thumbnail']['jpeg']
+
+        self._upload(Image.new('RGB', (20, 20)))
+
+        self.assertFalse(default_storage.exists(old))
+
+    @override_settings(IMAGE_PROCESSING_EAGER=True)
+    def test_old_renditions_kept_until_replaced(self):
+        self._upload(Image.new('RGB', (10, 10)))
+        old = self.recipe.image_renditions
+
+        with override_settings(IMAGE_PROCESSING_EAGER=False), \
+                patch('recipe.images._get_executor') as patched_executor:
+            self._upload(Image.new('RGB', (20, 20)))
+        self.assertTrue(default_storage.exists(old['thumbnail']['jpeg']))
+
+        _, recipe_id, previous = (
+            patched_executor.return_value.submit.call_args[0])
+        self.assertEqual(previous, old)
+        process_recipe_image(recipe_id, previous)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, 'ready')
+        self.assertFalse(default_storage.exists(old['thumbnail']['jpeg']))
+
+    @override_settings(IMAGE_PROCESSING_EAGER=True)
+    def test_deleting_recipe_removes_renditions(self):
+        self._upload(Image.new('RGB', (10, 10)))
+        renditions = self.recipe.image_renditions
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.delete(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        for names in renditions.values():
+            for name in names.values():
+                self.assertFalse(default_storage.exists(name))
+
+    @override_settings(IMAGE_PROCESSING_EAGER=True)
+    def test_failed_processing_leaves_no_partial_renditions(self):
+        encode = images._encode
+        calls = []
+
+        def fail_third(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise OSError('disk full')
+            return encode(*args)
+
+        with patch('recipe.images._encode', side_effect=fail_third):
+            self._upload(Image.new('RGB', (10, 10)))
+
+        self.assertEqual(self.recipe.image_status, 'failed')
+        self.assertEqual(self.recipe.image_renditions, {})
+        base = os.path.splitext(self.recipe.image.name)[0]
+        self.assertFalse(default_storage.exists(f'{base}_thumbnail.jpeg'))
+
     def test_uploading_imag_bad_request(self):
         url = image_upload_url(self.recipe.id)
         payload = {'image': 'noimage'}
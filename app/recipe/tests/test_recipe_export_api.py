@@ -0,0 +1,120 @@
+"""Test for recipe export API"""
+import csv
+import io
+import json
+from decimal import Decimal
+from unittest.mock import patch
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework import status
+from core.models import Recipe, Tag, Ingredient
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample Title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+        'description': 'Sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def content(res):
+    return b''.join(res.streaming_content).decode('utf-8')
+
+
+class RecipeExportApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', '6465452'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_auth_required(self):
+        res = APIClient().get(EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_ndjson(self):
+        r1 = create_recipe(self.user, title='Curry')
+        r1.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+        r1.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Rice')
+        )
+        r2 = create_recipe(self.user, title='Toast')
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+        create_recipe(other, title='Hidden')
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertTrue(res['Content-Type'].startswith('application/x-ndjson')) # noqa
+        rows = [json.loads(line) for line in content(res).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [r2.id, r1.id])
+        self.assertEqual(rows[1]['price'], '5.25')
+        self.assertEqual(rows[1]['description'], 'Sample description')
+        self.assertEqual(rows[1]['tags'][0]['name'], 'Dinner')
+        self.assertEqual(rows[1]['ingredients'][0]['name'], 'Rice')
+
+    def test_export_csv_honours_filters(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1 = create_recipe(self.user, title='Salad')
+        r1.tags.add(tag, Tag.objects.create(user=self.user, name='Lunch'))
+        create_recipe(self.user, title='Steak')
+
+        res = self.client.get(EXPORT_URL, {'format': 'csv', 'tags': tag.id})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(io.StringIO(content(res))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Salad')
+        self.assertEqual(sorted(rows[0]['tags'].split('|')), ['Lunch', 'Vegan']) # noqa
+
+    @patch('recipe.views.RecipeViewSet.export_chunk_size', 5)
+    def test_export_prefetches_per_chunk(self):
+        for i in range(12):
+            recipe = create_recipe(self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}')
+            )
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(EXPORT_URL)
+            rows = content(res).splitlines()
+
+        self.assertEqual(len(rows), 12)
+        tag_queries = [q for q in ctx if 'core_tag' in q['sql']]
+        # one tag query per chunk of 5 recipes
+        self.assertEqual(len(tag_queries), 3)
+
+    @patch('recipe.views.RecipeViewSet.export_chunk_size', 5)
+    def test_export_without_server_side_cursors(self):
+        """pgbouncer mode reads the recipes in chunks of ids"""
+        recipes = [
+            create_recipe(self.user, title=f'Recipe {i}') for i in range(7)
+        ]
+
+        with patch.dict(connection.settings_dict,
+                        {'DISABLE_SERVER_SIDE_CURSORS': True}):
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(EXPORT_URL)
+                rows = [json.loads(line) for line in content(res).splitlines()] # noqa
+
+        self.assertEqual(
+            [row['id'] for row in rows], [r.id for r in reversed(recipes)]
+        )
+        recipe_queries = [
+            q for q in ctx if q['sql'].startswith('SELECT "core_recipe"."id", ') # noqa
+        ]
+        self.assertEqual(len(recipe_queries), 2)
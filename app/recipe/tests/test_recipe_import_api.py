@@ -0,0 +1,151 @@
+"""Test for bulk recipe import API"""
+import json
+from io import BytesIO
+from unittest.mock import patch
+from decimal import Decimal
+from django.test import TestCase, SimpleTestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework import status
+from core.models import Recipe, Tag, Ingredient
+from recipe import importer
+
+IMPORT_URL = reverse('recipe:recipe-bulk-import')
+
+
+def recipe_row(**params):
+    row = {
+        'title': 'Sample Title',
+        'time_minutes': 22,
+        'price': '5.25',
+    }
+    row.update(params)
+    return row
+
+
+def ndjson(rows):
+    return '\n'.join(json.dumps(row) for row in rows)
+
+
+class IterRowsTests(SimpleTestCase):
+
+    def rows(self, body):
+        return list(importer.iter_rows(BytesIO(body.encode('utf-8'))))
+
+    def test_ndjson(self):
+        res = self.rows('{"a": 1}\n\n{"a": 2}\n')
+        self.assertEqual(res, [({'a': 1}, None), ({'a': 2}, None)])
+
+    def test_ndjson_bad_line_is_reported(self):
+        res = self.rows('{"a": 1}\n{"a": \n{"a": 3}')
+        self.assertEqual(res[0], ({'a': 1}, None))
+        self.assertIsNone(res[1][0])
+        self.assertEqual(res[2], ({'a': 3}, None))
+
+    @patch('recipe.importer.MAX_ROW_SIZE', 100)
+    @patch('recipe.importer.READ_SIZE', 16)
+    def test_ndjson_oversize_line_is_skipped(self):
+        huge = '{"a": "' + 'x' * 1000 + '"}'
+
+        res = self.rows('{"a": 1}\n' + huge + '\n{"a": 3}\n' + huge)
+
+        self.assertEqual(res, [
+            ({'a': 1}, None),
+            (None, 'row too large'),
+            ({'a': 3}, None),
+            (None, 'row too large'),
+        ])
+
+    def test_array_across_read_chunks(self):
+        rows = [{'title': 'é' * 50, 'n': i} for i in range(200)]
+        body = json.dumps(rows)
+
+        with patch('recipe.importer.READ_SIZE', 7):
+            res = self.rows(body)
+
+        self.assertEqual([row for row, error in res], rows)
+
+    def test_truncated_array(self):
+        res = self.rows('[{"a": 1}, {"a": ')
+        self.assertEqual(res[0], ({'a': 1}, None))
+        self.assertIsNone(res[1][0])
+        self.assertEqual(len(res), 2)
+
+
+class RecipeImportApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', '6465452'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_auth_required(self):
+        res = APIClient().post(IMPORT_URL, '', content_type='application/x-ndjson') # noqa
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_import_ndjson(self):
+        Tag.objects.create(user=self.user, name='Dinner')
+        rows = [
+            recipe_row(
+                title=f'Recipe {i}',
+                description='imported',
+                tags=[{'name': 'Dinner'}, {'name': f'Tag {i % 2}'}],
+                ingredients=[{'name': 'Salt'}],
+            )
+            for i in range(5)
+        ]
+
+        res = self.client.post(
+            IMPORT_URL, ndjson(rows), content_type='application/x-ndjson'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 5)
+        self.assertEqual(res.data['errors'], [])
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 5)
+        recipe = recipes.get(title='Recipe 3')
+        self.assertEqual(recipe.price, Decimal('5.25'))
+        self.assertEqual(recipe.description, 'imported')
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Dinner', 'Tag 1'],
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1) # noqa
+
+    def test_import_json_array_reports_row_errors(self):
+        rows = [
+            recipe_row(),
+            recipe_row(time_minutes='soon'),
+            recipe_row(title='Other'),
+        ]
+
+        res = self.client.post(IMPORT_URL, rows, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(res.data['failed'], 1)
+        self.assertEqual(res.data['errors'][0]['row'], 1)
+        self.assertIn('time_minutes', res.data['errors'][0]['errors'])
+
+    @patch('recipe.views.RecipeViewSet.import_chunk_size', 10)
+    def test_import_queries_per_chunk(self):
+        rows = [
+            recipe_row(tags=[{'name': 'Dinner'}], ingredients=[{'name': 'Salt'}]) # noqa
+            for _ in range(40)
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(
+                IMPORT_URL, ndjson(rows), content_type='application/x-ndjson'
+            )
+
+        self.assertEqual(res.data['created'], 40)
+        # a fixed handful of statements per chunk of 10, not per row
+        self.assertLessEqual(len(ctx), 4 * 10)
@@ -0,0 +1,153 @@
+"""Test for recipe full-text search"""
+from io import StringIO
+from decimal import Decimal
+from unittest.mock import patch
+from django.db import transaction
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample Title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeSearchApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def search(self, text, **params):
+        res = self.client.get(RECIPES_URL, {'search': text, **params})
+        return [recipe['title'] for recipe in res.data['results']], res
+
+    def test_search_ranks_title_above_description(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.user, title='Toast', description='with curry')
+            create_recipe(self.user, title='Green curry')
+            create_recipe(self.user, title='Pancakes')
+
+        titles, res = self.search('curry')
+
+        self.assertEqual(titles, ['Green curry', 'Toast'])
+
+    def test_search_matches_tags_and_ingredients(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            r1 = create_recipe(self.user, title='Stew')
+            r1.tags.add(Tag.objects.create(user=self.user, name='Winter'))
+            r2 = create_recipe(self.user, title='Salad')
+            r2.ingredients.add(
+                Ingredient.objects.create(user=self.user, name='Winter greens')
+            )
+
+        titles, res = self.search('winter')
+
+        self.assertEqual(sorted(titles), ['Salad', 'Stew'])
+
+    def test_search_limited_to_user(self):
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+        create_recipe(other, title='Curry')
+
+        titles, res = self.search('curry')
+
+        self.assertEqual(titles, [])
+
+    def test_rename_and_unlink_update_vector(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(self.user, title='Stew')
+            tag = Tag.objects.create(user=self.user, name='Winter')
+            recipe.tags.add(tag)
+
+        tag.name = 'Autumn'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertEqual(self.search('winter')[0], [])
+        self.assertEqual(self.search('autumn')[0], ['Stew'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.recipe_set.clear()
+        self.assertEqual(self.search('autumn')[0], [])
+
+    def test_update_reindexed_once_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(self.user, title='Stew')
+            recipe.tags.add(Tag.objects.create(user=self.user, name='Winter'))
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+
+        with patch('recipe.signals.update_search_vectors') as update, \
+                patch('recipe.signals.bump_user_cache') as bump, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {
+                'title': 'Soup',
+                'tags': [{'name': 'Autumn'}],
+                'ingredients': [{'name': 'Leek'}],
+            }, format='json')
+
+        update.assert_called_once_with({recipe.id})
+        bump.assert_called_once_with(self.user.id)
+
+    def test_rolled_back_writes_not_reindexed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    create_recipe(self.user, title='Curry')
+                    raise ValueError
+            except ValueError:
+                pass
+            create_recipe(self.user, title='Green curry')
+
+        self.assertEqual(self.search('curry')[0], ['Green curry'])
+
+    def test_search_cursor_pagination(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                create_recipe(
+                    self.user,
+                    title='Curry ' + 'hot ' * i,
+                    description='curry ' * i,
+                )
+
+        titles, res = self.search('curry', page_size=2)
+        seen = list(titles)
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen.extend(r['title'] for r in res.data['results'])
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_imported_recipes_searchable(self):
+        self.client.post(
+            reverse('recipe:recipe-bulk-import'),
+            [{'title': 'Laksa', 'time_minutes': 30, 'price': '8.00',
+              'tags': [{'name': 'Malaysian'}]}],
+            format='json',
+        )
+
+        self.assertEqual(self.search('malaysian')[0], ['Laksa'])
+
+    def test_rebuild_search_vectors(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.user, title='Curry')
+        Recipe.objects.update(search_vector=None)
+        out = StringIO()
+
+        call_command('rebuild_search_vectors', batch_size=1, stdout=out)
+
+        self.assertIn('Rebuilt 1 search vectors', out.getvalue())
+        self.assertEqual(self.search('curry')[0], ['Curry'])
@@ -0,0 +1,195 @@
+"""Test for the recipe statistics endpoint and rollups"""
+from io import StringIO
+from decimal import Decimal
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient, RecipeStats, TagUsage
+
+STATS_URL = reverse('recipe:stats')
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample Title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def usage(items):
+    return [(item['name'], item['recipe_count']) for item in items]
+
+
+class PublicRecipeStatsApiTests(TestCase):
+
+    def test_auth_required(self):
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateRecipeStatsApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def get_stats(self, **params):
+        res = self.client.get(STATS_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_empty_stats(self):
+        data = self.get_stats()
+
+        self.assertEqual(data['recipe_count'], 0)
+        self.assertEqual(
+            data['price'], {'avg': None, 'min': None, 'max': None})
+        self.assertEqual(data['tags'], [])
+
+    def test_stats_follow_recipe_writes(self):
+        r1 = create_recipe(self.user, time_minutes=10, price=Decimal('2.00'))
+        create_recipe(self.user, time_minutes=30, price=Decimal('4.50'))
+        r3 = create_recipe(self.user, time_minutes=50, price=Decimal('9.00'))
+        other = get_user_model().objects.create_user('o@example.com', 'pw')
+        create_recipe(other, time_minutes=5, price=Decimal('1.00'))
+
+        data = self.get_stats()
+        self.assertEqual(data['recipe_count'], 3)
+        self.assertEqual(
+            data['time_minutes'], {'avg': '30.0', 'min': 10, 'max': 50})
+        self.assertEqual(
+            data['price'], {'avg': '5.17', 'min': '2.00', 'max': '9.00'})
+
+        r3.delete()
+        r1.time_minutes = 40
+        r1.price = '3.00'
+        r1.save()
+
+        data = self.get_stats()
+        self.assertEqual(data['recipe_count'], 2)
+        self.assertEqual(
+            data['time_minutes'], {'avg': '35.0', 'min': 30, 'max': 40})
+        self.assertEqual(
+            data['price'], {'avg': '3.75', 'min': '3.00', 'max': '4.50'})
+
+    def test_saves_diff_loaded_values(self):
+        create_recipe(self.user, time_minutes=10, price=Decimal('2.00'))
+        recipe = Recipe.objects.get()
+
+        with CaptureQueriesContext(connection) as queries:
+            recipe.time_minutes = 20
+            recipe.save()
+            recipe.price = Decimal('3.00')
+            recipe.save()
+        Recipe.objects.filter(pk=recipe.pk).update(time_minutes=30)
+        recipe.refresh_from_db()
+        RecipeStats.objects.update(
+            time_minutes_sum=30, time_minutes_min=30, time_minutes_max=30)
+        recipe.time_minutes = 40
+        recipe.price = Decimal('9.00')
+        recipe.save(update_fields=['time_minutes'])
+
+        self.assertFalse([
+            q for q in queries.captured_queries
+            if q['sql'].startswith('SELECT "core_recipe"."time_minutes"')
+        ])
+        data = self.get_stats()
+        self.assertEqual(
+            data['time_minutes'], {'avg': '40.0', 'min': 40, 'max': 40})
+        self.assertEqual(
+            data['price'], {'avg': '3.00', 'min': '3.00', 'max': '3.00'})
+
+    def test_deferred_values_read_before_save(self):
+        create_recipe(self.user, time_minutes=10)
+        recipe = Recipe.objects.only('id', 'user').get()
+
+        recipe.time_minutes = 20
+        recipe.save()
+
+        data = self.get_stats()
+        self.assertEqual(
+            data['time_minutes'], {'avg': '20.0', 'min': 20, 'max': 20})
+
+    def test_usage_follows_links(self):
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        r1 = create_recipe(self.user)
+        r2 = create_recipe(self.user)
+        r1.tags.add(vegan, quick)
+        r2.tags.add(vegan)
+        r1.ingredients.add(salt)
+        r2.ingredients.add(salt)
+        self.assertEqual(
+            usage(self.get_stats()['tags']), [('Vegan', 2), ('Quick', 1)])
+
+        r1.tags.remove(vegan, vegan)
+        r2.tags.remove(quick)
+        quick.recipe_set.add(r2)
+        self.assertEqual(
+            usage(self.get_stats()['tags']), [('Quick', 2), ('Vegan', 1)])
+
+        r2.tags.clear()
+        vegan.recipe_set.add(r1)
+        r1.delete()
+        data = self.get_stats()
+        self.assertEqual(usage(data['tags']), [])
+        self.assertEqual(usage(data['ingredients']), [('Salt', 1)])
+
+        salt.recipe_set.clear()
+        self.assertEqual(self.get_stats()['ingredients'], [])
+
+    def test_limit_top_ingredients(self):
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        for count, name in enumerate(['Salt', 'Egg', 'Rice'], 1):
+            ingredient = Ingredient.objects.create(user=self.user, name=name)
+            ingredient.recipe_set.add(*recipes[:count])
+
+        data = self.get_stats(limit=2)
+
+        self.assertEqual(
+            usage(data['ingredients']), [('Rice', 3), ('Egg', 2)])
+
+    def test_api_writes_update_stats(self):
+        recipes_url = reverse('recipe:recipe-list')
+        self.client.post(recipes_url, {
+            'title': 'Curry', 'time_minutes': 20, 'price': '6.00',
+            'tags': [{'name': 'Thai'}],
+        }, format='json')
+        self.client.post(reverse('recipe:recipe-bulk-import'), [
+            {'title': 'Laksa', 'time_minutes': 40, 'price': '8.00',
+             'tags': [{'name': 'Thai'}, {'name': 'Thai'}]},
+        ], format='json')
+
+        data = self.get_stats()
+
+        self.assertEqual(data['recipe_count'], 2)
+        self.assertEqual(data['price']['max'], '8.00')
+        self.assertEqual(usage(data['tags']), [('Thai', 2)])
+
+    def test_recompute_repairs_drift(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        create_recipe(self.user, time_minutes=10).tags.add(tag)
+        create_recipe(self.user, time_minutes=20)
+        expected = self.get_stats()
+        RecipeStats.objects.update(recipe_count=7, time_minutes_max=99)
+        TagUsage.objects.update(recipe_count=3)
+        out = StringIO()
+
+        call_command('recompute_recipe_stats', batch_size=1, stdout=out)
+
+        self.assertIn('Recomputed statistics of 1 users, 2 recipes',
+                      out.getvalue())
+        self.assertEqual(self.get_stats(), expected)
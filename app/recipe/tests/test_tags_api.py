@@ -2,8 +2,10 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from core.models import Tag, Recipe
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
+from recipe.pagination import RecipeAttrCursorPagination
 from recipe.serializers import TagSerializer
 from decimal import Decimal
 
@@ -45,7 +47,43 @@ class PrivateTagsApiTests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_tags_cursor_pagination(self):
+        other = create_user(email='other@example.com')
+        for name in ['A', 'B', 'C', 'D']:
+            Tag.objects.create(user=self.user, name=name)
+            Tag.objects.create(user=other, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        names = [t['name'] for t in res.data['results']]
+        res = self.client.get(res.data['next'])
+        names += [t['name'] for t in res.data['results']]
+
+        self.assertEqual(names, ['D', 'C', 'B', 'A'])
+        self.assertIsNone(res.data['next'])
+
+    def test_cursor_pagination_breaks_name_ties_by_id(self):
+        other = create_user(email='other@example.com')
+        tags = [
+            Tag.objects.create(user=user, name=name)
+            for user, name in [(self.user, 'A'), (self.user, 'B'),
+                               (other, 'B'), (self.user, 'C')]
+        ]
+        paginator = RecipeAttrCursorPagination()
+        request = Request(APIRequestFactory().get(TAGS_URL, {'page_size': 2}))
+
+        pages = []
+        while request is not None:
+            pages.append([
+                tag.id for tag in
+                paginator.paginate_queryset(Tag.objects.all(), request)
+            ])
+            next_url = paginator.get_next_link()
+            request = next_url and Request(APIRequestFactory().get(next_url))
+
+        expected = [tag.id for tag in reversed(tags)]
+        self.assertEqual(pages, [expected[:2], expected[2:]])
 
     def test_tags_limited_to_user(self):
         user2 = create_user(email='test2@example.com')
@@ -55,9 +93,9 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
 
     def test_update_tag(self):
         tag = Tag.objects.create(user=self.user, name='After Dinner')
@@ -69,6 +107,16 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_update_tag_duplicate_name(self):
+        Tag.objects.create(user=self.user, name='Lunch')
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Lunch'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Dinner')
+
     def test_delete_tag(self):
         tag = Tag.objects.create(user=self.user, name='After breakfast')
         url = detail_url(tag.id)
@@ -94,8 +142,8 @@ class PrivateTagsApiTests(TestCase):
         s1 = TagSerializer(tag1)
         s2 = TagSerializer(tag2)
 
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_tags_unique(self):
         tag = Tag.objects.create(user=self.user, name='Eggs')
@@ -119,4 +167,15 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_autocomplete_tags(self):
+        for name in ['Breakfast', 'Brunch', 'Dinner']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'q': 'br'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [t['name'] for t in res.data], ['Breakfast', 'Brunch']
+        )
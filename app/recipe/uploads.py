@@ -0,0 +1,136 @@
+"""
+Memory-bounded recipe image uploads
+
+ImageUploadHandler streams the upload straight to a temporary file and
+identifies the image from its first bytes. Pillow only parses the header
+there, so format and dimensions are known before the pixels arrive, and
+an image that is too large, of another format or not an image stops the
+upload at once. Bodies over IMAGE_UPLOAD_MAX_BYTES are refused before
+anything is read. The bytes are hashed as they arrive, so the content
+addressed storage of Recipe.image does not read the file again, and the
+file is named after its detected format.
+
+check_image is the decompression-bomb guard. Opening an image only reads
+its header, check_image then refuses images whose decoded size would
+exceed IMAGE_UPLOAD_MAX_PIXELS, before anything decodes them. It runs
+on upload and again wherever a stored image is decoded.
+"""
+import hashlib
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    SkipFile,
+    TemporaryFileUploadHandler,
+)
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from django.utils.translation import gettext as _
+from PIL import Image
+
+# JPEG headers may follow up to 64KB of EXIF per APP segment
+HEADER_MAX_BYTES = 256 * 1024
+
+
+class ImageRejected(ValueError):
+    """image refused before decoding"""
+
+
+def check_image(image):
+    """raise ImageRejected unless the opened image may be decoded"""
+    if image.format not in settings.IMAGE_UPLOAD_FORMATS:
+        raise ImageRejected(
+            _('Unsupported image format %s, upload one of %s') % (
+                image.format, ', '.join(settings.IMAGE_UPLOAD_FORMATS))
+        )
+    width, height = image.size
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ImageRejected(
+            _('Image of %(width)sx%(height)s pixels is too large, the '
+              'limit is %(limit)s pixels') % {
+                'width': width, 'height': height,
+                'limit': settings.IMAGE_UPLOAD_MAX_PIXELS,
+            }
+        )
+
+
+def identify(head, complete=False):
+    """
+    (format, size) of the image starting with head, None while head is
+    too short to tell. Raise ImageRejected for anything else
+    """
+    try:
+        with Image.open(BytesIO(head)) as image:
+            check_image(image)
+            return image.format, image.size
+    except Image.DecompressionBombError as error:
+        raise ImageRejected(str(error))
+    except ImageRejected:
+        raise
+    except Exception:
+        # truncated headers fail in many ways, retry with more bytes
+        if len(head) < HEADER_MAX_BYTES and not complete:
+            return None
+        raise ImageRejected(_('Upload a valid image'))
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    stream uploads to a temporary file, checking the image header first.
+    A refused upload is not stored and its reason is left in error
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.error = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.error = _('Upload is larger than %s bytes') % (
+                settings.IMAGE_UPLOAD_MAX_BYTES)
+            # skip the parser, the body is never read
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.head = b''
+        self.identified = None
+        self.hasher = hashlib.sha256()
+
+    def _reject(self, error):
+        self.error = str(error)
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_BYTES:
+            # chunked bodies have no content length to check upfront
+            self._reject(_('Upload is larger than %s bytes') % (
+                settings.IMAGE_UPLOAD_MAX_BYTES))
+        if self.identified is None:
+            self.head += raw_data
+            try:
+                self.identified = identify(self.head)
+            except ImageRejected as error:
+                self._reject(error)
+            if self.identified is not None:
+                self.head = b''
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.identified is None:
+            try:
+                self.identified = identify(self.head, complete=True)
+            except ImageRejected as error:
+                self.error = str(error)
+                self.file.close()
+                return None
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.hasher.hexdigest()
+        # equal bytes get equal names whatever the client called them
+        image_format = self.identified[0]
+        upload.name = (os.path.splitext(upload.name)[0] + '.' +
+                       image_format.lower())
+        return upload
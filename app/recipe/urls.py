@@ -10,5 +10,8 @@ router.register('ingredients', views.IngredientViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
+    path('stats/', views.RecipeStatsView.as_view(), name='stats'),
+    path('images/<path:name>', views.image_derivative,
+         name='image-derivative'),
     path('', include(router.urls)),
 ]
@@ -1,10 +1,43 @@
-from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework import viewsets, mixins, status, views
 from rest_framework.permissions import IsAuthenticated
 from core.models import Recipe, Tag, Ingredient
+from user.authentication import CachedTokenAuthentication
 from recipe import serializers
+from recipe.filters import linked_to, assigned_to_recipe
+from recipe.cache import CachedListMixin, bump_user_cache
+from recipe.images import schedule_processing
+from recipe.uploads import ImageUploadHandler, ImageRejected
+from recipe.importer import iter_rows, import_recipes
+from recipe.exporter import iter_export_rows
+from recipe.renderers import NDJSONRenderer, CSVRenderer, FastJSONRenderer
+from recipe.fastpath import FastReadMixin
+from recipe.pagination import (
+    RecipeCursorPagination,
+    RecipeAttrCursorPagination,
+    RecipeSearchCursorPagination,
+)
+from recipe.search import search
+from core.metrics import IMAGE_UPLOAD_BYTES, cache_lookup
+from recipe.autocomplete import autocomplete, AUTOCOMPLETE_MAX_LIMIT
+from recipe.stats import user_stats, STATS_MAX_LIMIT
+from recipe import bulk, derivatives
+from recipe.sparse import selected_fields
+from django.conf import settings
 from rest_framework.decorators import action
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils.translation import gettext as _
+from django.http import (
+    FileResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_safe
 from drf_spectacular.utils import ( # noqa
     extend_schema,
     extend_schema_view,
@@ -13,29 +46,75 @@ from drf_spectacular.utils import ( # noqa
 )
 
 
-@extend_schema_view(
-    list=extend_schema(
-        parameters=[
-            OpenApiParameter(
-                'tags',
-                OpenApiTypes.STR,
-                description='Comma Seperated List of tags IDs to filter'
+RECIPE_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,
+        description='Comma Seperated List of tags IDs to filter'
 
-            ),
-            OpenApiParameter(
-                'ingredients',
-                OpenApiTypes.STR,
-                description='Comma Seperated List of ingredients IDs to filter'
+    ),
+    OpenApiParameter(
+        'ingredients',
+        OpenApiTypes.STR,
+        description='Comma Seperated List of ingredients IDs to filter'
 
-            ),
-        ]
-    )
+    ),
+    OpenApiParameter(
+        'tags_match',
+        OpenApiTypes.STR, enum=['any', 'all'],
+        description='Match recipes with any (default) or all of the tags'
+    ),
+    OpenApiParameter(
+        'search',
+        OpenApiTypes.STR,
+        description='Full-text search in title, description, tag and '
+                    'ingredient names, results are ordered by rank'
+    ),
+    OpenApiParameter(
+        'ingredients_match',
+        OpenApiTypes.STR, enum=['any', 'all'],
+        description='Match recipes with any (default) or all of the '
+                    'ingredients'
+    ),
+]
+
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated fields to return, e.g. id,title'
+    ),
+    OpenApiParameter(
+        'expand',
+        OpenApiTypes.STR,
+        description='Comma separated relations (tags, ingredients) to '
+                    'return, all of them by default'
+    ),
+]
+
+
+@extend_schema_view(
+    list=extend_schema(
+        parameters=RECIPE_FILTER_PARAMETERS + SPARSE_FIELDS_PARAMETERS),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+    export=extend_schema(
+        parameters=RECIPE_FILTER_PARAMETERS,
+        responses=OpenApiTypes.STR,
+        description='Stream every matching recipe as NDJSON or CSV',
+    ),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedListMixin, FastReadMixin, viewsets.ModelViewSet):
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    import_chunk_size = 500
+    export_chunk_size = 500
+    # actions whose serializer renders nested tags/ingredients
+    nested_actions = ['list', 'retrieve', 'update', 'partial_update']
 
     def _params_to_ints(self, qs):
         "1,2,3"
@@ -44,6 +123,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
     # def get_queryset(self):
     #     return self.queryset.filter(user=self.request.user).order_by('-id')
 
+    def list_cache_enabled(self):
+        # filtered lists have too many variants to be worth caching
+        params = self.request.query_params
+        return not (
+            params.get('tags')
+            or params.get('ingredients')
+            or params.get('search')
+        )
+
+    @property
+    def paginator(self):
+        if (self.request.query_params.get('search')
+                and not hasattr(self, '_paginator')):
+            self._paginator = RecipeSearchCursorPagination()
+        return super().paginator
+
+    def _match_all(self, field):
+        return self.request.query_params.get(f'{field}_match') == 'all'
+
     def get_queryset(self):
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
@@ -51,12 +149,57 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = queryset.filter(
+                linked_to('tags', tag_ids, self._match_all('tags'))
+            )
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = queryset.filter(
+                linked_to(
+                    'ingredients',
+                    ingredient_ids,
+                    self._match_all('ingredients'),
+                )
+            )
+
+        queryset = queryset.filter(user=self.request.user).order_by('-id')
+        text = self.request.query_params.get('search')
+        if text:
+            queryset = search(queryset, text).order_by('-rank', '-id')
+        # the fast path loads tags and ingredients itself
+        if (self.action in self.nested_actions
+                and self.action not in self.fast_read_actions):
+            queryset = self._prefetch_nested(queryset)
+        return queryset
+
+    def selected_fields(self):
+        if self.action not in ('list', 'retrieve'):
+            return None
+        if not hasattr(self, '_selected_fields'):
+            self._selected_fields = selected_fields(
+                self.request, self.get_serializer_class().Meta.fields)
+        return self._selected_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.selected_fields()
+        return context
+
+    def _nested_lookups(self):
+        return [
+            Prefetch(
+                'tags',
+                queryset=Tag.objects.only('id', 'name').order_by('id'),
+            ),
+            Prefetch(
+                'ingredients',
+                queryset=Ingredient.objects.only('id', 'name').order_by('id'),
+            ),
+        ]
 
-        return queryset.filter(user=self.request.user).order_by('-id').distinct() # noqa
+    def _prefetch_nested(self, queryset):
+        """load tags and ingredients for the whole page in one query each"""
+        return queryset.prefetch_related(*self._nested_lookups())
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -66,17 +209,80 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.serializer_class
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # recipe.signals reindex and invalidate once, when this commits
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
 
     @action(methods=['POST'], detail=True, url_path='upload_image')
     def upload_image(self, request, pk=None):
         recipe = self.get_object()
+        # installed before the body is parsed, see recipe.uploads
+        handler = ImageUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+        upload = request.FILES.get('image')
+        if handler.error:
+            return Response(
+                {'image': [handler.error]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if upload is not None:
+            IMAGE_UPLOAD_BYTES.observe(upload.size)
+        previous_renditions = recipe.image_renditions
         serializer = serializers.RecipeImageSerializer(recipe, data=request.data) # noqa
         if serializer.is_valid():
-            serializer.save()
+            # renditions are produced in the background, see recipe.images
+            recipe = serializer.save(
+                image_status=Recipe.ImageStatus.PENDING,
+                image_renditions={},
+            )
+            schedule_processing(recipe, previous_renditions)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        request=serializers.RecipeDetailSerializer(many=True),
+        responses=OpenApiTypes.OBJECT,
+        description='Create recipes from an NDJSON or JSON array body',
+    )
+    @action(methods=['POST'], detail=False, url_path='import')
+    def bulk_import(self, request):
+        # read the raw stream so the body is never parsed as a whole
+        summary = import_recipes(
+            iter_rows(request.stream),
+            self.get_serializer_context(),
+            chunk_size=self.import_chunk_size,
+        )
+        # bulk inserts bypass the model signals
+        bump_user_cache(request.user.id)
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='export',
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+    )
+    def export(self, request):
+        renderer = request.accepted_renderer
+        rows = iter_export_rows(
+            self.get_queryset(),
+            self._nested_lookups(),
+            serializers.RecipeDetailSerializer,
+            chunk_size=self.export_chunk_size,
+        )
+        response = StreamingHttpResponse(
+            renderer.iter_render(rows),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{renderer.format}"'
+        )
+        return response
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -85,16 +291,32 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned to recipes'
-            )
+            ),
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description='Autocomplete names by prefix or similarity, '
+                            'returns a ranked unpaginated list'
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Maximum number of autocomplete results '
+                            f'(default {settings.AUTOCOMPLETE_LIMIT}, '
+                            f'max {AUTOCOMPLETE_MAX_LIMIT})'
+            ),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.ListModelMixin,
+class BaseRecipeAttrViewSet(CachedListMixin,
+                            mixins.ListModelMixin,
                             viewsets.GenericViewSet,
                             mixins.UpdateModelMixin,
                             mixins.DestroyModelMixin):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def get_queryset(self):
         assigned_only = bool(
@@ -103,17 +325,172 @@ class BaseRecipeAttrViewSet(mixins.ListModelMixin,
 
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(
-            user=self.request.user).order_by('-name').distinct()
+            queryset = queryset.filter(
+                assigned_to_recipe(self.recipe_field)
+            )
+        queryset = queryset.filter(user=self.request.user)
+        text = self._autocomplete_text()
+        if text:
+            return autocomplete(queryset, text, self._autocomplete_limit())
+        return queryset.order_by('-name')
+
+    def _autocomplete_text(self):
+        if self.action != 'list':
+            return ''
+        return self.request.query_params.get('q', '').strip()
+
+    def _autocomplete_limit(self):
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            return settings.AUTOCOMPLETE_LIMIT
+        return min(max(limit, 1), AUTOCOMPLETE_MAX_LIMIT)
+
+    def paginate_queryset(self, queryset):
+        if self._autocomplete_text():
+            # already ranked and limited
+            return None
+        return super().paginate_queryset(queryset)
+
+    def list_cache_timeout(self):
+        if self._autocomplete_text():
+            return settings.AUTOCOMPLETE_CACHE_TIMEOUT
+        return super().list_cache_timeout()
+
+    def get_serializer_class(self):
+        if self.action == 'bulk_rename':
+            return serializers.BulkRenameSerializer
+        elif self.action == 'bulk_delete':
+            return serializers.BulkDeleteSerializer
+        elif self.action == 'merge':
+            return serializers.MergeSerializer
+        return self.serializer_class
+
+    def _validated(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    @extend_schema(
+        responses=OpenApiTypes.OBJECT,
+        description='Rename many items in one statement',
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk_rename')
+    def bulk_rename(self, request):
+        data = self._validated(request)
+        try:
+            summary = bulk.bulk_rename(
+                self.queryset.model, request.user, data['items']
+            )
+        except IntegrityError:
+            # a concurrent write took one of the names after validation
+            return Response(
+                {'items': [_('name already exists')]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        responses=OpenApiTypes.OBJECT,
+        description='Delete many items, unknown ids are skipped',
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk_delete')
+    def bulk_delete(self, request):
+        data = self._validated(request)
+        summary = bulk.bulk_delete(
+            self.queryset.model, request.user, data['ids']
+        )
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        responses=OpenApiTypes.OBJECT,
+        description='Move the recipes of the sources to the target and '
+                    'delete the sources',
+    )
+    @action(methods=['POST'], detail=False, url_path='merge')
+    def merge(self, request):
+        data = self._validated(request)
+        summary = bulk.merge(
+            self.queryset.model, request.user,
+            data['target'], data['sources'],
+        )
+        return Response(summary, status=status.HTTP_200_OK)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
 
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+    recipe_field = 'ingredients'
+
+
+class RecipeStatsView(views.APIView):
+    """aggregates of the user's recipes, read from the rollup tables"""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def _limit(self):
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            return settings.STATS_LIMIT
+        return min(max(limit, 1), STATS_MAX_LIMIT)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of most used tags and ingredients '
+                            f'(default {settings.STATS_LIMIT}, '
+                            f'max {STATS_MAX_LIMIT})'
+            ),
+        ],
+        responses=serializers.RecipeStatsSerializer,
+    )
+    def get(self, request):
+        data = user_stats(request.user, self._limit())
+        return Response(serializers.RecipeStatsSerializer(data).data)
+
+
+@require_safe
+def image_derivative(request, name):
+    """
+    public resized copy of an uploaded recipe image, see recipe.derivatives,
+    plain Django view as DRF reserves the format parameter
+    """
+    try:
+        width, height, image_format = derivatives.parse(
+            request.GET.get('w'), request.GET.get('h'),
+            request.GET.get('format'),
+        )
+    except derivatives.DerivativeError as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+
+    etag = quote_etag(
+        derivatives.derivative_key(name, width, height, image_format))
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            _, content, hit = derivatives.get_derivative(
+                name, width, height, image_format)
+        except (FileNotFoundError, ImageRejected):
+            # originals stored before the upload limits may be refused
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        cache_lookup('image_derivative', hit)
+        response = FileResponse(
+            content, content_type=derivatives.CONTENT_TYPES[image_format])
+    response['ETag'] = etag
+    patch_cache_control(
+        response, public=True, immutable=True,
+        max_age=settings.IMAGE_DERIVATIVE_MAX_AGE,
+    )
+    return response
@@ -0,0 +1,167 @@
+"""
+Token authentication backed by an in-process LRU and a shared cache, so
+authenticated requests skip the Token/User query. The shared cache is
+optional with a single worker process only, see user.checks
+"""
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from core.metrics import cache_lookup
+
+
+class TokenCache:
+    """
+    bounded LRU of key -> token (with its user) per worker process, in
+    front of a cache shared by all workers. Invalidation replaces the
+    key's generation in the shared cache. Local and shared entries carry
+    the generation they were loaded at and are ignored once it changed,
+    so a local hit costs one shared cache get and no query.
+
+    A token loaded while it is invalidated must not be cached, so loads
+    take generation() first and set() drops the token when the key was
+    invalidated since. Users are cached without their password hash, it
+    is loaded from the database when used
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._invalidations = 0
+
+    @property
+    def _shared(self):
+        alias = settings.TOKEN_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def _shared_key(self, key):
+        # never put raw tokens into an external cache
+        return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def _generation_key(self, key):
+        return 'auth:token-generation:' + hashlib.sha256(
+            key.encode()).hexdigest()
+
+    def _shared_generation(self, key):
+        generation_key = self._generation_key(key)
+        generation = self._shared.get(generation_key)
+        if generation is None:
+            # an evicted generation is replaced, orphaning its entries
+            self._shared.add(generation_key, uuid.uuid4().hex, None)
+            generation = self._shared.get(generation_key)
+        return generation
+
+    def generation(self, key):
+        """taken before loading the token from the database, see set()"""
+        shared = None
+        if self._shared is not None:
+            shared = self._shared_generation(key)
+        return self._invalidations, shared
+
+    def _get_local(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            token, expires, generation = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # another worker may have invalidated it
+        if (self._shared is not None and
+                self._shared.get(self._generation_key(key)) != generation):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        return token
+
+    def get(self, key):
+        token = self._get_local(key)
+        cache_lookup('token_local', token is not None)
+        if token is not None:
+            return token
+
+        if self._shared is None:
+            return None
+        entry_key = self._shared_key(key)
+        generation_key = self._generation_key(key)
+        found = self._shared.get_many([entry_key, generation_key])
+        generation, token = found.get(entry_key, (None, None))
+        if generation is None or generation != found.get(generation_key):
+            token = None
+        cache_lookup('token_shared', token is not None)
+        if token is not None:
+            self._set_local(key, token, generation)
+        return token
+
+    def set(self, key, token, generation):
+        """cache token unless key was invalidated since generation()"""
+        invalidations, shared = generation
+        # the hash is only needed to change or check the password
+        token.user.__dict__.pop('password', None)
+        with self._lock:
+            if invalidations != self._invalidations:
+                return
+        self._set_local(key, token, shared)
+        if self._shared is not None:
+            self._shared.set(
+                self._shared_key(key), (shared, token),
+                settings.TOKEN_CACHE_TTL,
+            )
+
+    def _set_local(self, key, token, generation):
+        expires = time.monotonic() + settings.TOKEN_CACHE_LOCAL_TTL
+        with self._lock:
+            self._entries[key] = (token, expires, generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._invalidations += 1
+        if self._shared is not None:
+            self._shared.set(
+                self._generation_key(key), uuid.uuid4().hex, None)
+            self._shared.delete(self._shared_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def _detached(instance):
+    """copy of a cached model instance that does not share its caches"""
+    clone = copy.copy(instance)
+    clone._state = copy.copy(instance._state)
+    clone._state.fields_cache = {}
+    return clone
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """drop-in replacement for TokenAuthentication"""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            generation = token_cache.generation(key)
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token, generation)
+        # views may mutate request.user and request.auth, never hand out
+        # the cached instances
+        user = _detached(token.user)
+        token = _detached(token)
+        token.user = user
+        return user, token
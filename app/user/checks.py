@@ -0,0 +1,28 @@
+"""
+System checks of the authentication settings
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+
+# caches each worker process keeps to itself
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register()
+def check_token_cache(app_configs, **kwargs):
+    """several workers must share the cache invalidating their tokens"""
+    if settings.APP_WORKERS <= 1:
+        return []
+    alias = settings.TOKEN_CACHE_ALIAS
+    if alias and settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHES: # noqa
+        return []
+    return [Error(
+        'TOKEN_CACHE_ALIAS must name a cache shared by all worker '
+        'processes when APP_WORKERS is more than 1',
+        hint='set CACHE_BACKEND to a shared backend and '
+             'TOKEN_CACHE_ALIAS=default',
+        id='user.E001',
+    )]
@@ -0,0 +1,21 @@
+"""
+Drop cached tokens as soon as they or their user change
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from user.authentication import token_cache
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    # deactivation, profile and password changes must not be served stale
+    if not created:
+        for key in Token.objects.filter(user=instance).values_list('key', flat=True): # noqa
+            token_cache.invalidate(key)
@@ -0,0 +1,203 @@
+"""Test for cached token authentication"""
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+from user.authentication import (
+    CachedTokenAuthentication,
+    TokenCache,
+    token_cache,
+)
+from user.checks import check_token_cache
+
+ME_URL = reverse('user:me')
+
+
+def create_user(email='test@example.com', password='testpass123'):
+    return get_user_model().objects.create_user(
+        email=email, password=password, name='Test Name'
+    )
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        cache.clear()
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}') # noqa
+
+    def test_cached_token_skips_db(self):
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_rejected(self):
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_account_token_rejected(self):
+        self.client.get(ME_URL)
+
+        res = self.client.delete(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_update_not_served_stale(self):
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'New Name'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New Name')
+
+    @override_settings(TOKEN_CACHE_SIZE=1)
+    def test_local_cache_bounded(self):
+        other = Token.objects.create(user=create_user('o@example.com'))
+        self.client.get(ME_URL)
+        APIClient(HTTP_AUTHORIZATION=f'Token {other.key}').get(ME_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_shared_cache_used_by_other_workers(self):
+        self.client.get(ME_URL)
+        # a fresh worker process starts with an empty local LRU
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_shared_cache_invalidated(self):
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        token_cache.clear()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_password_hash_not_cached(self):
+        self.client.get(ME_URL)
+
+        _, token = cache.get(token_cache._shared_key(self.token.key))
+
+        self.assertNotIn('password', token.user.__dict__)
+        self.assertTrue(token.user.check_password('testpass123'))
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_token_loaded_before_invalidation_not_cached(self):
+        generation = token_cache.generation(self.token.key)
+        token = Token.objects.select_related('user').get(key=self.token.key)
+        token_cache.invalidate(self.token.key)
+
+        token_cache.set(self.token.key, token, generation)
+
+        self.assertIsNone(token_cache.get(self.token.key))
+        token_cache.clear()
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_cached_instances_not_handed_out(self):
+        authentication = CachedTokenAuthentication()
+        user, token = authentication.authenticate_credentials(self.token.key)
+        user.name = 'Changed'
+        token.user.is_active = False
+
+        user, token = authentication.authenticate_credentials(self.token.key)
+
+        self.assertIs(token.user, user)
+        self.assertEqual(user.name, 'Test Name')
+        self.assertTrue(user.is_active)
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_invalidation_reaches_other_workers(self):
+        # each worker process has its own TokenCache in front of the
+        # shared cache
+        other_worker = TokenCache()
+        generation = other_worker.generation(self.token.key)
+        other_worker.set(self.token.key, Token.objects.select_related(
+            'user').get(key=self.token.key), generation)
+        self.client.get(ME_URL)
+        key = self.token.key
+
+        self.token.delete()
+
+        self.assertIsNone(other_worker.get(key))
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_deactivation_reaches_other_workers(self):
+        other_worker = TokenCache()
+        generation = other_worker.generation(self.token.key)
+        other_worker.set(self.token.key, Token.objects.select_related(
+            'user').get(key=self.token.key), generation)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(other_worker.get(self.token.key))
+
+
+class TokenCacheCheckTests(TestCase):
+
+    @override_settings(APP_WORKERS=4, TOKEN_CACHE_ALIAS=None)
+    def test_several_workers_need_shared_cache(self):
+        errors = check_token_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['user.E001'])
+
+    @override_settings(APP_WORKERS=4, TOKEN_CACHE_ALIAS='default', CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    })
+    def test_process_local_cache_not_shared(self):
+        self.assertEqual(len(check_token_cache(None)), 1)
+
+    @override_settings(APP_WORKERS=4, TOKEN_CACHE_ALIAS='default', CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', # noqa
+            'LOCATION': '/tmp/token-cache-check',
+        },
+    })
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_token_cache(None), [])
+
+    @override_settings(APP_WORKERS=1, TOKEN_CACHE_ALIAS=None)
+    def test_single_worker_needs_no_shared_cache(self):
+        self.assertEqual(check_token_cache(None), [])
@@ -1,8 +1,9 @@
-from rest_framework import generics, authentication, permissions, status
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 from rest_framework.mixins import DestroyModelMixin
 from rest_framework.response import Response
+from user.authentication import CachedTokenAuthentication
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -16,7 +17,7 @@ class CreateTokenView(ObtainAuthToken):  # creating token
 
 class AddNewManyTest(generics.CreateAPIView):
     serializer_class = MoreTestsSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
 
@@ -27,7 +28,7 @@ class CreateUserView(generics.CreateAPIView):
 
 class ManageUserView(generics.RetrieveUpdateDestroyAPIView, DestroyModelMixin):
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
 # called when GET (retrieve), PUT/PATCH (update), or DELETE (destroy) NOT POST
@@ -2,5 +2,11 @@
 
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/default.conf
+# APP_PROTOCOL=http proxies to the ASGI server of scripts/run.sh
+if [ "$APP_PROTOCOL" = "http" ]; then
+    envsubst '${LISTEN_PORT} ${APP_HOST} ${APP_PORT}' \
+        < /etc/nginx/default-http.conf.tpl > /etc/nginx/conf.d/default.conf
+else
+    envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
+fi
 nginx -g 'daemon off;'
\ No newline at end of file
@@ -2,8 +2,38 @@
 
 set -e
 
-python manage.py wait_for_db
+# worker processes of the app server, checked against the shared caches
+# by the system checks migrate runs
+export APP_WORKERS=${APP_WORKERS:-4}
+
+# every worker process, and under asgi every pool thread, keeps its own
+# persistent database connection, wait until the server has room for them
+if [ "$APP_SERVER" = "asgi" ]; then
+    DB_POOL_CONNECTIONS=${DB_POOL_CONNECTIONS:-$((APP_WORKERS * ${ASYNC_BLOCKING_WORKERS:-8}))}
+fi
+python manage.py wait_for_db --connections "${DB_POOL_CONNECTIONS:-$APP_WORKERS}"
 python manage.py collectstatic --noinput
 python manage.py migrate
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
+
+# metric files of previous runs would be aggregated with the new workers
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# APP_SERVER=asgi serves the app.asgi application over HTTP, the proxy
+# must then be started with APP_PROTOCOL=http
+if [ "$APP_SERVER" = "asgi" ]; then
+    uvicorn app.asgi:application --host 0.0.0.0 --port 9000 --workers "$APP_WORKERS" \
+        --proxy-headers --no-access-log
+else
+    # workers are recycled after UWSGI_MAX_REQUESTS requests, which also
+    # closes their persistent connections, and killed after UWSGI_HARAKIRI
+    # seconds on one request. The master only forks, lazy-apps keeps it
+    # from holding connections the workers would share
+    uwsgi --socket :9000 --workers "$APP_WORKERS" --master --enable-threads --module app.wsgi \
+        --lazy-apps --die-on-term --vacuum --single-interpreter \
+        --max-requests "${UWSGI_MAX_REQUESTS:-5000}" \
+        --harakiri "${UWSGI_HARAKIRI:-60}"
+fi
 